@@ -1,20 +1,54 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session, Response, stream_with_context, jsonify, send_file, abort
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, date, timedelta
+from sqlalchemy import func, or_
+from sqlalchemy.orm import joinedload
+from datetime import datetime, date
+from db_config import database_url, engine_options
 from models import db, Company, Plan, Contract, User, Employee, WorkingTimeRecord, PayrollCalculation, LeaveCredit
+from counters import counter_cache, company_records_count, global_counts
+from leave import get_balance
+from entitlements import get_entitlement, check_capacity, CapacityExceeded
+from tenancy import current_entitlement, set_tenant
+from contracts import expiring_soon as contracts_expiring_soon, period_end, roll_company
+from user_cache import load_session_user
+from fragments import render_page, employee_scope
+from passwords import (PasswordHashBusy, hash_password, verify_password, needs_rehash,
+                       login_retry_after, record_login_attempt, record_login_result)
+import profiling
+import click
+import hashlib
 import os
 
 app = Flask(__name__)
 
 # 設定
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///employees.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# リバースプロキシ（Render など）の背後では X-Forwarded-For からクライアントのIPアドレスを取る
+# （ログイン試行のIPアドレスごとの制限に使う。PROXY_COUNT は信頼するプロキシの段数）
+if int(os.environ.get('PROXY_COUNT', 0)):
+    from werkzeug.middleware.proxy_fix import ProxyFix
+
+    proxy_count = int(os.environ['PROXY_COUNT'])
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_count, x_proto=proxy_count)
+
+# コンパイル済みテンプレートをファイルに保存し、ワーカーの起動ごとにコンパイルし直さない
+template_cache_dir = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(app.instance_path, 'template_cache'))
+if template_cache_dir:
+    from jinja2 import FileSystemBytecodeCache
+
+    os.makedirs(template_cache_dir, exist_ok=True)
+    app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(template_cache_dir)}
+
 # データベース初期化
 db.init_app(app)
 
+# リクエスト単位の計測（PROFILING=1 のときのみ）
+profiling.init_app(app)
+
 # ログイン管理
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -23,7 +57,7 @@ login_manager.login_message = 'ログインが必要です。'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_session_user(int(user_id))
 
 # =============================================================================
 # ログイン・ログアウト
@@ -44,33 +78,51 @@ def login():
         return redirect(url_for('index'))
 
     if request.method == 'POST':
-        email = request.form.get('email')
+        email = (request.form.get('email') or '').strip()
         password = request.form.get('password')
+        ip = request.remote_addr or ''
+
+        # 試行回数の上限を超えていれば、ユーザー検索・ハッシュ計算の前に拒否する
+        retry_after = login_retry_after(email.lower(), ip)
+        if retry_after:
+            flash(f'ログインの試行回数が上限に達しました。{retry_after}秒後に再度お試しください。', 'error')
+            return render_template('login.html'), 429, {'Retry-After': str(retry_after)}
+
+        record_login_attempt(ip)
 
         user = User.query.filter_by(email=email).first()
 
-        if user and check_password_hash(user.password, password):
+        try:
+            verified = verify_password(user.password if user else None, password)
+        except PasswordHashBusy:
+            flash('ログインが混み合っています。しばらくしてから再度お試しください。', 'error')
+            return render_template('login.html'), 503, {'Retry-After': '5'}
+        record_login_result(email.lower(), verified)
+
+        if verified:
             if not user.is_active:
                 flash('アカウントが無効化されています。', 'error')
                 return redirect(url_for('login'))
 
             # 企業管理者の場合、契約チェック
             if user.role == 'company_admin':
-                contract = Contract.query.filter_by(
-                    company_id=user.company_id,
-                    is_active=True
-                ).first()
-
-                if not contract:
-                    flash('契約情報が見つかりません。管理者にお問い合わせください。', 'error')
-                    return redirect(url_for('login'))
-
-                if contract.end_date < date.today():
-                    flash('契約期限が切れています。管理者にお問い合わせください。', 'error')
+                # 期限切れのまま有効な契約は、その場で更新または失効させてから判定する
+                # （処理後に残る有効契約は期限内のものだけなので、有効契約の有無だけを見ればよい）
+                contract = get_entitlement(user.company_id)
+                if contract.contract_id and contract.end_date < date.today():
+                    contract = roll_company(user.company_id)
+                if not contract.contract_id:
+                    flash('有効な契約がありません（契約期限切れを含む）。管理者にお問い合わせください。', 'error')
                     return redirect(url_for('login'))
 
             login_user(user)
             user.last_login = datetime.utcnow()
+            # ハッシュ方式・パラメータが変わっていれば作り直す（混雑時は次回のログインに回す）
+            if needs_rehash(user.password):
+                try:
+                    user.password = hash_password(password)
+                except PasswordHashBusy:
+                    pass
             db.session.commit()
 
             next_page = request.args.get('next')
@@ -94,6 +146,8 @@ def logout():
 # SaaS管理者機能
 # =============================================================================
 
+COMPANIES_PER_PAGE = 50
+
 def saas_admin_required(f):
     """SaaS管理者権限チェックデコレータ"""
     from functools import wraps
@@ -109,36 +163,64 @@ def saas_admin_required(f):
 @login_required
 @saas_admin_required
 def saas_admin_dashboard():
-    # 統計情報
-    total_companies = Company.query.filter_by(is_active=True).count()
-    active_contracts = Contract.query.filter_by(is_active=True).filter(
-        Contract.end_date >= date.today()
-    ).count()
-    total_employees = Employee.query.filter_by(status='在籍中').count()
+    # 統計情報（キャッシュ）
+    counts = global_counts()
 
     # 最近の企業
     recent_companies = Company.query.order_by(Company.created_at.desc()).limit(5).all()
 
-    # 契約期限が近い企業（30日以内）
-    expiring_soon = Contract.query.filter(
-        Contract.is_active == True,
-        Contract.end_date >= date.today(),
-        Contract.end_date <= date.today() + timedelta(days=30)
-    ).all()
+    # 契約期限が近い企業（作成済みの一覧。古ければ期限処理から行って作り直す）
+    expiring_soon = contracts_expiring_soon()
 
     return render_template('saas_admin_dashboard.html',
-                         total_companies=total_companies,
-                         active_contracts=active_contracts,
-                         total_employees=total_employees,
+                         total_companies=counts['total_companies'],
+                         active_contracts=counts['active_contracts'],
+                         total_employees=counts['total_employees'],
                          recent_companies=recent_companies,
-                         expiring_soon=expiring_soon)
+                         expiring_soon=expiring_soon,
+                         cache_stats=counter_cache.stats())
 
 @app.route('/saas/companies')
 @login_required
 @saas_admin_required
 def saas_companies():
-    companies = Company.query.order_by(Company.created_at.desc()).all()
-    return render_template('saas_companies.html', companies=companies)
+    search = request.args.get('q', '').strip()
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
+
+    def build_context():
+        # 有効契約は JOIN で、プランは selectin で一括取得する
+        query = Company.query.options(
+            joinedload(Company.active_contract).selectinload(Contract.plan)
+        )
+        if search:
+            query = query.filter(or_(
+                Company.company_code.like(f'{search}%'),
+                Company.company_name.ilike(f'%{search}%')
+            ))
+
+        # キーセットページネーション（新しい順 = id 降順）
+        if after:
+            companies = query.filter(Company.id > after).order_by(Company.id.asc()).limit(COMPANIES_PER_PAGE + 1).all()
+            has_newer = len(companies) > COMPANIES_PER_PAGE
+            companies = companies[:COMPANIES_PER_PAGE][::-1]
+            has_older = True
+        else:
+            if before:
+                query = query.filter(Company.id < before)
+            companies = query.order_by(Company.id.desc()).limit(COMPANIES_PER_PAGE + 1).all()
+            has_older = len(companies) > COMPANIES_PER_PAGE
+            companies = companies[:COMPANIES_PER_PAGE]
+            has_newer = bool(before)
+
+        return {
+            'companies': companies,
+            'search': search,
+            'newer_cursor': companies[0].id if companies and has_newer else None,
+            'older_cursor': companies[-1].id if companies and has_older else None,
+        }
+
+    return render_page('saas_companies.html', ['companies'], build_context)
 
 @app.route('/saas/company/add', methods=['GET', 'POST'])
 @login_required
@@ -160,12 +242,17 @@ def saas_add_company():
         plan_id = request.form.get('plan_id')
         start_date = datetime.strptime(request.form.get('start_date'), '%Y-%m-%d').date()
         billing_cycle = request.form.get('billing_cycle', 'monthly')
+        auto_renew = request.form.get('auto_renew') == 'on'
 
         # 終了日を自動計算
-        if billing_cycle == 'yearly':
-            end_date = start_date + timedelta(days=365)
-        else:
-            end_date = start_date + timedelta(days=30)
+        end_date = period_end(start_date, billing_cycle)
+
+        # ハッシュ計算は書き込みを始める前に済ませる（計算中に書き込みロックを持たない）
+        try:
+            admin_password_hash = hash_password(admin_password)
+        except PasswordHashBusy:
+            flash('処理が混み合っています。しばらくしてから再度お試しください。', 'error')
+            return redirect(url_for('saas_add_company'))
 
         # 企業作成
         company = Company(
@@ -186,14 +273,15 @@ def saas_add_company():
             start_date=start_date,
             end_date=end_date,
             monthly_fee=plan.monthly_fee if billing_cycle == 'monthly' else plan.yearly_fee,
-            billing_cycle=billing_cycle
+            billing_cycle=billing_cycle,
+            auto_renew=auto_renew
         )
         db.session.add(contract)
 
         # 管理者アカウント作成
         admin_user = User(
             email=admin_email,
-            password=generate_password_hash(admin_password),
+            password=admin_password_hash,
             name=admin_name,
             role='company_admin',
             company_id=company.id
@@ -225,14 +313,52 @@ def saas_edit_company(company_id):
         flash(f'企業「{company.company_name}」を更新しました。', 'success')
         return redirect(url_for('saas_companies'))
 
-    return render_template('saas_edit_company.html', company=company)
+    employee_count = Employee.query.filter_by(company_id=company.id, status='在籍中').count()
+    admin_count = User.query.filter_by(company_id=company.id, role='company_admin').count()
+    return render_template('saas_edit_company.html', company=company,
+                         employee_count=employee_count, admin_count=admin_count)
+
+@app.route('/saas/metrics', methods=['GET', 'POST'])
+@login_required
+@saas_admin_required
+def saas_metrics():
+    """ルートごとの応答時間・SQL回数・テンプレート描画時間と N+1 の疑い（POST で集計をリセット）"""
+    if not app.extensions.get('profiling'):
+        return jsonify({'enabled': False, 'message': '計測は無効です（PROFILING=1 で有効になります）。'})
+    if request.method == 'POST':
+        profiling.metrics.reset()
+    return jsonify({
+        'enabled': True,
+        **profiling.metrics.snapshot(),
+        'profile_endpoints': sorted(profiling.profile_endpoints()),
+        'profiles': profiling.list_dumps(app),
+    })
+
+@app.route('/saas/metrics/profiles/<name>')
+@login_required
+@saas_admin_required
+def saas_metrics_profile(name):
+    from werkzeug.utils import safe_join
+
+    if not app.extensions.get('profiling') or not name.endswith('.prof'):
+        abort(404)
+    path = safe_join(profiling.profile_dir(app), name)
+    if path is None or not os.path.exists(path):
+        abort(404)
+    return send_file(path, as_attachment=True, download_name=name)
 
 @app.route('/saas/plans')
 @login_required
 @saas_admin_required
 def saas_plans():
-    plans = Plan.query.all()
-    return render_template('saas_plans.html', plans=plans)
+    def build_context():
+        # プランごとの有効契約数を1クエリで集計
+        contract_counts = dict(db.session.query(Contract.plan_id, func.count(Contract.id)).filter(
+            Contract.is_active == True
+        ).group_by(Contract.plan_id).all())
+        return {'plans': Plan.query.all(), 'contract_counts': contract_counts}
+
+    return render_page('saas_plans.html', ['plans'], build_context)
 
 @app.route('/saas/plan/edit/<int:plan_id>', methods=['GET', 'POST'])
 @login_required
@@ -252,7 +378,8 @@ def saas_edit_plan(plan_id):
         flash(f'プラン「{plan.plan_name}」を更新しました。', 'success')
         return redirect(url_for('saas_plans'))
 
-    return render_template('saas_edit_plan.html', plan=plan)
+    active_contract_count = Contract.query.filter_by(plan_id=plan.id, is_active=True).count()
+    return render_template('saas_edit_plan.html', plan=plan, active_contract_count=active_contract_count)
 
 # =============================================================================
 # 企業管理者機能
@@ -266,6 +393,8 @@ def company_admin_required(f):
         if not current_user.is_authenticated or current_user.role != 'company_admin':
             flash('企業管理者権限が必要です。', 'error')
             return redirect(url_for('index'))
+        # 以降の ORM のクエリは自社の行に限られる（tenancy.py）
+        set_tenant(current_user.company_id)
         return f(*args, **kwargs)
     return decorated_function
 
@@ -273,60 +402,123 @@ def company_admin_required(f):
 @login_required
 @company_admin_required
 def company_dashboard():
-    # 統計情報
-    total_employees = Employee.query.filter_by(
-        company_id=current_user.company_id,
-        status='在籍中'
-    ).count()
-
-    # 契約情報
-    contract = Contract.query.filter_by(
-        company_id=current_user.company_id,
-        is_active=True
-    ).first()
+    # 契約情報・在籍従業員数（キャッシュ）
+    entitlement = current_entitlement()
+    contract = entitlement if entitlement.contract_id else None
+    total_employees = entitlement.headcount
 
     # 今月の勤怠入力状況
-    current_month = date.today().replace(day=1)
-    records_count = WorkingTimeRecord.query.filter(
-        WorkingTimeRecord.company_id == current_user.company_id,
-        WorkingTimeRecord.work_date >= current_month
-    ).count()
+    records_count = company_records_count(current_user.company_id)
 
     return render_template('company_dashboard.html',
                          total_employees=total_employees,
                          contract=contract,
-                         records_count=records_count)
+                         records_count=records_count,
+                         cache_stats=counter_cache.stats())
 
 @app.route('/employees')
 @login_required
 @company_admin_required
 def employees():
-    employees = Employee.query.filter_by(
-        company_id=current_user.company_id
-    ).order_by(Employee.employee_id).all()
+    from employee_list import employee_page, filter_options, FILTER_FIELDS
+
+    company_id = current_user.company_id
+    filters = {field: request.args.get(field, '') for field in FILTER_FIELDS}
 
-    return render_template('employees.html', employees=employees)
+    def build_context():
+        employees, next_cursor = employee_page(company_id, filters, cursor=request.args.get('after'))
+        return {
+            'employees': employees,
+            'filters': filters,
+            'options': filter_options(company_id),
+            'is_first_page': not request.args.get('after'),
+            'next_cursor': next_cursor,
+        }
+
+    return render_page('employees.html', [employee_scope(company_id)], build_context)
+
+@app.route('/api/employees')
+@login_required
+@company_admin_required
+def api_employees():
+    from employee_list import employee_page, serialize, FILTER_FIELDS, PER_PAGE
+
+    filters = {field: request.args.get(field, '') for field in FILTER_FIELDS}
+    rows, next_cursor = employee_page(current_user.company_id, filters,
+                                      cursor=request.args.get('after'),
+                                      limit=request.args.get('limit', PER_PAGE, type=int))
+
+    response = jsonify(employees=[serialize(row) for row in rows], next=next_cursor)
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+# 読み出し専用 API（非同期エンジンで独立したクエリを並行に実行する）
+def _read_api(coroutine_function, *args):
+    import read_api
+
+    response = jsonify(read_api.reader.run(db.engine.url, coroutine_function, *args))
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/read/dashboard')
+@login_required
+@company_admin_required
+def api_read_dashboard():
+    import read_api
+
+    return _read_api(read_api.dashboard, current_user.company_id)
+
+@app.route('/api/read/employees')
+@login_required
+@company_admin_required
+def api_read_employees():
+    import read_api
+    from employee_list import FILTER_FIELDS, PER_PAGE
+
+    filters = {field: request.args.get(field, '') for field in FILTER_FIELDS}
+    return _read_api(read_api.employees, current_user.company_id, filters,
+                     request.args.get('after'), request.args.get('limit', PER_PAGE, type=int))
+
+@app.route('/api/read/contract')
+@login_required
+@company_admin_required
+def api_read_contract():
+    import read_api
+
+    return _read_api(read_api.contract, current_user.company_id)
+
+@app.route('/api/attendance/import', methods=['POST'])
+@login_required
+@company_admin_required
+def api_import_attendance():
+    """勤怠の一括取込（multipart の file、または CSV / JSON Lines のリクエスト本文）"""
+    from attendance_io import ingest_attendance, detect_format, AttendanceImportError
+
+    upload = request.files.get('file')
+    try:
+        if upload and upload.filename:
+            file_format, stream = detect_format(upload.filename), upload.stream
+        else:
+            file_format, stream = detect_format(mimetype=request.mimetype), request.stream
+        result = ingest_attendance(current_user.company_id, stream, file_format)
+    except AttendanceImportError as e:
+        return jsonify(error=str(e), errors=e.errors), 400
+    return jsonify(result)
 
 @app.route('/employee/add', methods=['GET', 'POST'])
 @login_required
 @company_admin_required
 def add_employee():
     if request.method == 'POST':
-        # 従業員数チェック
-        contract = Contract.query.filter_by(
-            company_id=current_user.company_id,
-            is_active=True
-        ).first()
-
-        if contract:
-            current_count = Employee.query.filter_by(
-                company_id=current_user.company_id,
-                status='在籍中'
-            ).count()
-
-            if current_count >= contract.plan.max_employees:
-                flash(f'従業員数が上限（{contract.plan.max_employees}名）に達しています。', 'error')
-                return redirect(url_for('employees'))
+        # 従業員数チェック（同時登録に備えて企業単位でロックしてから数える）
+        try:
+            check_capacity(current_user.company_id)
+        except CapacityExceeded as e:
+            db.session.rollback()
+            flash(f'従業員数が上限（{e.max_employees}名）に達しています。', 'error')
+            return redirect(url_for('employees'))
 
         employee = Employee(
             company_id=current_user.company_id,
@@ -358,14 +550,77 @@ def add_employee():
 
     return render_template('add_employee.html')
 
+@app.route('/employees/import', methods=['GET', 'POST'])
+@login_required
+@company_admin_required
+def import_employees():
+    from employee_io import import_employees as run_import, EmployeeImportError, EMPLOYEE_COLUMNS
+
+    errors = []
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('ファイルを選択してください。', 'error')
+            return redirect(url_for('import_employees'))
+
+        try:
+            count = run_import(current_user.company_id, upload.stream, upload.filename)
+        except EmployeeImportError as e:
+            flash(str(e), 'error')
+            errors = e.errors
+        else:
+            flash(f'{count}名の従業員を登録しました。', 'success')
+            return redirect(url_for('employees'))
+
+    return render_template('import_employees.html', errors=errors, columns=EMPLOYEE_COLUMNS)
+
+@app.route('/employees/export')
+@login_required
+@company_admin_required
+def export_employees():
+    from employee_io import export_csv, export_xlsx
+
+    file_format = request.args.get('format', 'xlsx')
+    filename = f"employees_{date.today().strftime('%Y%m%d')}.{'csv' if file_format == 'csv' else 'xlsx'}"
+    if file_format == 'csv':
+        body, mimetype = export_csv(current_user.company_id), 'text/csv; charset=utf-8'
+    else:
+        body = export_xlsx(current_user.company_id)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/payroll/payslips')
+@login_required
+@company_admin_required
+def download_payslips():
+    from payslip import (count_payslips, payslip_filename, payslips_workbook, payslips_zip,
+                         XLSX_MIMETYPE, ZIP_MIMETYPE)
+
+    year = request.args.get('year', type=int)
+    month = request.args.get('month', type=int)
+    file_format = 'xlsx' if request.args.get('format') == 'xlsx' else 'zip'
+    if not year or not month or not 1 <= month <= 12:
+        flash('対象年月を正しく指定してください。', 'error')
+        return redirect(url_for('jobs'))
+    if not count_payslips(current_user.company_id, year, month):
+        flash(f'{year}年{month}月の給与計算結果がありません。先に給与計算を実行してください。', 'error')
+        return redirect(url_for('jobs'))
+
+    if file_format == 'xlsx':
+        body, mimetype = payslips_workbook(current_user.company_id, year, month), XLSX_MIMETYPE
+    else:
+        body, mimetype = payslips_zip(current_user.company_id, year, month), ZIP_MIMETYPE
+    filename = payslip_filename(year, month, file_format)
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
 @app.route('/employee/<int:employee_id>/edit', methods=['GET', 'POST'])
 @login_required
 @company_admin_required
 def edit_employee(employee_id):
-    employee = Employee.query.filter_by(
-        id=employee_id,
-        company_id=current_user.company_id
-    ).first_or_404()
+    employee = Employee.query.filter_by(id=employee_id).first_or_404()
 
     if request.method == 'POST':
         employee.employee_id = request.form.get('employee_id')
@@ -392,7 +647,331 @@ def edit_employee(employee_id):
         flash(f'従業員「{employee.name}」を更新しました。', 'success')
         return redirect(url_for('employees'))
 
-    return render_template('edit_employee.html', employee=employee)
+    return render_template('edit_employee.html', employee=employee, leave_balance=get_balance(employee.id))
+
+# =============================================================================
+# バックグラウンドジョブ
+# =============================================================================
+
+JOBS_PER_PAGE = 50
+
+@app.before_request
+def start_job_runner():
+    # gunicorn のワーカーごとに、最初のリクエストでジョブのディスパッチャを開始する
+    from jobs import runner
+
+    runner.start(app)
+
+def _get_job_or_404(job_id):
+    from models import Job
+
+    return Job.query.filter_by(id=job_id).first_or_404()
+
+def _job_response(job, message=None, category='success'):
+    from jobs import to_dict
+
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(to_dict(job))
+    if message:
+        flash(message, category)
+    return redirect(url_for('jobs'))
+
+@app.route('/jobs', methods=['GET', 'POST'])
+@login_required
+@company_admin_required
+def jobs():
+    from uuid import uuid4
+    from models import Job
+    from jobs import HANDLERS, enqueue, storage_dir, to_dict
+    from attendance_io import detect_format, AttendanceImportError
+
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        params, input_path = {}, None
+        if kind == 'payroll':
+            params = {'year': request.form.get('year', type=int), 'month': request.form.get('month', type=int)}
+            if not params['year'] or not params['month'] or not 1 <= params['month'] <= 12:
+                flash('対象年月を正しく指定してください。', 'error')
+                return redirect(url_for('jobs'))
+        elif kind == 'payslips':
+            params = {'year': request.form.get('year', type=int), 'month': request.form.get('month', type=int),
+                      'format': 'xlsx' if request.form.get('format') == 'xlsx' else 'zip'}
+            if not params['year'] or not params['month'] or not 1 <= params['month'] <= 12:
+                flash('対象年月を正しく指定してください。', 'error')
+                return redirect(url_for('jobs'))
+        elif kind == 'employee_export':
+            params = {'format': 'csv' if request.form.get('format') == 'csv' else 'xlsx'}
+        elif kind in ('employee_import', 'attendance_import'):
+            upload = request.files.get('file')
+            if not upload or not upload.filename:
+                flash('ファイルを選択してください。', 'error')
+                return redirect(url_for('jobs'))
+            extension = os.path.splitext(upload.filename)[1].lower()
+            params = {'filename': upload.filename}
+            if kind == 'attendance_import':
+                try:
+                    params['format'] = detect_format(upload.filename)
+                except AttendanceImportError as e:
+                    flash(str(e), 'error')
+                    return redirect(url_for('jobs'))
+            input_path = os.path.join(storage_dir(app), f'upload-{uuid4().hex}{extension}')
+            upload.save(input_path)
+        else:
+            flash('ジョブの種類が正しくありません。', 'error')
+            return redirect(url_for('jobs'))
+
+        job = enqueue(kind, company_id=current_user.company_id, user_id=current_user.id,
+                      params=params, input_path=input_path)
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(to_dict(job)), 202
+        flash(f'「{HANDLERS[kind][0]}」を受け付けました（ジョブ #{job.id}）。', 'success')
+        return redirect(url_for('jobs'))
+
+    job_list = Job.query.order_by(Job.id.desc()).limit(JOBS_PER_PAGE).all()
+    return render_template('jobs.html', jobs=[to_dict(job) for job in job_list], today=date.today())
+
+@app.route('/api/jobs/<int:job_id>')
+@login_required
+@company_admin_required
+def api_job(job_id):
+    from jobs import to_dict
+
+    return jsonify(to_dict(_get_job_or_404(job_id)))
+
+@app.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+@company_admin_required
+def cancel_job(job_id):
+    from jobs import cancel
+
+    job = _get_job_or_404(job_id)
+    if cancel(job):
+        return _job_response(job, f'ジョブ #{job.id} の中止を受け付けました。')
+    return _job_response(job, f'ジョブ #{job.id} は既に終了しています。', 'error')
+
+@app.route('/jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+@company_admin_required
+def retry_job(job_id):
+    from jobs import retry
+
+    job = _get_job_or_404(job_id)
+    if retry(job):
+        return _job_response(job, f'ジョブ #{job.id} を再実行します。')
+    return _job_response(job, f'ジョブ #{job.id} は再実行できません（失敗・中止したジョブのみ）。', 'error')
+
+@app.route('/jobs/<int:job_id>/download')
+@login_required
+@company_admin_required
+def download_job(job_id):
+    from jobs import SUCCEEDED, to_dict
+
+    job = _get_job_or_404(job_id)
+    if job.status != SUCCEEDED or not job.output_path or not os.path.exists(job.output_path):
+        abort(404)
+    filename = (to_dict(job)['result'] or {}).get('filename') or os.path.basename(job.output_path)
+    return send_file(job.output_path, as_attachment=True, download_name=filename)
+
+# =============================================================================
+# CLIコマンド
+# =============================================================================
+
+@app.cli.command('jobs-worker')
+@click.option('--workers', type=int, help='ワーカースレッド数（既定は JOB_WORKERS）')
+def jobs_worker_command(workers):
+    """バックグラウンドジョブを実行するワーカーを起動する（Webプロセスとは別に動かす場合）"""
+    from jobs import runner
+
+    click.echo('ジョブワーカーを起動しました。Ctrl+C で停止します。')
+    runner.run_forever(app, workers)
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """未適用のスキーママイグレーションを適用する"""
+    from migrations import upgrade
+    from provision import advisory_lock
+
+    with advisory_lock():
+        applied = upgrade()
+    for version, description in applied:
+        click.echo(f'✓ {version:03d} {description}')
+    if not applied:
+        click.echo('スキーマは最新です。')
+
+@app.cli.command('db-provision')
+@click.option('--no-seed', is_flag=True, help='初期データ（プラン・管理者・テスト企業）を投入しない')
+def db_provision_command(no_seed):
+    """ロックを取ってマイグレーションと初期データ投入を行う（デプロイ時に1回実行する。何度実行してもよい）"""
+    from provision import provision, seeds_enabled
+
+    result = provision(seeds=seeds_enabled() and not no_seed)
+    for version, description in result['migrations']:
+        click.echo(f'✓ マイグレーション {version:03d} {description}')
+    for version, description in result['seeds']:
+        click.echo(f'✓ 初期データ {version:03d} {description}')
+    if not result['migrations'] and not result['seeds']:
+        click.echo('データベースは最新です。')
+
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    """主要クエリの実行計画を確認し、想定インデックスが使われていなければ失敗する"""
+    from query_plans import check_query_plans
+
+    failed = False
+    for name, index_name, used, plan in check_query_plans():
+        click.echo(f"{'✓' if used else '✗'} {name}（{index_name}）")
+        if not used:
+            failed = True
+            click.echo(f'    {plan}')
+    if failed:
+        raise SystemExit(1)
+
+def _get_company_or_abort(company_code):
+    company = Company.query.filter_by(company_code=company_code).first()
+    if not company:
+        raise click.ClickException(f'企業コード {company_code} が見つかりません。')
+    return company
+
+@app.cli.command('worktime-recompute')
+@click.argument('company_code')
+@click.argument('year', type=int)
+@click.argument('month', type=int)
+def worktime_recompute_command(company_code, year, month):
+    """指定企業・指定月の労働時間区分を再計算する"""
+    from worktime import recompute_company_month
+
+    company = _get_company_or_abort(company_code)
+    result = recompute_company_month(company.id, year, month)
+    click.echo(f"{company.company_name} {year}年{month}月: "
+               f"{result['records']}件中 {result['updated']}件を更新")
+
+@app.cli.command('payroll-run')
+@click.argument('company_code')
+@click.argument('year', type=int)
+@click.argument('month', type=int)
+def payroll_run_command(company_code, year, month):
+    """指定企業・指定月の給与を一括計算する（労働時間区分も再計算する）"""
+    from payroll import run_company_payroll
+    from worktime import recompute_company_month
+
+    company = _get_company_or_abort(company_code)
+    recompute_company_month(company.id, year, month)
+    result = run_company_payroll(company.id, year, month)
+    click.echo(f"{company.company_name} {year}年{month}月: "
+               f"{result['employees']}名（新規 {result['inserted']} / 更新 {result['updated']}）")
+
+@app.cli.command('close-month')
+@click.argument('year', type=int)
+@click.argument('month', type=int)
+@click.option('--workers', type=int, help='並列プロセス数（既定はCPUコア数）')
+@click.option('--company', 'company_codes', multiple=True, help='対象企業コード（複数指定可。既定は有効な契約がある全企業）')
+def close_month_command(year, month, workers, company_codes):
+    """有効な契約がある全企業の月次締め（労働時間区分の再計算と給与計算）を並列で行う"""
+    from payroll_close import close_month
+
+    company_ids = [_get_company_or_abort(code).id for code in company_codes] or None
+
+    def report(group_results):
+        for item in group_results:
+            if item['error']:
+                click.echo(f"✗ {item['company_code']}: {item['error']}")
+            else:
+                click.echo(f"✓ {item['company_code']}: {item['employees']}名 {item['seconds']:.2f}秒")
+
+    result = close_month(year, month, workers=workers, company_ids=company_ids, on_group_done=report)
+    click.echo(f"{year}年{month}月: {result['companies']}社 {result['employees']}名 "
+               f"（失敗 {result['failed']}社）{result['workers']}プロセス {result['elapsed_seconds']:.2f}秒")
+    if result['failed']:
+        raise SystemExit(1)
+
+@app.cli.command('attendance-rollup')
+@click.option('--company', 'company_code', help='対象企業コード（既定は全企業）')
+@click.option('--check', is_flag=True, help='作り直さずに突き合わせのみ行う')
+def attendance_rollup_command(company_code, check):
+    """月次勤怠集計を勤怠記録から作り直し、勤怠記録と突き合わせる（不一致があれば失敗する）"""
+    from attendance_rollup import rebuild, verify
+
+    company_id = _get_company_or_abort(company_code).id if company_code else None
+    connection = db.session.connection()
+    if not check:
+        click.echo(f'{rebuild(connection, company_id)}件を作成しました。')
+    mismatches = verify(connection, company_id)
+    db.session.commit()
+    for (mismatch_company_id, employee_id, year, month), field, expected, actual in mismatches[:20]:
+        click.echo(f'✗ 企業{mismatch_company_id} 従業員{employee_id} {year}年{month}月 {field}: '
+                   f'勤怠記録 {expected} / 集計 {actual}')
+    if mismatches:
+        raise SystemExit(1)
+    click.echo('✓ 勤怠記録と一致しています。')
+
+@app.cli.command('attendance-archive')
+@click.argument('year', type=int)
+@click.argument('month', type=int)
+@click.option('--company', 'company_code', help='対象企業コード（既定は給与計算が済んだ全企業）')
+def attendance_archive_command(year, month, company_code):
+    """給与計算で締めた月の勤怠をアーカイブファイルへ移し、勤怠テーブルから削除する"""
+    from attendance_archive import AttendanceArchiveError, archive_month, closed_companies
+
+    if company_code:
+        company_ids = [_get_company_or_abort(company_code).id]
+    else:
+        company_ids = closed_companies(year, month)
+    failed = False
+    for company_id in company_ids:
+        try:
+            result = archive_month(company_id, year, month)
+        except AttendanceArchiveError as e:
+            click.echo(f'✗ 企業{company_id}: {e}')
+            failed = True
+            continue
+        if result is None:
+            click.echo(f'- 企業{company_id}: アーカイブ済み')
+        else:
+            click.echo(f"✓ 企業{company_id}: {result['records']}件（勤怠テーブルから{result['deleted']}件を削除、"
+                       f"{result['bytes'] / 1024:.0f}KB）")
+    if not company_ids:
+        click.echo(f'{year}年{month}月にアーカイブする企業はありません。')
+    if failed:
+        raise SystemExit(1)
+
+@app.cli.command('leave-grant')
+@click.option('--date', 'as_of', type=click.DateTime(formats=['%Y-%m-%d']), help='基準日（既定は今日）')
+@click.option('--company', 'company_code', help='対象企業コード（既定は全企業）')
+def leave_grant_command(as_of, company_code):
+    """法定の有給休暇を付与し、有効期限を迎えた付与を残日数から外す"""
+    from leave import expire_balances, grant_statutory_leave
+
+    today = as_of.date() if as_of else date.today()
+    company_id = _get_company_or_abort(company_code).id if company_code else None
+    result = grant_statutory_leave(today, company_id)
+    expired = expire_balances(today)
+    click.echo(f"{today}: {result['employees']}名中 {result['granted']}件（{result['days']:g}日）を付与、"
+               f"{expired}名の残日数を失効処理")
+
+@app.cli.command('contracts-tick')
+@click.option('--date', 'as_of', type=click.DateTime(formats=['%Y-%m-%d']), help='基準日（既定は今日）')
+def contracts_tick_command(as_of):
+    """期限切れの契約を自動更新・失効させ、期限間近の一覧を作り直す（毎日実行する）"""
+    from contracts import tick
+
+    today = as_of.date() if as_of else date.today()
+    result = tick(today)
+    click.echo(f"{today}: {result['renewed']}件を自動更新、{result['deactivated']}件を失効、"
+               f"期限間近 {result['expiring']}件")
+
+@app.cli.command('leave-rebuild')
+@click.argument('company_code')
+def leave_rebuild_command(company_code):
+    """指定企業の有給休暇の消化割当と残日数を作り直す"""
+    from leave import rebuild_allocations
+
+    company = _get_company_or_abort(company_code)
+    employee_ids = db.session.execute(
+        db.select(Employee.id).where(Employee.company_id == company.id)
+    ).scalars().all()
+    rebuild_allocations(db.session.connection(), employee_ids)
+    db.session.commit()
+    click.echo(f'{company.company_name}: {len(employee_ids)}名の有給休暇台帳を再作成')
 
 if __name__ == '__main__':
     app.run(debug=True)
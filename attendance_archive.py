@@ -0,0 +1,380 @@
+"""勤怠アーカイブ
+
+給与計算で締めた月の勤怠（WorkingTimeRecord）を企業・年ごとの列指向ファイルへ移し、勤怠テーブルから削除する。
+勤怠テーブルとそのインデックスには締めていない月だけが残り、締めた月は勤怠テーブルに触れずにファイルから読める。
+
+ファイルは ATTENDANCE_ARCHIVE_DIR/<企業ID>/<年>.wtr に置き、列ごとに array の型付き配列を連続して書く
+（先頭の JSON に列の位置と月ごとの行範囲を持ち、行は日付・従業員・ID の順）。読み出しは mmap して
+memoryview.cast で列をそのまま参照する。月を追加するときは既存の月と合わせて一時ファイルに書き、os.replace で置き換える。
+
+- アーカイブした月は attendance_archive テーブルに記録し、勤怠の取込・労働時間区分の再計算の対象から外す（読み出し専用）
+- 月次勤怠集計（attendance_monthly）はそのまま残すため、給与計算・ダッシュボードの件数は変わらない
+- 有給休暇の取得日は有給休暇台帳（leave_consumption）が勤怠を参照しているため、ファイルに書いたうえで勤怠テーブルにも残す
+- 複数のサーバーで動かす場合は ATTENDANCE_ARCHIVE_DIR を共有ストレージに置く
+"""
+import json
+import math
+import mmap
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+from datetime import date, datetime, time as dtime, timedelta
+from flask import current_app
+from sqlalchemy import delete, func, or_, select
+from attendance_rollup import TOTAL_FIELDS, contribution, worked
+from entitlements import lock_company
+from models import db, AttendanceArchive, PayrollCalculation, WorkingTimeRecord
+from payroll import month_range
+
+MAGIC = b'EMLWTR1\n'
+ALIGN = 8
+_EPOCH = datetime(1970, 1, 1)
+_records = WorkingTimeRecord.__table__
+
+# (列名, array の型, 種類)。None は整数の列では -1、実数の列では NaN で表す
+COLUMNS = [
+    ('id', 'q', 'int'),
+    ('employee_id', 'q', 'int'),
+    ('work_date', 'i', 'date'),
+    ('start_time', 'i', 'time'),
+    ('end_time', 'i', 'time'),
+    ('break_minutes', 'i', 'int'),
+    ('regular_hours', 'd', 'float'),
+    ('overtime_in_legal', 'd', 'float'),
+    ('overtime_out_legal', 'd', 'float'),
+    ('legal_holiday_hours', 'd', 'float'),
+    ('non_legal_holiday_hours', 'd', 'float'),
+    ('late_night_hours', 'd', 'float'),
+    ('is_absent', 'b', 'bool'),
+    ('is_paid_leave', 'b', 'bool'),
+    ('leave_days', 'd', 'float'),
+    ('created_at', 'd', 'datetime'),
+    ('updated_at', 'd', 'datetime'),
+]
+# 備考は行番号 → 文字列として先頭の JSON に持つ
+ArchivedRecord = namedtuple('ArchivedRecord', ['company_id'] + [name for name, _, _ in COLUMNS] + ['remarks'])
+
+
+class AttendanceArchiveError(Exception):
+    """アーカイブできない月（今月以降・給与計算前）や壊れたファイル"""
+
+
+def archive_dir():
+    path = os.environ.get('ATTENDANCE_ARCHIVE_DIR') or os.path.join(current_app.instance_path, 'attendance_archive')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def archive_path(company_id, year):
+    return os.path.join(archive_dir(), str(company_id), f'{year}.wtr')
+
+
+def _align(size):
+    return (size + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _encode(kind, value):
+    if value is None:
+        return math.nan if kind in ('float', 'datetime') else -1
+    if kind == 'date':
+        return value.toordinal()
+    if kind == 'time':
+        return value.hour * 3600 + value.minute * 60 + value.second
+    if kind == 'bool':
+        return int(bool(value))
+    if kind == 'datetime':
+        return (value - _EPOCH).total_seconds()
+    return value
+
+
+def _decode(kind, value):
+    if kind in ('float', 'datetime'):
+        if math.isnan(value):
+            return None
+        return _EPOCH + timedelta(seconds=value) if kind == 'datetime' else value
+    if value == -1:
+        return None
+    if kind == 'date':
+        return date.fromordinal(value)
+    if kind == 'time':
+        return dtime(value // 3600, value % 3600 // 60, value % 60)
+    if kind == 'bool':
+        return bool(value)
+    return value
+
+
+# =============================================================================
+# ファイルの読み書き
+# =============================================================================
+
+class ArchiveFile:
+    """アーカイブファイルを mmap して列を参照する（with 文で使い、列の memoryview は with の中でだけ使う）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise AttendanceArchiveError(f'空のアーカイブファイルです: {path}')
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise AttendanceArchiveError(f'アーカイブファイルの形式が正しくありません: {path}')
+        length = int.from_bytes(self._map[len(MAGIC):len(MAGIC) + 4], 'little')
+        header_start = len(MAGIC) + 4
+        self.header = json.loads(self._map[header_start:header_start + length])
+        self._data_start = _align(header_start + length)
+        self._view = memoryview(self._map)
+        self.company_id = self.header['company_id']
+        self.year = self.header['year']
+        self.months = sorted(int(month) for month in self.header['months'])
+
+    def close(self):
+        if getattr(self, '_view', None) is not None:
+            self._view.release()
+            self._view = None
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _range(self, month):
+        if month is None:
+            return 0, self.header['rows']
+        if str(month) not in self.header['months']:
+            return 0, 0
+        start, stop = self.header['months'][str(month)]
+        return start, stop
+
+    def column(self, name, month=None):
+        """列の値（month 指定時はその月の行だけ）を memoryview で返す"""
+        typecode, offset, size = self.header['columns'][name]
+        start = self._data_start + offset
+        view = self._view[start:start + size].cast(typecode)
+        if self.header['byteorder'] != sys.byteorder:
+            swapped = array(typecode, view)
+            swapped.byteswap()
+            view = memoryview(swapped)
+        first, stop = self._range(month)
+        return view[first:stop]
+
+    def records(self, month=None, start_date=None, end_date=None):
+        """ArchivedRecord を日付・従業員・ID の順に返す（start_date 以上 end_date 未満に絞り込める）"""
+        first, stop = self._range(month)
+        work_dates = self.column('work_date')
+        if start_date is not None:
+            first = max(first, bisect_left(work_dates, start_date.toordinal(), first, stop))
+        if end_date is not None:
+            stop = min(stop, bisect_left(work_dates, end_date.toordinal(), first, stop))
+        columns = [(kind, self.column(name)) for name, _, kind in COLUMNS]
+        remarks = self.header['remarks']
+        for index in range(first, stop):
+            yield ArchivedRecord(self.company_id, *[_decode(kind, values[index]) for kind, values in columns],
+                                 remarks.get(str(index)))
+
+    def block(self, month):
+        """1か月分の列（array のコピー）と備考（月内の行番号 → 文字列）"""
+        first, stop = self._range(month)
+        columns = {name: array(typecode, self.column(name, month)) for name, typecode, _ in COLUMNS}
+        remarks = {}
+        for key, text in self.header['remarks'].items():
+            if first <= int(key) < stop:
+                remarks[int(key) - first] = text
+        return columns, remarks
+
+
+def _block_from_rows(rows):
+    columns = {name: array(typecode) for name, typecode, _ in COLUMNS}
+    remarks = {}
+    for index, row in enumerate(rows):
+        for name, _, kind in COLUMNS:
+            columns[name].append(_encode(kind, getattr(row, name)))
+        if row.remarks:
+            remarks[index] = row.remarks
+    return columns, remarks
+
+
+def write_archive(path, company_id, year, blocks):
+    """{月: (列, 備考)} を1つのファイルに書き（既存のファイルは置き換える）、ファイルサイズを返す"""
+    columns = {name: array(typecode) for name, typecode, _ in COLUMNS}
+    months, remarks = {}, {}
+    for month in sorted(blocks):
+        block_columns, block_remarks = blocks[month]
+        start = len(columns['id'])
+        for name, _, _ in COLUMNS:
+            columns[name].extend(block_columns[name])
+        for index, text in block_remarks.items():
+            remarks[str(start + index)] = text
+        months[str(month)] = [start, len(columns['id'])]
+
+    layout, offset = {}, 0
+    for name, typecode, _ in COLUMNS:
+        size = len(columns[name]) * columns[name].itemsize
+        layout[name] = [typecode, offset, size]
+        offset += _align(size)
+    header = json.dumps({
+        'company_id': company_id, 'year': year, 'rows': len(columns['id']), 'byteorder': sys.byteorder,
+        'months': months, 'columns': layout, 'remarks': remarks,
+    }, ensure_ascii=False).encode()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(4, 'little'))
+        f.write(header)
+        f.write(b'\0' * (_align(f.tell()) - f.tell()))
+        for name, _, _ in COLUMNS:
+            data = columns[name].tobytes()
+            f.write(data)
+            f.write(b'\0' * (_align(len(data)) - len(data)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    return os.path.getsize(path)
+
+
+# =============================================================================
+# アーカイブ済みの月
+# =============================================================================
+
+def archived_months(company_id, connection=None):
+    """企業のアーカイブ済みの (年, 月) の集合"""
+    connection = connection or db.session.connection()
+    return {
+        (row.year, row.month) for row in connection.execute(
+            select(AttendanceArchive.year, AttendanceArchive.month).where(AttendanceArchive.company_id == company_id)
+        )
+    }
+
+
+def is_archived(company_id, year, month):
+    return db.session.get(AttendanceArchive, (company_id, year, month)) is not None
+
+
+def archived_keys(connection, company_id=None, year=None, month=None):
+    """範囲内のアーカイブ済みの (企業ID, 年, 月) のリスト"""
+    stmt = select(AttendanceArchive.company_id, AttendanceArchive.year, AttendanceArchive.month)
+    if company_id is not None:
+        stmt = stmt.where(AttendanceArchive.company_id == company_id)
+    if year is not None:
+        stmt = stmt.where(AttendanceArchive.year == year, AttendanceArchive.month == month)
+    return [tuple(row) for row in connection.execute(stmt.order_by(*stmt.selected_columns))]
+
+
+def archived_records(company_id, start_date, end_date):
+    """企業のアーカイブ済みの月のうち start_date 以上 end_date 未満の勤怠（ArchivedRecord のリスト）"""
+    months = archived_months(company_id)
+    records = []
+    for year in range(start_date.year, (end_date - timedelta(days=1)).year + 1):
+        if not any(archived_year == year for archived_year, _ in months):
+            continue
+        with ArchiveFile(archive_path(company_id, year)) as archive:
+            records.extend(record for record in archive.records(start_date=start_date, end_date=end_date)
+                           if (year, record.work_date.month) in months)
+    return records
+
+
+def archived_totals(connection, company_id=None, year=None, month=None, employee_ids=None):
+    """アーカイブ済みの月の従業員ごとの合計を、月次勤怠集計と同じ項目の dict のリストで返す"""
+    employee_ids = set(employee_ids) if employee_ids is not None else None
+    by_file = defaultdict(list)
+    for key_company_id, key_year, key_month in archived_keys(connection, company_id, year, month):
+        by_file[(key_company_id, key_year)].append(key_month)
+
+    totals = []
+    for (key_company_id, key_year), months in sorted(by_file.items()):
+        with ArchiveFile(archive_path(key_company_id, key_year)) as archive:
+            for key_month in months:
+                sums = {}
+                worked_days = set()  # 同日の複数勤務は出勤日数を1日と数える
+                for record in archive.records(key_month):
+                    if employee_ids is not None and record.employee_id not in employee_ids:
+                        continue
+                    total = sums.setdefault(record.employee_id, dict.fromkeys(TOTAL_FIELDS, 0))
+                    values = record._asdict()
+                    day = (record.employee_id, record.work_date)
+                    new_day = day not in worked_days
+                    if worked(values):
+                        worked_days.add(day)
+                    for field, value in contribution(values, new_day).items():
+                        total[field] += value
+                totals.extend({'company_id': key_company_id, 'employee_id': employee_id, 'year': key_year,
+                               'month': key_month, **total} for employee_id, total in sorted(sums.items()))
+    return totals
+
+
+# =============================================================================
+# アーカイブ
+# =============================================================================
+
+def archive_month(company_id, year, month, today=None):
+    """締めた月の勤怠をファイルへ移し、件数などを dict で返す（アーカイブ済みなら None）
+
+    アーカイブできない月（今月以降・給与計算前）は AttendanceArchiveError を送出する。
+    """
+    start, end = month_range(year, month)
+    if end > (today or date.today()):
+        raise AttendanceArchiveError(f'{year}年{month}月はまだ終わっていません。')
+    # 同じ企業のアーカイブ・勤怠の取込と重ならないよう企業単位でロックする
+    lock_company(company_id)
+    if is_archived(company_id, year, month):
+        db.session.rollback()
+        return None
+    closed = db.session.execute(
+        select(func.count()).select_from(PayrollCalculation).where(
+            PayrollCalculation.company_id == company_id,
+            PayrollCalculation.year == year,
+            PayrollCalculation.month == month,
+        )
+    ).scalar()
+    if not closed:
+        db.session.rollback()
+        raise AttendanceArchiveError(f'{year}年{month}月は給与計算が済んでいません。')
+
+    rows = db.session.execute(
+        select(*[_records.c[name] for name, _, _ in COLUMNS], _records.c.remarks).where(
+            _records.c.company_id == company_id, _records.c.work_date >= start, _records.c.work_date < end,
+        ).order_by(_records.c.work_date, _records.c.employee_id, _records.c.id)
+    ).all()
+
+    # 既存のファイルの他の月と合わせて書き直す（前回の途中で書いた同じ月は置き換える）
+    path = archive_path(company_id, year)
+    blocks = {}
+    if os.path.exists(path):
+        with ArchiveFile(path) as archive:
+            blocks = {existing: archive.block(existing) for existing in archive.months if existing != month}
+    blocks[month] = _block_from_rows(rows)
+    size = write_archive(path, company_id, year, blocks)
+
+    # ORM のイベントを経由しないため、月次勤怠集計・有給休暇台帳は変わらない
+    deleted = db.session.execute(
+        delete(_records).where(
+            _records.c.company_id == company_id, _records.c.work_date >= start, _records.c.work_date < end,
+            or_(_records.c.is_paid_leave == False, _records.c.is_paid_leave.is_(None)),  # noqa: E712
+        )
+    ).rowcount
+    db.session.add(AttendanceArchive(company_id=company_id, year=year, month=month, record_count=len(rows)))
+    db.session.commit()
+    return {'records': len(rows), 'deleted': deleted, 'bytes': size}
+
+
+def closed_companies(year, month):
+    """給与計算が済んでいて、まだアーカイブしていない企業ID"""
+    archived = select(AttendanceArchive.company_id).where(
+        AttendanceArchive.year == year, AttendanceArchive.month == month
+    )
+    return db.session.execute(
+        select(PayrollCalculation.company_id).where(
+            PayrollCalculation.year == year,
+            PayrollCalculation.month == month,
+            PayrollCalculation.company_id.not_in(archived),
+        ).distinct().order_by(PayrollCalculation.company_id)
+    ).scalars().all()
@@ -0,0 +1,322 @@
+"""勤怠の一括取込
+
+打刻機などが出力する CSV / JSON Lines を1行ずつ読み、BATCH_SIZE 行ごとに
+社員番号の解決（1クエリ）・既存勤怠の照合（1クエリ）・一括 INSERT / UPDATE を行ってコミットする。
+同じ従業員・同じ日付の勤怠は後に出現した行で上書きし、既存の勤怠がある日はその勤怠を更新する。
+
+取込後は影響を受けた従業員・月だけ労働時間区分を再計算し、有給休暇台帳を作り直す。
+月次勤怠集計にはバッチごとに同じトランザクションで差分を反映する。
+"""
+import csv
+import io
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import date, datetime, time as dtime
+from sqlalchemy import select, insert, update
+from models import db, Employee, WorkingTimeRecord
+from attendance_archive import archived_months
+from attendance_rollup import HOUR_FIELDS, add_contribution, apply_deltas, worked
+from counters import invalidate_company
+from leave import rebuild_allocations
+from payroll import month_range
+from worktime import recompute_company_month, week_start
+
+BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 100
+
+# (項目名, 見出し, 型)
+ATTENDANCE_COLUMNS = [
+    ('employee_code', '社員番号', 'str'),
+    ('work_date', '日付', 'date'),
+    ('start_time', '出勤時刻', 'time'),
+    ('end_time', '退勤時刻', 'time'),
+    ('break_minutes', '休憩時間（分）', 'int'),
+    ('is_absent', '欠勤', 'bool'),
+    ('is_paid_leave', '有給休暇', 'bool'),
+    ('leave_days', '有給取得日数', 'float'),
+    ('remarks', '備考', 'str'),
+]
+
+DEFAULTS = {'break_minutes': 0, 'is_absent': False, 'is_paid_leave': False, 'leave_days': 0}
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on', '○', '〇', 'はい'}
+
+HEADER_ALIASES = {}
+for _field, _label, _ in ATTENDANCE_COLUMNS:
+    HEADER_ALIASES[_field] = _field
+    HEADER_ALIASES[_label] = _field
+COLUMN_TYPES = {field: kind for field, _, kind in ATTENDANCE_COLUMNS}
+COLUMN_LABELS = {field: label for field, label, _ in ATTENDANCE_COLUMNS}
+
+
+class AttendanceImportError(Exception):
+    """取込失敗（ファイル形式・見出しの誤りなど、1行も取り込めない場合）"""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+# =============================================================================
+# 読み込み
+# =============================================================================
+
+def detect_format(filename=None, mimetype=None):
+    """ファイル名または Content-Type から 'csv' / 'jsonl' を判定する"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension in ('.jsonl', '.ndjson') or (not extension and 'json' in (mimetype or '')):
+        return 'jsonl'
+    if extension == '.csv' or (not extension and 'csv' in (mimetype or '')):
+        return 'csv'
+    raise AttendanceImportError('対応していないファイル形式です（.csv または .jsonl）。')
+
+
+def iter_records(stream, file_format):
+    """(行番号, {項目名: 値}) を1行ずつ返す"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if file_format == 'csv':
+            reader = csv.reader(text)
+            header = [HEADER_ALIASES.get(value.strip()) for value in next(reader, [])]
+            if 'employee_code' not in header or 'work_date' not in header:
+                raise AttendanceImportError('見出し行に「社員番号」「日付」列が必要です。')
+            for line_number, values in enumerate(reader, start=2):
+                if any(values):
+                    yield line_number, {field: value for field, value in zip(header, values) if field}
+        else:
+            for line_number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    yield line_number, None
+                    continue
+                if not isinstance(item, dict):
+                    yield line_number, None
+                    continue
+                yield line_number, {HEADER_ALIASES[key]: value for key, value in item.items() if key in HEADER_ALIASES}
+    finally:
+        # 呼び出し元が先にファイルを閉じた後でジェネレータが破棄される場合がある
+        if not text.closed:
+            text.detach()
+
+
+def _convert(value, kind):
+    if value is None or (isinstance(value, str) and value.strip() == ''):
+        return None
+    if kind == 'date':
+        if isinstance(value, date):
+            return value
+        text = str(value).strip().replace('/', '-')
+        try:
+            return date.fromisoformat(text)
+        except ValueError:
+            return datetime.strptime(text, '%Y-%m-%d').date()
+    if kind == 'time':
+        text = str(value).strip()
+        try:
+            return dtime.fromisoformat(text)
+        except ValueError:
+            return datetime.strptime(text, '%H:%M').time()
+    if kind == 'bool':
+        if isinstance(value, bool):
+            return value
+        return str(value).strip().lower() in TRUE_VALUES
+    if kind == 'int':
+        return int(float(value))
+    if kind == 'float':
+        return float(value)
+    return str(value).strip()
+
+
+def parse_record(values):
+    """1行分の値を検証し、(社員番号, 勤怠の列に対応する dict) を返す（不正な場合は ValueError）"""
+    if values is None:
+        raise ValueError('JSON の形式が正しくありません')
+    record = {}
+    for field, kind in COLUMN_TYPES.items():
+        value = values.get(field)
+        try:
+            record[field] = _convert(value, kind)
+        except (TypeError, ValueError):
+            raise ValueError(f'{COLUMN_LABELS[field]}の形式が正しくありません（{value}）')
+    code = record.pop('employee_code')
+    if not code:
+        raise ValueError('社員番号は必須です')
+    if record['work_date'] is None:
+        raise ValueError('日付は必須です')
+    for field, default in DEFAULTS.items():
+        if record[field] is None:
+            record[field] = default
+    return code, record
+
+
+# =============================================================================
+# 取込
+# =============================================================================
+
+class _Ingestion:
+    """1ファイル分の取込状況"""
+
+    def __init__(self, company_id):
+        self.company_id = company_id
+        self.errors = []
+        self.error_count = 0
+        self.counts = {'rows': 0, 'inserted': 0, 'updated': 0, 'duplicates': 0}
+        self.affected = defaultdict(set)  # (年, 月) → 従業員ID
+        self.last_dates = {}  # (年, 月) → 取込んだ最終日
+        self.leave_employee_ids = set()
+        self.archived = archived_months(company_id)  # 締めてアーカイブした (年, 月) は取り込まない
+
+    def error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_number, message))
+
+    def write_batch(self, batch):
+        """{(社員番号, 日付): (行番号, 勤怠)} を一括で登録・更新してコミットする"""
+        wtr = WorkingTimeRecord
+        codes = {code for code, _ in batch}
+        employee_ids = dict(db.session.execute(
+            select(Employee.employee_id, Employee.id).where(
+                Employee.company_id == self.company_id, Employee.employee_id.in_(codes)
+            )
+        ).all())
+
+        records = {}
+        for (code, work_date), (line_number, record) in batch.items():
+            if (work_date.year, work_date.month) in self.archived:
+                self.error(line_number, f'{work_date.year}年{work_date.month}月は締め済み（アーカイブ済み）のため取り込めません')
+                continue
+            employee_id = employee_ids.get(code)
+            if employee_id is None:
+                self.error(line_number, f'社員番号 {code} の従業員が見つかりません')
+                continue
+            records[(employee_id, work_date)] = record
+        if not records:
+            return
+
+        # 同日に複数の勤怠がある場合は最初に登録されたものを更新対象とする
+        dates = [work_date for _, work_date in records]
+        existing = {}
+        shared_days = set()  # 更新対象以外にも出勤した勤怠がある日（出勤日数は日付単位で数える）
+        for row in db.session.execute(
+            select(wtr.id, wtr.company_id, wtr.employee_id, wtr.work_date, wtr.start_time, wtr.is_absent,
+                   wtr.is_paid_leave, wtr.leave_days, *[getattr(wtr, field) for field in HOUR_FIELDS])
+            .where(
+                wtr.company_id == self.company_id,
+                wtr.employee_id.in_({employee_id for employee_id, _ in records}),
+                wtr.work_date >= min(dates),
+                wtr.work_date <= max(dates),
+            ).order_by(wtr.id)
+        ):
+            key = (row.employee_id, row.work_date)
+            if key in records and key not in existing:
+                existing[key] = row
+            elif key in records and worked(row._asdict()):
+                shared_days.add(key)
+
+        inserts, updates = [], []
+        deltas = defaultdict(dict)
+        now = datetime.utcnow()
+        for key, record in records.items():
+            employee_id, work_date = key
+            current = existing.get(key)
+            if current is None:
+                values = {'company_id': self.company_id, 'employee_id': employee_id, **record}
+                inserts.append({**values, 'created_at': now, 'updated_at': now})
+                add_contribution(deltas, {**dict.fromkeys(HOUR_FIELDS, 0), **values})
+            else:
+                old = current._asdict()
+                updates.append({'id': old.pop('id'), **record, 'updated_at': now})
+                new_day = key not in shared_days
+                add_contribution(deltas, old, -1, new_day=new_day)
+                add_contribution(deltas, {**old, **record}, new_day=new_day)
+                if current.is_paid_leave:
+                    self.leave_employee_ids.add(employee_id)
+            if record['is_paid_leave']:
+                self.leave_employee_ids.add(employee_id)
+            month_key = (work_date.year, work_date.month)
+            self.affected[month_key].add(employee_id)
+            self.last_dates[month_key] = max(self.last_dates.get(month_key, work_date), work_date)
+
+        if inserts:
+            # 列の既定値を行ごとに評価しないよう、作成日時はバッチ単位でまとめて指定する
+            db.session.execute(insert(WorkingTimeRecord.__table__), inserts)
+        if updates:
+            db.session.execute(update(WorkingTimeRecord), updates)
+        apply_deltas(db.session.connection(), deltas)
+        db.session.commit()
+        self.counts['inserted'] += len(inserts)
+        self.counts['updated'] += len(updates)
+
+    def recompute(self):
+        """影響を受けた従業員・月の労働時間区分を再計算し、有給休暇台帳を作り直す
+
+        月末の勤怠は翌月初日を含む週の週40時間判定に影響するため、その場合は翌月も再計算する。
+        """
+        months = {key: set(ids) for key, ids in self.affected.items()}
+        for (year, month), last_date in self.last_dates.items():
+            _, next_start = month_range(year, month)
+            if last_date >= week_start(next_start):
+                months.setdefault((next_start.year, next_start.month), set()).update(self.affected[(year, month)])
+        for (year, month), employee_ids in sorted(months.items()):
+            recompute_company_month(self.company_id, year, month, employee_ids=sorted(employee_ids), commit=False)
+        if self.leave_employee_ids:
+            rebuild_allocations(db.session.connection(), self.leave_employee_ids)
+        db.session.commit()
+
+
+def ingest_attendance(company_id, stream, file_format, progress=None):
+    """CSV / JSON Lines の勤怠を一括取込し、件数・エラー・処理時間を dict で返す
+
+    progress を指定した場合は、バッチをコミットするたびに読み込んだ行数を渡して呼ぶ。
+
+    バッチごとにコミットするため、途中で失敗した場合もそれまでのバッチは取り込まれる
+    （労働時間区分は再取込か `flask worktime-recompute` で再計算する）。不正な行は読み飛ばして報告する。
+    """
+    started = time.perf_counter()
+    ingestion = _Ingestion(company_id)
+    batch = {}
+    try:
+        for line_number, values in iter_records(stream, file_format):
+            try:
+                code, record = parse_record(values)
+            except ValueError as e:
+                ingestion.error(line_number, str(e))
+                continue
+            ingestion.counts['rows'] += 1
+            key = (code, record['work_date'])
+            if key in batch:
+                ingestion.counts['duplicates'] += 1
+            batch[key] = (line_number, record)
+            if len(batch) >= BATCH_SIZE:
+                ingestion.write_batch(batch)
+                batch = {}
+                if progress:
+                    progress(ingestion.counts['rows'])
+        if batch:
+            ingestion.write_batch(batch)
+        ingestion.recompute()
+    except UnicodeDecodeError:
+        db.session.rollback()
+        raise AttendanceImportError('文字コードは UTF-8 にしてください。')
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if ingestion.affected:
+            invalidate_company(company_id)
+
+    elapsed = time.perf_counter() - started
+    return {
+        **ingestion.counts,
+        'skipped': ingestion.error_count,
+        'employees': len(set().union(*ingestion.affected.values())) if ingestion.affected else 0,
+        'months': len(ingestion.affected),
+        'elapsed_seconds': round(elapsed, 3),
+        'rows_per_second': round(ingestion.counts['rows'] / elapsed) if elapsed else 0,
+        'errors': [{'line': line_number, 'message': message} for line_number, message in sorted(ingestion.errors)],
+    }
@@ -0,0 +1,338 @@
+"""月次勤怠集計
+
+従業員・月ごとの勤怠合計（出勤日数・欠勤日数・有給取得日数・区分別時間）を AttendanceMonthly に保持する。
+WorkingTimeRecord の登録・更新・削除ではフラッシュ中に同じコネクションで差分を加算し、
+（出勤日数は同日の複数勤務を1日と数えるため、フラッシュの最後に日単位で判定する）
+ORM のイベントを経由しない一括更新の後は apply_deltas() か rebuild() で反映する。
+"""
+from collections import defaultdict
+from datetime import date
+from importlib import import_module
+from sqlalchemy import and_, case, delete, distinct, event, exists, extract, func, insert, or_, select, update
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import get_history
+from models import db, track_previous_values, AttendanceArchive, AttendanceMonthly, WorkingTimeRecord
+
+HOUR_FIELDS = (
+    'regular_hours', 'overtime_in_legal', 'overtime_out_legal',
+    'legal_holiday_hours', 'non_legal_holiday_hours', 'late_night_hours',
+)
+TOTAL_FIELDS = ('record_count', 'working_days', 'absent_days', 'paid_leave_days') + HOUR_FIELDS
+KEY_FIELDS = ('company_id', 'employee_id', 'work_date')
+SOURCE_FIELDS = KEY_FIELDS + ('start_time', 'is_absent', 'is_paid_leave', 'leave_days') + HOUR_FIELDS
+TOLERANCE = 1e-6
+_DAYS_KEY = 'attendance_rollup_days'
+
+_rollup = AttendanceMonthly.__table__
+_records = WorkingTimeRecord.__table__
+_archives = AttendanceArchive.__table__
+
+
+def record_leave_days(is_paid_leave, leave_days):
+    """勤怠1件の有給取得日数（日数未入力・0 の有給は1日とみなす）
+
+    月次勤怠集計（給与計算・給与明細）と有給休暇台帳（leave）はどちらもこの日数を使う。
+    SQL で集計する場合は record_leave_days_sql() を使う。
+    """
+    if not is_paid_leave:
+        return 0.0
+    return float(leave_days) if leave_days else 1.0
+
+
+def record_leave_days_sql(table):
+    """record_leave_days() と同じ日数を勤怠テーブルの列から求める SQL 式"""
+    days = case((or_(table.c.leave_days.is_(None), table.c.leave_days == 0), 1.0), else_=table.c.leave_days)
+    return case((table.c.is_paid_leave == True, days), else_=0.0)  # noqa: E712
+
+
+def _worked_sql(table):
+    """worked() と同じ判定を勤怠テーブルの列で行う SQL 式"""
+    return and_(table.c.start_time.is_not(None), or_(table.c.is_absent.is_(None), table.c.is_absent == False))  # noqa: E712
+
+
+def worked(values):
+    """勤怠1件が出勤（出勤時刻があり欠勤でない）か"""
+    return values['start_time'] is not None and not values['is_absent']
+
+
+def contribution(values, new_day=True):
+    """勤怠1件分が月次集計に加える値
+
+    出勤日数は日付単位で数える（同日の複数勤務は1日）。new_day=False は、同じ従業員・同じ日付に
+    出勤した別の勤怠があるため、この勤怠では出勤日数を増やさないことを表す。
+    """
+    return {
+        'record_count': 1,
+        'working_days': 1 if new_day and worked(values) else 0,
+        'absent_days': 1 if values['is_absent'] else 0,
+        'paid_leave_days': record_leave_days(values['is_paid_leave'], values['leave_days']),
+        **{field: values[field] or 0 for field in HOUR_FIELDS},
+    }
+
+
+def _key(values):
+    work_date = values['work_date']
+    return values['company_id'], values['employee_id'], work_date.year, work_date.month
+
+
+# =============================================================================
+# 差分の反映
+# =============================================================================
+
+def apply_deltas(connection, deltas):
+    """{(company_id, employee_id, year, month): {項目: 差分}} を集計表へ加算する
+
+    該当行がなければ差分をそのまま初期値として作成する。SQLite / PostgreSQL では
+    ON CONFLICT で加算するため、同時に同じ行を作ろうとしても一意制約違反にならない。
+    """
+    rows = [
+        {'company_id': company_id, 'employee_id': employee_id, 'year': year, 'month': month,
+         **{field: delta.get(field, 0) for field in TOTAL_FIELDS}}
+        for (company_id, employee_id, year, month), delta in deltas.items()
+        if any(delta.get(field) for field in TOTAL_FIELDS)
+    ]
+    if not rows:
+        return
+
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = import_module(f'sqlalchemy.dialects.{dialect}').insert(_rollup)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=[_rollup.c.company_id, _rollup.c.year, _rollup.c.month, _rollup.c.employee_id],
+            set_={field: _rollup.c[field] + stmt.excluded[field] for field in TOTAL_FIELDS},
+        ), rows)
+        return
+
+    for row in rows:
+        key = and_(*[_rollup.c[column] == row[column] for column in ('company_id', 'year', 'month', 'employee_id')])
+        if not connection.execute(
+            update(_rollup).where(key).values({field: _rollup.c[field] + row[field] for field in TOTAL_FIELDS})
+        ).rowcount:
+            connection.execute(insert(_rollup).values(row))
+
+
+def add_contribution(deltas, values, sign=1, new_day=True):
+    """勤怠1件（values）の寄与を sign 倍して deltas（defaultdict(dict)）に加える"""
+    delta = deltas[_key(values)]
+    for field, value in contribution(values, new_day).items():
+        delta[field] = delta.get(field, 0) + sign * value
+
+
+def _current_values(target):
+    return {field: getattr(target, field) for field in SOURCE_FIELDS}
+
+
+def _touch_day(target, values, before=False):
+    """出勤日数の再判定が必要な日（従業員・日付）をセッションに記録する
+
+    before=True の values は変更前の値で、その日に出勤していたかを覚えておく。
+    """
+    session = object_session(target)
+    if session is None:
+        return
+    key = (values['company_id'], values['employee_id'], values['work_date'])
+    day = session.info.setdefault(_DAYS_KEY, {}).setdefault(key, {'ids': set(), 'worked': False})
+    day['ids'].add(target.id)
+    if before and worked(values):
+        day['worked'] = True
+
+
+def _on_record_insert(mapper, connection, target):
+    values = _current_values(target)
+    deltas = defaultdict(dict)
+    add_contribution(deltas, values, new_day=False)
+    apply_deltas(connection, deltas)
+    _touch_day(target, values)
+
+
+def _on_record_update(mapper, connection, target):
+    histories = {field: get_history(target, field) for field in SOURCE_FIELDS}
+    if not any(history.has_changes() for history in histories.values()):
+        return
+    new = _current_values(target)
+    old = {field: history.deleted[0] if history.deleted else new[field] for field, history in histories.items()}
+    deltas = defaultdict(dict)
+    add_contribution(deltas, old, -1, new_day=False)
+    add_contribution(deltas, new, 1, new_day=False)
+    apply_deltas(connection, deltas)
+    _touch_day(target, old, before=True)
+    _touch_day(target, new)
+
+
+def _on_record_delete(mapper, connection, target):
+    values = _current_values(target)
+    deltas = defaultdict(dict)
+    add_contribution(deltas, values, -1, new_day=False)
+    apply_deltas(connection, deltas)
+    _touch_day(target, values, before=True)
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_working_days(session, flush_context):
+    """フラッシュで変わった日ごとに、出勤日数（日付単位）の増減を反映する
+
+    勤怠ごとの差分では同日の別の勤怠（同じフラッシュで登録したものを含む）を区別できないため、
+    全件の書き込みが終わってから日単位で「変更前に出勤していたか」「変更後に出勤しているか」を比べる。
+    変更前は、このフラッシュで変更していない勤怠と、変更した勤怠の変更前の値から判定する。
+    """
+    days = session.info.pop(_DAYS_KEY, None)
+    if not days:
+        return
+    connection = session.connection()
+    worked_ids = defaultdict(set)
+    for employee_id, work_date, record_id in connection.execute(
+        select(_records.c.employee_id, _records.c.work_date, _records.c.id).where(
+            _records.c.employee_id.in_({employee_id for _, employee_id, _ in days}),
+            _records.c.work_date.in_({work_date for _, _, work_date in days}),
+            _worked_sql(_records),
+        )
+    ):
+        worked_ids[(employee_id, work_date)].add(record_id)
+
+    deltas = defaultdict(dict)
+    for (company_id, employee_id, work_date), day in days.items():
+        ids = worked_ids[(employee_id, work_date)]
+        before = day['worked'] or bool(ids - day['ids'])
+        after = bool(ids)
+        if before != after:
+            key = _key({'company_id': company_id, 'employee_id': employee_id, 'work_date': work_date})
+            deltas[key]['working_days'] = deltas[key].get('working_days', 0) + (1 if after else -1)
+    apply_deltas(connection, deltas)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_days(session, previous_transaction):
+    session.info.pop(_DAYS_KEY, None)
+
+
+event.listen(WorkingTimeRecord, 'after_insert', _on_record_insert)
+event.listen(WorkingTimeRecord, 'after_update', _on_record_update)
+event.listen(WorkingTimeRecord, 'after_delete', _on_record_delete)
+# コミット後（属性が期限切れ）に代入した場合も変更前の値を読み込んで履歴に残す（差分の引き算に使う）
+track_previous_values(*[getattr(WorkingTimeRecord, field) for field in SOURCE_FIELDS])
+
+
+# =============================================================================
+# 再作成・検証
+# =============================================================================
+
+def _raw_totals(company_id=None, year=None, month=None, employee_ids=None, exclude_archived=False):
+    """勤怠記録から直接集計する SELECT（company_id, employee_id, year, month, 各合計）
+
+    exclude_archived=True ではアーカイブ済みの月（勤怠テーブルには有給休暇の取得日だけが残る）を除く。
+    """
+    wtr = _records
+    year_col = extract('year', wtr.c.work_date)
+    month_col = extract('month', wtr.c.work_date)
+    stmt = select(
+        wtr.c.company_id, wtr.c.employee_id, year_col.label('year'), month_col.label('month'),
+        func.count().label('record_count'),
+        func.count(distinct(case((_worked_sql(wtr), wtr.c.work_date)))).label('working_days'),
+        func.sum(case((wtr.c.is_absent == True, 1), else_=0)).label('absent_days'),  # noqa: E712
+        func.sum(record_leave_days_sql(wtr)).label('paid_leave_days'),
+        *[func.sum(func.coalesce(wtr.c[field], 0)).label(field) for field in HOUR_FIELDS],
+    ).group_by(wtr.c.company_id, wtr.c.employee_id, year_col, month_col)
+    if company_id is not None:
+        stmt = stmt.where(wtr.c.company_id == company_id)
+    if year is not None:
+        start, end = date(year, month, 1), date(year + month // 12, month % 12 + 1, 1)
+        stmt = stmt.where(wtr.c.work_date >= start, wtr.c.work_date < end)
+    if employee_ids is not None:
+        stmt = stmt.where(wtr.c.employee_id.in_(list(employee_ids)))
+    if exclude_archived:
+        stmt = stmt.where(~exists().where(
+            _archives.c.company_id == wtr.c.company_id, _archives.c.year == year_col, _archives.c.month == month_col,
+        ))
+    return stmt
+
+
+def _scope(stmt, company_id, year, month, employee_ids):
+    if company_id is not None:
+        stmt = stmt.where(_rollup.c.company_id == company_id)
+    if year is not None:
+        stmt = stmt.where(_rollup.c.year == year, _rollup.c.month == month)
+    if employee_ids is not None:
+        stmt = stmt.where(_rollup.c.employee_id.in_(list(employee_ids)))
+    return stmt
+
+
+def rebuild(connection, company_id=None, year=None, month=None, employee_ids=None, archives=True):
+    """範囲内（未指定なら全件）の集計を勤怠記録から作り直し、作成した行数を返す
+
+    アーカイブ済みの月はアーカイブファイルから作る（archives=False ではアーカイブを参照しない）。
+    """
+    from attendance_archive import archived_keys, archived_totals
+
+    connection.execute(_scope(delete(_rollup), company_id, year, month, employee_ids))
+    archived = archived_keys(connection, company_id, year, month) if archives else []
+    columns = ['company_id', 'employee_id', 'year', 'month', *TOTAL_FIELDS]
+    count = connection.execute(
+        insert(_rollup).from_select(columns, _raw_totals(company_id, year, month, employee_ids, bool(archived)))
+    ).rowcount
+    if archived:
+        rows = archived_totals(connection, company_id, year, month, employee_ids)
+        if rows:
+            connection.execute(insert(_rollup), rows)
+        count += len(rows)
+    return count
+
+
+def verify(connection, company_id=None, year=None, month=None):
+    """集計表と勤怠記録からの集計を突き合わせ、不一致を (キー, 項目, 期待値, 実際の値) のリストで返す
+
+    アーカイブ済みの月はアーカイブファイルから集計する。
+    """
+    from attendance_archive import archived_keys, archived_totals
+
+    archived = archived_keys(connection, company_id, year, month)
+    expected = {
+        tuple(row[:4]): row._asdict()
+        for row in connection.execute(_raw_totals(company_id, year, month, exclude_archived=bool(archived)))
+    }
+    if archived:
+        expected.update({
+            (row['company_id'], row['employee_id'], row['year'], row['month']): row
+            for row in archived_totals(connection, company_id, year, month)
+        })
+    actual = {
+        (row.company_id, row.employee_id, row.year, row.month): row._asdict()
+        for row in connection.execute(_scope(select(_rollup), company_id, year, month, None))
+    }
+    empty = dict.fromkeys(TOTAL_FIELDS, 0)
+    mismatches = []
+    for key in sorted(set(expected) | set(actual)):
+        want, got = expected.get(key, empty), actual.get(key, empty)
+        for field in TOTAL_FIELDS:
+            if abs((want[field] or 0) - (got[field] or 0)) > TOLERANCE:
+                mismatches.append((key, field, want[field], got[field]))
+    return mismatches
+
+
+# =============================================================================
+# 読み出し
+# =============================================================================
+
+def monthly_totals_statement(company_id, year, month):
+    return select(_rollup.c.employee_id, *[_rollup.c[field] for field in TOTAL_FIELDS]).where(
+        _rollup.c.company_id == company_id, _rollup.c.year == year, _rollup.c.month == month,
+    )
+
+
+def records_since_statement(company_id, year, month):
+    return select(func.coalesce(func.sum(_rollup.c.record_count), 0)).where(
+        _rollup.c.company_id == company_id,
+        or_(_rollup.c.year > year, and_(_rollup.c.year == year, _rollup.c.month >= month)),
+    )
+
+
+def monthly_totals(company_id, year, month):
+    """対象月の従業員ごとの勤怠合計 {employee_id: {項目: 値}}"""
+    return {
+        row.employee_id: row._asdict()
+        for row in db.session.execute(monthly_totals_statement(company_id, year, month))
+    }
+
+
+def records_since(company_id, year, month):
+    """対象月以降の勤怠記録件数"""
+    return db.session.execute(records_since_statement(company_id, year, month)).scalar()
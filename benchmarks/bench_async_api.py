@@ -0,0 +1,129 @@
+"""読み出し専用 API（非同期エンジン）と既存の同期ビューの比較
+
+gunicorn（既定は1ワーカー）を起動し、同時接続数ごとに次の組み合わせへ一定時間リクエストを送り続けて
+p50 / p99 レイテンシと req/s を比べる。
+
+- ダッシュボード: /company/dashboard（同期・HTML） / /api/read/dashboard（非同期・JSON）
+- 従業員一覧: /api/employees（同期） / /api/read/employees（非同期）
+
+同期側は契約・件数をプロセス内キャッシュから返すため、キャッシュを無効にした条件
+（COUNTER_CACHE_TTL=0 / ENTITLEMENT_CACHE_TTL=0）でも計測する。
+
+    python benchmarks/bench_async_api.py [--workers 1] [--concurrency 1,8,32] [--seconds 5] [--employees 2000]
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+
+from common import setup_app, seed_company
+from loadtest import free_port, login, start_server
+
+# 同時接続数の分だけ同じIPアドレスからログインするため、IPアドレスごとの試行制限を外す
+os.environ.setdefault('LOGIN_THROTTLE_IP', '0')
+
+PASSWORD = 'async-password'
+PAIRS = [
+    ('ダッシュボード', '/company/dashboard', '/api/read/dashboard'),
+    ('従業員一覧', '/api/employees', '/api/read/employees'),
+]
+CACHE_SCENARIOS = [
+    ('キャッシュあり', {}),
+    ('キャッシュなし', {'COUNTER_CACHE_TTL': '0', 'ENTITLEMENT_CACHE_TTL': '0'}),
+]
+
+
+def prepare_database(n_employees):
+    """計測用データを投入し、DATABASE_URL を返す"""
+    app = setup_app()
+    from models import db, User
+    from passwords import hash_password
+
+    with app.app_context():
+        company_id = seed_company('ASYNC', n_employees, 2026, 9)
+        db.session.add(User(email='async-admin@example.com', password=hash_password(PASSWORD),
+                            role='company_admin', company_id=company_id))
+        db.session.commit()
+    return os.environ['DATABASE_URL']
+
+
+def hammer(openers, url, seconds):
+    """openers の数だけスレッドを立てて url を取得し続け、応答時間（秒）のリストとエラー件数を返す"""
+    stop = threading.Event()
+    latencies, errors = [], []
+
+    def client(opener):
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                opener.open(url, timeout=30).read()
+                latencies.append(time.perf_counter() - started)
+            except OSError:
+                errors.append(1)
+
+    threads = [threading.Thread(target=client, args=(opener,)) for opener in openers]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), len(errors)
+
+
+def summarize(latencies, seconds):
+    if not latencies:
+        return 0, 0, 0
+    return (statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.99)] * 1000,
+            len(latencies) / seconds)
+
+
+def run(database_url, args, overrides):
+    saved = {name: os.environ.get(name) for name in overrides}
+    os.environ.update(overrides, JOB_WORKERS='0')
+    port = free_port()
+    server = start_server(database_url, args.workers, port)
+    base_url = f'http://127.0.0.1:{port}'
+    results = []
+    try:
+        openers = [login(base_url, 'async-admin@example.com', PASSWORD) for _ in range(max(args.concurrency))]
+        for label, sync_route, async_route in PAIRS:
+            for route in (sync_route, async_route):
+                # 接続プール・テンプレートを温めてから計測する
+                hammer(openers[:1], f'{base_url}{route}', 0.5)
+            for concurrency in args.concurrency:
+                for kind, route in (('同期', sync_route), ('非同期', async_route)):
+                    latencies, errors = hammer(openers[:concurrency], f'{base_url}{route}', args.seconds)
+                    results.append((label, concurrency, kind, route, *summarize(latencies, args.seconds), errors))
+    finally:
+        server.terminate()
+        server.wait()
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='非同期の読み出し専用 API と同期ビューを比較する')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn のワーカー数')
+    parser.add_argument('--concurrency', default='1,8,32', help='同時接続数（カンマ区切り）')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--employees', type=int, default=2000, help='計測用企業の従業員数')
+    args = parser.parse_args()
+    args.concurrency = [int(value) for value in args.concurrency.split(',')]
+
+    database_url = prepare_database(args.employees)
+    print(f'ワーカー {args.workers} / 従業員 {args.employees}名 / 各{args.seconds:g}秒')
+    for scenario, overrides in CACHE_SCENARIOS:
+        print(f"\n[{scenario}]\n{'対象':<10} {'同時接続':>6} {'':<4} {'ルート':<22} {'p50(ms)':>8} {'p99(ms)':>8} {'req/s':>7}")
+        for label, concurrency, kind, route, p50, p99, rps, errors in run(database_url, args, overrides):
+            print(f'{label:<10} {concurrency:>6} {kind:<4} {route:<22} {p50:>8.1f} {p99:>8.1f} {rps:>7.1f}'
+                  + (f'（エラー {errors}件）' if errors else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""勤怠アーカイブのベンチマーク
+
+従業員 n 名・2か月分（8月・9月の平日）の勤怠を持つ企業を作り、8月の給与計算のあと次を計測する。
+
+- 8月のアーカイブ（flask attendance-archive と同じ）の所要時間と、勤怠テーブルの行数・ファイルサイズ
+- 締めた月の読み出し: 勤怠テーブルからの読み出し（アーカイブ前）とファイルからの読み出し（ArchiveFile.records）、
+  時間外労働の合計（SQL の SUM とファイルの列の sum）
+- 締めていない月（9月）の勤怠の読み出し: アーカイブの前後
+
+    python benchmarks/bench_attendance_archive.py [従業員数 ...]
+"""
+import os
+import sys
+import tempfile
+from datetime import date, time, timedelta
+
+from common import setup_app, seed_company, Timer
+
+SIZES = [100, 1000]
+READS = 20
+YEAR = 2026
+
+
+def add_month(company_id, month):
+    """企業の全従業員に対象月の平日分の勤怠を追加する"""
+    from sqlalchemy import insert, select
+    from models import db, Employee, WorkingTimeRecord
+
+    employee_ids = db.session.execute(select(Employee.id).where(Employee.company_id == company_id)).scalars().all()
+    day = date(YEAR, month, 1)
+    rows = []
+    while day.month == month:
+        if day.weekday() < 5:
+            rows.extend({
+                'company_id': company_id, 'employee_id': employee_id, 'work_date': day,
+                'start_time': time(9, 0), 'end_time': time(18 + employee_id % 3, 0), 'break_minutes': 60,
+            } for employee_id in employee_ids)
+        day += timedelta(days=1)
+    db.session.execute(insert(WorkingTimeRecord), rows)
+    db.session.commit()
+
+
+def live_month(company_id, month):
+    from sqlalchemy import select
+    from models import db, WorkingTimeRecord
+
+    return db.session.execute(select(WorkingTimeRecord.__table__).where(
+        WorkingTimeRecord.company_id == company_id,
+        WorkingTimeRecord.work_date >= date(YEAR, month, 1),
+        WorkingTimeRecord.work_date < date(YEAR, month + 1, 1),
+    )).all()
+
+
+def live_overtime(company_id, month):
+    from sqlalchemy import func, select
+    from models import db, WorkingTimeRecord
+
+    return db.session.execute(select(func.sum(WorkingTimeRecord.overtime_out_legal)).where(
+        WorkingTimeRecord.company_id == company_id,
+        WorkingTimeRecord.work_date >= date(YEAR, month, 1),
+        WorkingTimeRecord.work_date < date(YEAR, month + 1, 1),
+    )).scalar()
+
+
+def timed(read):
+    read()
+    with Timer() as timer:
+        for _ in range(READS):
+            result = read()
+    return timer.elapsed / READS * 1000, result
+
+
+def main(sizes):
+    os.environ.setdefault('ATTENDANCE_ARCHIVE_DIR', tempfile.mkdtemp(prefix='bench-archive-'))
+    app = setup_app()
+    from sqlalchemy import func, select
+    from attendance_archive import ArchiveFile, archive_month, archive_path
+    from models import db, WorkingTimeRecord
+    from payroll import run_company_payroll
+    from worktime import recompute_company_month
+
+    print(f"{'従業員数':>8} {'アーカイブ(秒)':>14} {'勤怠行数(前→後)':>18} {'ファイル(KB)':>12} "
+          f"{'締め月 DB(ms)':>13} {'締め月 ファイル(ms)':>19} {'合計 DB(ms)':>11} {'合計 ファイル(ms)':>17} "
+          f"{'9月 前(ms)':>10} {'9月 後(ms)':>10}")
+    for n in sizes:
+        with app.app_context():
+            company_id = seed_company(f'ARC{n}', n, YEAR, 8)
+            add_month(company_id, 9)
+            recompute_company_month(company_id, YEAR, 8)
+            recompute_company_month(company_id, YEAR, 9)
+            run_company_payroll(company_id, YEAR, 8)
+
+            count = select(func.count()).select_from(WorkingTimeRecord).where(WorkingTimeRecord.company_id == company_id)
+            rows_before = db.session.execute(count).scalar()
+            db_read, _ = timed(lambda: live_month(company_id, 8))
+            db_sum, expected = timed(lambda: live_overtime(company_id, 8))
+            open_before, _ = timed(lambda: live_month(company_id, 9))
+
+            with Timer() as archive:
+                result = archive_month(company_id, YEAR, 8)
+            rows_after = db.session.execute(count).scalar()
+            open_after, _ = timed(lambda: live_month(company_id, 9))
+
+            with ArchiveFile(archive_path(company_id, YEAR)) as archived:
+                file_read, _ = timed(lambda: list(archived.records(8)))
+                file_sum, total = timed(lambda: sum(archived.column('overtime_out_legal', 8)))
+            assert abs((expected or 0) - total) < 1e-6, (expected, total)
+        print(f"{n:>8,} {archive.elapsed:>14.2f} {rows_before:>8,} → {rows_after:>7,} {result['bytes'] / 1024:>12.0f} "
+              f"{db_read:>13.2f} {file_read:>19.2f} {db_sum:>11.2f} {file_sum:>17.2f} "
+              f"{open_before:>10.2f} {open_after:>10.2f}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,78 @@
+"""勤怠一括取込のベンチマーク
+
+行数ごとに CSV / JSON Lines の勤怠ファイルを一時ファイルへ書き出し、取込の行/秒を計測する。
+最大常駐メモリ（ru_maxrss）を行数の小さい順に表示するので、行数を増やしても増えないことを確認できる。
+--memory を付けると tracemalloc で取込中のピークメモリも計測する（計測負荷で処理時間は数倍になる）。
+
+    python benchmarks/bench_attendance_ingest.py [--memory] [--format csv|jsonl] [行数 ...]
+"""
+import csv
+import json
+import resource
+import sys
+import tempfile
+import tracemalloc
+from datetime import date, timedelta
+
+from common import setup_app, seed_company, Timer
+
+SIZES = [10000, 100000]
+EMPLOYEES = 2000
+
+
+def write_file(n, file_format, company_code):
+    """n 行の勤怠ファイル（従業員 EMPLOYEES 名 × 日数、日付順）を一時ファイルに書き出す"""
+    output = tempfile.TemporaryFile('w+b')
+    start = date(2025, 1, 1)
+    with open(output.fileno(), 'w', encoding='utf-8', newline='', closefd=False) as text:
+        writer = csv.writer(text)
+        if file_format == 'csv':
+            writer.writerow(['社員番号', '日付', '出勤時刻', '退勤時刻', '休憩時間（分）', '有給休暇', '有給取得日数'])
+        for i in range(n):
+            day, employee = divmod(i, EMPLOYEES)
+            work_date = (start + timedelta(days=day)).isoformat()
+            code = f'{company_code}-{employee:05d}'
+            paid_leave = (i % 97 == 0)
+            if file_format == 'csv':
+                writer.writerow([code, work_date, '' if paid_leave else '09:00', '' if paid_leave else f'{18 + i % 3}:00',
+                                 60, 1 if paid_leave else '', 1 if paid_leave else ''])
+            else:
+                item = {'employee_code': code, 'work_date': work_date}
+                if paid_leave:
+                    item.update(is_paid_leave=True, leave_days=1)
+                else:
+                    item.update(start_time='09:00', end_time=f'{18 + i % 3}:00', break_minutes=60)
+                text.write(json.dumps(item) + '\n')
+    output.seek(0)
+    return output
+
+
+def main(sizes, file_format, trace_memory):
+    app = setup_app()
+    from attendance_io import ingest_attendance
+
+    print(f"{'行数':>9} {'形式':>5} {'取込(s)':>9} {'行/秒':>9} {'ピークMB':>9} {'最大RSS MB':>11}")
+    with app.app_context():
+        for n in sorted(sizes):
+            company_code = f'ING{n}'
+            company_id = seed_company(company_code, EMPLOYEES, 2024, 12)
+            stream = write_file(n, file_format, company_code)
+            if trace_memory:
+                tracemalloc.start()
+            with Timer() as timer:
+                result = ingest_attendance(company_id, stream, file_format)
+            peak = 0
+            if trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            stream.close()
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(f'{n:>9} {file_format:>5} {timer.elapsed:>9.2f} {result["rows"] / timer.elapsed:>9.0f} '
+                  f'{peak / 1024 / 1024:>9.1f} {max_rss:>11.1f}')
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    file_format = 'jsonl' if '--format' in args and args[args.index('--format') + 1] == 'jsonl' else 'csv'
+    numbers = [int(arg) for arg in args if arg.isdigit()]
+    main(numbers or SIZES, file_format, '--memory' in args)
@@ -0,0 +1,56 @@
+"""月次締めの並列度ごとの所要時間
+
+従業員数にばらつきのある企業を作成し、並列プロセス数を 1 から N まで変えて
+全企業の月次締め（労働時間区分の再計算と給与計算）の所要時間を計測する。
+
+    python benchmarks/bench_close_month.py [最大プロセス数] [--companies 40] [--employees 3000]
+"""
+import argparse
+import os
+from datetime import date
+
+from common import setup_app, seed_company, Timer
+
+# seed_company の契約は今日から始まるため、締めの対象は今月とする
+YEAR, MONTH = date.today().year, date.today().month
+
+
+def company_sizes(companies, employees):
+    """合計が約 employees 名になる、大小の差が大きい企業規模の一覧"""
+    weights = [1 / (rank + 1) for rank in range(companies)]
+    scale = employees / sum(weights)
+    return [max(1, round(weight * scale)) for weight in weights]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('max_workers', nargs='?', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--companies', type=int, default=40)
+    parser.add_argument('--employees', type=int, default=3000)
+    args = parser.parse_args()
+
+    app = setup_app()
+    from payroll_close import close_month
+
+    with app.app_context():
+        sizes = company_sizes(args.companies, args.employees)
+        for index, size in enumerate(sizes):
+            seed_company(f'CLOSE{index:03d}', size, YEAR, MONTH)
+        print(f'企業数 {len(sizes)} / 従業員数 {sum(sizes)}（最大 {max(sizes)} 名） / CPU {os.cpu_count()}')
+
+        # 初回は給与計算結果の新規作成になるため、計測前に1回締めておく
+        close_month(YEAR, MONTH, workers=1)
+
+        print(f"{'プロセス数':>10} {'所要時間(s)':>12} {'速度比':>8} {'最大グループ比':>14}")
+        baseline = None
+        for workers in range(1, args.max_workers + 1):
+            with Timer() as timer:
+                result = close_month(YEAR, MONTH, workers=workers)
+            assert result['failed'] == 0, [item for item in result['results'] if item['error']]
+            baseline = baseline or timer.elapsed
+            balance = max(result['groups']) / (sum(result['groups']) / len(result['groups']))
+            print(f'{workers:>10} {timer.elapsed:>12.2f} {baseline / timer.elapsed:>8.2f} {balance:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
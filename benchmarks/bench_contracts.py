@@ -0,0 +1,92 @@
+"""契約の期限処理と期限間近の一覧のベンチマーク
+
+企業と契約を n 社分（期限は基準日の 60日前〜400日後に分散、半数が自動更新）投入し、次を計測する。
+
+- 期限処理（flask contracts-tick と同じ）: 期限切れの契約がある状態での1回目と、処理済みの状態での2回目
+- SaaS管理者ダッシュボードの期限間近の一覧: 従来の範囲検索（Contract + Company + Plan の JOIN）と
+  作成済みの一覧（contracts.expiring_soon）の1回あたりの時間
+
+    python benchmarks/bench_contracts.py [企業数 ...]
+"""
+import sys
+from datetime import date, timedelta
+
+from common import setup_app, Timer
+
+SIZES = [1000, 10000]
+READS = 200
+
+
+def seed_contracts(n, today):
+    """n 社分の企業と契約を投入する"""
+    from sqlalchemy import insert, select
+    from models import db, Company, Contract, Plan
+
+    plan_id = db.session.execute(select(Plan.id)).scalar()
+    if plan_id is None:
+        plan = Plan(plan_name='bench', display_name='ベンチマーク', max_employees=100, monthly_fee=0, yearly_fee=0)
+        db.session.add(plan)
+        db.session.flush()
+        plan_id = plan.id
+    start = db.session.execute(select(Company.id).order_by(Company.id.desc())).scalar() or 0
+    db.session.execute(insert(Company), [
+        {'company_code': f'CT{start + i:06d}', 'company_name': f'契約 {start + i} 株式会社', 'is_active': True}
+        for i in range(n)
+    ])
+    company_ids = db.session.execute(select(Company.id).where(Company.id > start).order_by(Company.id)).scalars().all()
+    contracts = []
+    for i, company_id in enumerate(company_ids):
+        end_date = today + timedelta(days=i % 460 - 60)
+        contracts.append({
+            'company_id': company_id, 'plan_id': plan_id, 'start_date': end_date - timedelta(days=30),
+            'end_date': end_date, 'is_active': True, 'monthly_fee': 0, 'billing_cycle': 'monthly',
+            'auto_renew': i % 2 == 0,
+        })
+    db.session.execute(insert(Contract), contracts)
+    db.session.commit()
+
+
+def range_scan(today):
+    """従来のダッシュボードと同じ範囲検索"""
+    from sqlalchemy.orm import joinedload
+    from models import Contract
+
+    return Contract.query.options(joinedload(Contract.company), joinedload(Contract.plan)).filter(
+        Contract.is_active == True,  # noqa: E712
+        Contract.end_date >= today,
+        Contract.end_date <= today + timedelta(days=30),
+    ).order_by(Contract.end_date).all()
+
+
+def main(sizes):
+    app = setup_app()
+    from models import db
+    from contracts import expiring_soon, tick
+
+    today = date.today()
+    print(f"{'企業数':>8} {'期限処理(1回目)':>16} {'更新':>6} {'失効':>6} {'期限処理(2回目)':>16} "
+          f"{'範囲検索(ms)':>12} {'作成済み一覧(ms)':>16} {'件数':>6}")
+    total = 0
+    for n in sizes:
+        with app.app_context():
+            seed_contracts(n - total, today)
+            total = n
+            with Timer() as first:
+                result = tick(today)
+            with Timer() as second:
+                tick(today)
+
+            timings = {}
+            for label, read in (('range', lambda: range_scan(today)), ('snapshot', lambda: expiring_soon(today))):
+                read()
+                with Timer() as timer:
+                    for _ in range(READS):
+                        rows = read()
+                        db.session.expunge_all()
+                timings[label] = timer.elapsed / READS * 1000
+        print(f"{n:>8,} {first.elapsed:>15.2f}秒 {result['renewed']:>6} {result['deactivated']:>6} "
+              f"{second.elapsed:>15.2f}秒 {timings['range']:>12.2f} {timings['snapshot']:>16.2f} {len(rows):>6}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,74 @@
+"""従業員一括インポート・エクスポートのベンチマーク
+
+行数ごとに CSV / Excel の取り込み・書き出し時間を計測する。
+--memory を付けると tracemalloc でピークメモリも計測する（計測負荷で処理時間は数倍になる）。
+
+    python benchmarks/bench_employee_io.py [--memory] [行数 ...]
+"""
+import csv
+import io
+import sys
+import tracemalloc
+from datetime import date
+
+from common import setup_app, seed_company, Timer
+
+SIZES = [10000, 50000]
+
+
+def build_csv(n):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['社員番号', '氏名', 'フリガナ', '部署', '雇用形態', '入社日', '給与形態', '基本給', '通勤手当'])
+    for i in range(n):
+        writer.writerow([f'IMP{i:06d}', f'社員 {i}', 'シャイン', '営業部', '正社員',
+                         date(2020, 4, 1).isoformat(), 'monthly', 250000, 10000])
+    return buffer.getvalue().encode('utf-8')
+
+
+def build_xlsx(n):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in csv.reader(io.StringIO(build_csv(n).decode('utf-8'))):
+        sheet.append(row)
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def measure(func, trace_memory):
+    if trace_memory:
+        tracemalloc.start()
+    with Timer() as timer:
+        result = func()
+    peak = 0
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, timer.elapsed, peak / 1024 / 1024
+
+
+def main(sizes, trace_memory):
+    app = setup_app()
+    from employee_io import import_employees, export_csv, export_xlsx
+
+    print(f"{'行数':>8} {'形式':>5} {'取込(s)':>9} {'取込MB':>8} {'出力(s)':>9} {'出力MB':>8}")
+    with app.app_context():
+        for n in sizes:
+            for kind, build in (('csv', build_csv), ('xlsx', build_xlsx)):
+                data = build(n)
+                company_id = seed_company(f'IO{kind}{n}', 0, 2026, 9)
+                _, import_time, import_peak = measure(
+                    lambda: import_employees(company_id, io.BytesIO(data), f'employees.{kind}'), trace_memory)
+                exporter = export_csv if kind == 'csv' else export_xlsx
+                _, export_time, export_peak = measure(
+                    lambda: sum(len(chunk) for chunk in exporter(company_id)), trace_memory)
+                print(f'{n:>8} {kind:>5} {import_time:>9.2f} {import_peak:>8.1f} '
+                      f'{export_time:>9.2f} {export_peak:>8.1f}')
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main([int(arg) for arg in args if arg != '--memory'] or SIZES, '--memory' in args)
@@ -0,0 +1,146 @@
+"""ログイン集中時の他ルートへの影響
+
+gunicorn（既定は1ワーカー）を起動し、ログイン済みのクライアントが /company/dashboard と /employees を
+繰り返し取得している間に、別のスレッドから誤ったパスワードでのログインを大量に送る。
+次の3通りでダッシュボード側の p50 / p99 と処理件数、ログイン側の応答（429 / 503）の件数を比べる。
+
+- ログインなし: 比較用
+- 対策なし: ハッシュ計算をリクエストのスレッドで行い、試行回数を制限しない（PASSWORD_HASH_WORKERS=0）
+- 既定: ハッシュ計算用スレッドの制限 + メールアドレス・IPアドレスごとの試行回数の制限
+
+攻撃側は X-Forwarded-For でスレッドごとに異なるIPアドレスを名乗る（PROXY_COUNT=1 で起動する）。
+
+    python benchmarks/bench_login_storm.py [--workers 1] [--clients 4] [--attackers 16] [--seconds 10]
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+
+from common import setup_app, seed_company
+from loadtest import free_port, login, start_server
+
+PASSWORD = 'storm-password'
+ROUTES = ['/company/dashboard', '/employees']
+SCENARIOS = [
+    ('ログインなし', {}, False),
+    ('対策なし', {'PASSWORD_HASH_WORKERS': '0', 'LOGIN_THROTTLE_EMAIL': '0', 'LOGIN_THROTTLE_IP': '0'}, True),
+    ('既定（ハッシュ計算の制限 + 試行制限）', {}, True),
+]
+
+
+def prepare_database():
+    """計測用データを投入し、DATABASE_URL を返す"""
+    app = setup_app()
+    from models import db, User
+    from passwords import hash_password
+
+    with app.app_context():
+        company_id = seed_company('STORM', 100, 2026, 9)
+        db.session.add_all([
+            User(email='storm-admin@example.com', password=hash_password(PASSWORD), role='company_admin',
+                 company_id=company_id),
+            *[User(email=f'storm{n}@example.com', password=hash_password(PASSWORD), role='company_admin',
+                   company_id=company_id) for n in range(20)],
+        ])
+        db.session.commit()
+    return os.environ['DATABASE_URL']
+
+
+def browse(opener, base_url, stop, latencies, counter):
+    """ログイン済みクライアントとして ROUTES を順に取得し続ける"""
+    while not stop.is_set():
+        for route in ROUTES:
+            started = time.perf_counter()
+            try:
+                opener.open(f'{base_url}{route}', timeout=30).read()
+                latencies.append(time.perf_counter() - started)
+                counter['ok'] += 1
+            except OSError:
+                counter['error'] += 1
+
+
+def attack(base_url, number, stop, statuses):
+    """異なるIPアドレスから、実在するメールアドレスに誤ったパスワードでログインを試み続ける"""
+    headers = {'X-Forwarded-For': f'203.0.113.{number % 250 + 1}'}
+    attempt = 0
+    while not stop.is_set():
+        data = urllib.parse.urlencode({'email': f'storm{attempt % 20}@example.com', 'password': 'wrong'}).encode()
+        request = urllib.request.Request(f'{base_url}/login', data=data, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                statuses[response.status] += 1
+        except urllib.error.HTTPError as e:
+            statuses[e.code] += 1
+        except OSError:
+            statuses['error'] += 1
+        attempt += 1
+
+
+def run(database_url, args, overrides, storm):
+    saved = {name: os.environ.get(name) for name in overrides}
+    os.environ.update(overrides, PROXY_COUNT='1', JOB_WORKERS='0')
+    port = free_port()
+    server = start_server(database_url, args.workers, port)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        stop = threading.Event()
+        latencies, counter, statuses = [], Counter(), Counter()
+        # 計測側のクライアントはログインを集中させる前にログインしておく
+        openers = [login(base_url, 'storm-admin@example.com', PASSWORD) for _ in range(args.clients)]
+        threads = [threading.Thread(target=browse, args=(opener, base_url, stop, latencies, counter))
+                   for opener in openers]
+        if storm:
+            threads += [threading.Thread(target=attack, args=(base_url, n, stop, statuses))
+                        for n in range(args.attackers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait()
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    latencies.sort()
+    return {
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else 0,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0,
+        'rps': counter['ok'] / args.seconds,
+        'errors': counter['error'],
+        'logins': sum(statuses.values()) / args.seconds,
+        'statuses': statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ログイン集中時のダッシュボードのレイテンシを計測する')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn のワーカー数')
+    parser.add_argument('--clients', type=int, default=4, help='ダッシュボードを取得するクライアント数')
+    parser.add_argument('--attackers', type=int, default=16, help='ログインを送るスレッド数')
+    parser.add_argument('--seconds', type=int, default=10)
+    args = parser.parse_args()
+
+    database_url = prepare_database()
+    print(f'ワーカー {args.workers} / クライアント {args.clients} / ログイン送信 {args.attackers}スレッド / {args.seconds}秒')
+    print(f"{'条件':<28} {'p50(ms)':>8} {'p99(ms)':>8} {'req/s':>7} {'ログイン/s':>10}  ログインの応答")
+    for name, overrides, storm in SCENARIOS:
+        result = run(database_url, args, overrides, storm)
+        statuses = ' '.join(f'{status}:{count}' for status, count in sorted(result['statuses'].items(), key=str))
+        print(f"{name:<28} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['rps']:>7.1f} "
+              f"{result['logins']:>10.1f}  {statuses or '-'}"
+              + (f"（エラー {result['errors']}件）" if result['errors'] else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""給与計算バッチのベンチマーク
+
+従業員数ごとに1社分の月次給与計算（新規作成・再計算）の所要時間を計測する。
+
+    python benchmarks/bench_payroll.py [従業員数 ...]
+"""
+import sys
+
+from common import setup_app, seed_company, Timer
+
+SIZES = [10, 50, 200, 2000]
+YEAR, MONTH = 2026, 9
+
+
+def main(sizes):
+    app = setup_app()
+    from models import db
+    from payroll import run_company_payroll
+
+    print(f"{'従業員数':>8} {'新規(ms)':>10} {'再計算(ms)':>12} {'ms/人':>8}")
+    with app.app_context():
+        for n in sizes:
+            company_id = seed_company(f'BENCH{n}', n, YEAR, MONTH)
+            db.session.expire_all()
+            with Timer() as first:
+                run_company_payroll(company_id, YEAR, MONTH)
+            with Timer() as second:
+                run_company_payroll(company_id, YEAR, MONTH)
+            print(f'{n:>8} {first.elapsed * 1000:>10.1f} {second.elapsed * 1000:>12.1f} '
+                  f'{second.elapsed * 1000 / n:>8.3f}')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,40 @@
+"""給与明細発行のベンチマーク
+
+従業員数ごとに1社分の給与明細（ZIP・1つのブック）を作成し、所要時間と1名あたりの時間を計測する。
+1名あたりの時間がほぼ一定であれば、作成時間は従業員数に比例している。
+
+    python benchmarks/bench_payslip.py [従業員数 ...]
+"""
+import sys
+
+from common import setup_app, seed_company, Timer
+
+SIZES = [100, 500, 2000]
+YEAR, MONTH = 2026, 9
+
+
+def consume(chunks):
+    """ストリームを読み捨て、合計バイト数を返す"""
+    return sum(len(chunk) for chunk in chunks)
+
+
+def main(sizes):
+    app = setup_app()
+    from payroll import run_company_payroll
+    from payslip import payslips_workbook, payslips_zip
+
+    print(f"{'従業員数':>8} {'ZIP(s)':>8} {'ms/人':>8} {'ブック(s)':>10} {'ms/人':>8} {'ZIP(MB)':>8}")
+    with app.app_context():
+        for n in sizes:
+            company_id = seed_company(f'SLIP{n}', n, YEAR, MONTH)
+            run_company_payroll(company_id, YEAR, MONTH)
+            with Timer() as zip_timer:
+                size = consume(payslips_zip(company_id, YEAR, MONTH))
+            with Timer() as book_timer:
+                consume(payslips_workbook(company_id, YEAR, MONTH))
+            print(f'{n:>8} {zip_timer.elapsed:>8.2f} {zip_timer.elapsed * 1000 / n:>8.2f} '
+                  f'{book_timer.elapsed:>10.2f} {book_timer.elapsed * 1000 / n:>8.2f} {size / 1e6:>8.1f}')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,228 @@
+"""全ルートのベンチマーク（基準値との比較）
+
+seed.py で作成したデータに対し、app.py の GET ルートとログインを Flask テストクライアントで呼び出して、
+レイテンシ（p50 / p95）・1リクエストあたりのクエリ数・ピークメモリ（tracemalloc）を計測する。
+基準値（baselines.json）と比べて次のいずれかに当てはまるルートがあれば一覧を表示して終了コード1で終わる。
+
+- p50 が基準値の (1 + --tolerance) 倍を超え、かつ MIN_LATENCY_DELTA_MS 以上遅い
+- クエリ数が基準値より多い
+- ピークメモリが基準値の (1 + --memory-tolerance) 倍を超え、かつ MIN_MEMORY_DELTA_KB 以上多い
+
+    python benchmarks/bench_routes.py [--repeat 20] [--update] [--only employees,saas_companies]
+
+基準値はマシンに依存するため、計測環境を変えたら --update で作り直す。
+データ規模（--companies / --fill / --days）が基準値の作成時と異なる場合は比較しない。
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault('JOB_WORKERS', '0')
+# ログインを繰り返し計測するため、IPアドレスごとの試行制限を外す
+os.environ.setdefault('LOGIN_THROTTLE_IP', '0')
+
+from common import setup_app  # noqa: E402
+from seed import PASSWORD, seed  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+MIN_LATENCY_DELTA_MS = 2.0
+MIN_MEMORY_DELTA_KB = 256
+LOGIN = 'login (POST)'
+
+# 計測しないエンドポイント（ログアウト・静的ファイル・事前にファイルが必要なダウンロード）
+SKIP_ENDPOINTS = {'static', 'logout', 'download_job', 'saas_metrics_profile'}
+# ルートごとの期待するステータス（既定は200）
+EXPECTED_STATUS = {'index': 302}
+# ルートごとのクエリ文字列
+QUERY_STRINGS = {
+    'export_employees': {'format': 'csv'},
+    'download_payslips': {'format': 'xlsx'},
+    'api_employees': {'limit': 50},
+}
+
+
+def prepare(args):
+    """データを投入し、計測に使う ID とログイン情報を返す"""
+    app = setup_app(args.database_url)
+    from models import db, Job, Employee
+    from payroll import run_company_payroll
+
+    with app.app_context():
+        summary = seed(args.companies, args.fill, args.days)
+        # 最大規模の企業を企業管理者側の計測対象にする
+        company = max(summary['companies'], key=lambda item: item['employees'])
+        year, month = summary['end'].year, summary['end'].month
+        run_company_payroll(company['company_id'], year, month)
+        employee = Employee.query.filter_by(company_id=company['company_id']).order_by(Employee.id).first()
+        job = Job(company_id=company['company_id'], kind='payroll', params=json.dumps({'year': year, 'month': month}),
+                  status='succeeded')
+        db.session.add(job)
+        db.session.commit()
+        context = {
+            'company': company,
+            'url_args': {'employee_id': employee.id, 'company_id': company['company_id'],
+                         'plan_id': 1, 'job_id': job.id},
+            'year': year,
+            'month': month,
+        }
+    return app, summary, context
+
+
+def routes(app, context):
+    """(名前, ロール, パス) の一覧。ルートが追加されれば自動的に対象になる"""
+    from flask import url_for
+
+    items = []
+    with app.test_request_context():
+        for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+            if rule.endpoint in SKIP_ENDPOINTS or 'GET' not in rule.methods:
+                continue
+            values = {name: context['url_args'][name] for name in rule.arguments}
+            values.update(QUERY_STRINGS.get(rule.endpoint, {}))
+            if rule.endpoint == 'download_payslips':
+                values.update(year=context['year'], month=context['month'])
+            if rule.endpoint == 'login':
+                role = 'anonymous'
+            else:
+                role = 'saas' if rule.endpoint.startswith('saas_') else 'company'
+            items.append((rule.endpoint, role, url_for(rule.endpoint, **values)))
+    return items
+
+
+def login(client, email):
+    response = client.post('/login', data={'email': email, 'password': PASSWORD})
+    assert response.status_code == 302 and '/login' not in response.headers['Location'], f'{email} でログインできません'
+
+
+def measure(call, repeat, queries):
+    """call() を repeat 回実行し、p50 / p95（ms）・クエリ数（中央値）・ピークメモリ（KB）を返す"""
+    call()
+    call()
+    latencies, counts = [], []
+    for _ in range(repeat):
+        queries[0] = 0
+        started = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - started) * 1000)
+        counts.append(queries[0])
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    latencies.sort()
+    return {
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+        'queries': int(statistics.median(counts)),
+        'peak_kb': round(peak / 1024),
+    }
+
+
+def compare(name, result, baseline, args):
+    """基準値と比べて劣化していれば理由のリストを返す"""
+    if baseline is None:
+        return []
+    reasons = []
+    if (result['p50_ms'] > baseline['p50_ms'] * (1 + args.tolerance)
+            and result['p50_ms'] - baseline['p50_ms'] >= MIN_LATENCY_DELTA_MS):
+        reasons.append(f"p50 {baseline['p50_ms']:.1f} → {result['p50_ms']:.1f} ms")
+    if result['queries'] > baseline['queries']:
+        reasons.append(f"クエリ数 {baseline['queries']} → {result['queries']}")
+    if (result['peak_kb'] > baseline['peak_kb'] * (1 + args.memory_tolerance)
+            and result['peak_kb'] - baseline['peak_kb'] >= MIN_MEMORY_DELTA_KB):
+        reasons.append(f"メモリ {baseline['peak_kb']:,} → {result['peak_kb']:,} KB")
+    return reasons
+
+
+def main():
+    parser = argparse.ArgumentParser(description='全ルートのレイテンシ・クエリ数・メモリを基準値と比較する')
+    parser.add_argument('--companies', type=int, default=6)
+    parser.add_argument('--fill', type=float, default=1.0)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--tolerance', type=float, default=0.5, help='p50 の許容増加率')
+    parser.add_argument('--memory-tolerance', type=float, default=0.5, help='ピークメモリの許容増加率')
+    parser.add_argument('--only', help='計測するルート名（カンマ区切り）')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update', action='store_true', help='計測結果で基準値を書き換える')
+    parser.add_argument('--database-url', help='投入先（既定は一時SQLite）')
+    args = parser.parse_args()
+
+    app, summary, context = prepare(args)
+    from sqlalchemy import event
+    from models import db
+
+    queries = [0]
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *_: queries.__setitem__(0, queries[0] + 1))
+
+    scale = {'companies': args.companies, 'fill': args.fill, 'days': args.days}
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            stored = json.load(f)
+    baselines = stored.get('routes', {})
+    if baselines and stored.get('scale') != scale and not args.update:
+        sys.exit(f"基準値のデータ規模 {stored.get('scale')} と今回の規模 {scale} が異なります。"
+                 f'同じ規模で実行するか --update で作り直してください。')
+
+    clients = {'company': app.test_client(), 'saas': app.test_client(), 'anonymous': app.test_client()}
+    login(clients['company'], context['company']['admin_email'])
+    login(clients['saas'], 'seed-saas@example.com')
+
+    def login_call():
+        client = app.test_client()
+        login(client, context['company']['admin_email'])
+
+    targets = [(LOGIN, None, None)] + routes(app, context)
+    only = set(args.only.split(',')) if args.only else None
+    print(f"{summary['employees']:,}名 / 勤怠 {summary['records']:,}件 / 計測対象 {context['company']['company_code']}"
+          f"（{context['company']['employees']}名）")
+    print(f"{'ルート':<24} {'p50(ms)':>8} {'p95(ms)':>8} {'クエリ':>6} {'メモリ(KB)':>10} {'基準p50':>8}  判定")
+
+    results, regressions = {}, []
+    for name, role, path in targets:
+        if only and name not in only:
+            continue
+        if role is None:
+            call = login_call
+        else:
+            client = clients[role]
+
+            def call(client=client, path=path, name=name):
+                response = client.get(path)
+                response.get_data()
+                expected = EXPECTED_STATUS.get(name, 200)
+                assert response.status_code == expected, f'{name} {path}: ステータス {response.status_code}'
+
+        result = measure(call, args.repeat, queries)
+        results[name] = result
+        baseline = baselines.get(name)
+        reasons = compare(name, result, baseline, args)
+        if reasons:
+            regressions.append((name, reasons))
+        verdict = '✗ ' + ' / '.join(reasons) if reasons else ('✓' if baseline else '（基準値なし）')
+        print(f"{name:<24} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['queries']:>6} "
+              f"{result['peak_kb']:>10,} {baseline['p50_ms'] if baseline else '-':>8}  {verdict}")
+
+    if args.update:
+        merged = {**baselines, **results} if only else results
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'scale': scale, 'routes': merged}, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'基準値を更新しました: {args.baseline}')
+    elif regressions:
+        print(f'\n✗ {len(regressions)}件のルートで性能が劣化しています:')
+        for name, reasons in regressions:
+            print(f"  {name}: {' / '.join(reasons)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
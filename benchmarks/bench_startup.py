@@ -0,0 +1,128 @@
+"""起動から最初のリクエストに応答するまでの時間
+
+一時SQLiteデータベースを用意し、次の起動方法ごとに gunicorn を起動してから /login が 200 を返すまでの時間を計測する。
+
+- 起動ごとにプロビジョニング: 旧 Procfile（python init_db.py && gunicorn）と同じ
+- gunicorn のみ: プロビジョニングはデプロイ時に済ませ、テンプレートキャッシュ・preload なし
+- gunicorn（preload + テンプレートキャッシュ）: 現在の既定
+
+あわせて、新規データベースに対して init_db.py を同時に --concurrent 個実行し、
+アドバイザリロックにより初期データが二重に投入されないことを確認する。
+
+    python benchmarks/bench_startup.py [--repeat 5] [--workers 2] [--concurrent 4]
+"""
+import argparse
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GUNICORN = f'{sys.executable} -m gunicorn app:app -c gunicorn.conf.py'
+SCENARIOS = [
+    ('起動ごとにプロビジョニング', f'{sys.executable} init_db.py > /dev/null && exec {GUNICORN}',
+     {'TEMPLATE_CACHE_DIR': '', 'GUNICORN_PRELOAD': '0'}),
+    ('gunicorn のみ', f'exec {GUNICORN}', {'TEMPLATE_CACHE_DIR': '', 'GUNICORN_PRELOAD': '0'}),
+    ('gunicorn（preload + テンプレートキャッシュ）', f'exec {GUNICORN}', {}),
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def base_env(database_url, workers):
+    return dict(os.environ, DATABASE_URL=database_url, WEB_CONCURRENCY=str(workers), JOB_WORKERS='0')
+
+
+def time_to_first_request(command, env, timeout=60):
+    """command を起動してから /login が 200 を返すまでの秒数"""
+    port = free_port()
+    env = dict(env, PORT=str(port))
+    started = time.perf_counter()
+    process = subprocess.Popen(f'{command} --bind 127.0.0.1:{port}', shell=True, cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/login', timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f'{timeout}秒以内に応答しませんでした: {command}')
+    finally:
+        os.killpg(process.pid, 15)
+        process.wait()
+
+
+def provision_concurrently(directory, count):
+    """新規データベースに init_db.py を同時に count 個実行し、(所要時間, 件数) を返す"""
+    import sqlite3
+
+    path = os.path.join(directory, 'concurrent.db')
+    env = base_env(f'sqlite:///{path}', 1)
+    started = time.perf_counter()
+    processes = [subprocess.Popen([sys.executable, 'init_db.py'], cwd=ROOT, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE) for _ in range(count)]
+    errors = [process.stderr.read().decode() for process in processes if process.wait() != 0]
+    elapsed = time.perf_counter() - started
+    with sqlite3.connect(path) as connection:
+        counts = {
+            'プラン': connection.execute('SELECT COUNT(*) FROM plan').fetchone()[0],
+            'SaaS管理者': connection.execute("SELECT COUNT(*) FROM user WHERE role = 'saas_admin'").fetchone()[0],
+            'テスト企業': connection.execute("SELECT COUNT(*) FROM company WHERE company_code = 'TEST001'").fetchone()[0],
+        }
+    return elapsed, counts, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='起動から最初のリクエストまでの時間を計測する')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn のワーカー数')
+    parser.add_argument('--concurrent', type=int, default=4, help='同時に実行する init_db.py の数')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='eml-startup-')
+    try:
+        database_url = f"sqlite:///{os.path.join(directory, 'startup.db')}"
+        env = base_env(database_url, args.workers)
+        env['TEMPLATE_CACHE_DIR'] = os.path.join(directory, 'template_cache')
+
+        started = time.perf_counter()
+        subprocess.run([sys.executable, 'init_db.py'], cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+        print(f'プロビジョニング（新規）: {time.perf_counter() - started:.2f}秒')
+        started = time.perf_counter()
+        subprocess.run([sys.executable, 'init_db.py'], cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+        print(f'プロビジョニング（最新のDBに再実行）: {time.perf_counter() - started:.2f}秒')
+
+        print(f"\n{'起動方法':<36} {'中央値(秒)':>10} {'最小(秒)':>9} {'最大(秒)':>9}（ワーカー {args.workers}）")
+        for name, command, overrides in SCENARIOS:
+            # 1回目でテンプレートキャッシュを作り、2回目以降を計測する
+            time_to_first_request(command, {**env, **overrides})
+            samples = [time_to_first_request(command, {**env, **overrides}) for _ in range(args.repeat)]
+            print(f'{name:<36} {statistics.median(samples):>10.2f} {min(samples):>9.2f} {max(samples):>9.2f}')
+
+        elapsed, counts, errors = provision_concurrently(directory, args.concurrent)
+        duplicated = {label: count for label, count in counts.items()
+                      if count != (3 if label == 'プラン' else 1)}
+        print(f'\ninit_db.py を {args.concurrent}個同時に実行: {elapsed:.2f}秒 '
+              + ' / '.join(f'{label} {count}件' for label, count in counts.items()))
+        if errors or duplicated:
+            for error in errors:
+                print(error.strip().splitlines()[-1])
+            sys.exit('✗ 同時実行でエラーまたは重複がありました')
+        print('✓ エラー・重複なし')
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
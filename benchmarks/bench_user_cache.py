@@ -0,0 +1,58 @@
+"""ログインユーザーキャッシュのベンチマーク
+
+/company/dashboard を Flask テストクライアントで繰り返し取得し、
+ユーザーキャッシュ有効・無効それぞれのリクエスト数/秒と1リクエストあたりのクエリ数を比較する。
+計測は有効・無効を交互に ROUNDS 回行い、最良値を表示する。
+
+    python benchmarks/bench_user_cache.py [リクエスト数]
+"""
+import sys
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from common import setup_app, seed_company, Timer
+
+REQUESTS = 2000
+ROUNDS = 3
+
+
+def main(requests):
+    app = setup_app()
+    from models import db, User
+    from user_cache import user_cache
+
+    with app.app_context():
+        company_id = seed_company('USERCACHE', 50, 2026, 9)
+        db.session.add(User(email='bench@example.com', password=generate_password_hash('bench'),
+                            role='company_admin', company_id=company_id))
+        db.session.commit()
+        engine = db.engine
+
+    queries = [0]
+    event.listen(engine, 'before_cursor_execute', lambda *args: queries.__setitem__(0, queries[0] + 1))
+
+    client = app.test_client()
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'bench'})
+
+    settings = (('無効', 0), ('有効', user_cache.ttl))
+    best = {label: (0, 0) for label, _ in settings}
+    for _ in range(ROUNDS):
+        for label, ttl in settings:
+            user_cache.ttl = ttl
+            user_cache.clear()
+            client.get('/company/dashboard')
+            queries[0] = 0
+            with Timer() as timer:
+                for _ in range(requests):
+                    client.get('/company/dashboard')
+            rate = requests / timer.elapsed
+            best[label] = max(best[label], (rate, queries[0] / requests))
+
+    print(f"{'ユーザーキャッシュ':<12} {'req/s':>8} {'クエリ/req':>10}")
+    for label, (rate, per_request) in best.items():
+        print(f'{label:<12} {rate:>8.0f} {per_request:>10.2f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else REQUESTS)
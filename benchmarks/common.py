@@ -0,0 +1,104 @@
+"""ベンチマーク共通処理
+
+一時SQLiteデータベースにアプリを接続し、計測用データを一括投入する。
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import date, time as dtime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def setup_app(database_url=None):
+    """計測用データベースに接続したアプリを返す（未指定時は一時SQLite）"""
+    if database_url is None:
+        path = os.path.join(tempfile.mkdtemp(prefix='eml-bench-'), 'bench.db')
+        database_url = f'sqlite:///{path}'
+    os.environ['DATABASE_URL'] = database_url
+
+    from app import app
+    from migrations import upgrade
+    with app.app_context():
+        upgrade()
+    return app
+
+
+def seed_company(company_code, n_employees, year, month, plan_max=None):
+    """n_employees 名と対象月の平日分の勤怠を持つ企業を作成し、company_id を返す"""
+    from sqlalchemy import insert
+    from attendance_rollup import rebuild
+    from models import db, Company, Plan, Contract, Employee, WorkingTimeRecord
+
+    plan = Plan.query.filter_by(plan_name='bench').first()
+    if not plan:
+        plan = Plan(plan_name='bench', display_name='ベンチマーク', max_employees=plan_max or 100000,
+                    monthly_fee=0, yearly_fee=0)
+        db.session.add(plan)
+        db.session.flush()
+
+    company = Company(company_code=company_code, company_name=f'{company_code} 株式会社')
+    db.session.add(company)
+    db.session.flush()
+    db.session.add(Contract(company_id=company.id, plan_id=plan.id, start_date=date.today(),
+                            end_date=date.today() + timedelta(days=365), monthly_fee=0))
+
+    employees = [
+        {
+            'company_id': company.id,
+            'employee_id': f'{company_code}-{i:05d}',
+            'name': f'社員 {i}',
+            'status': '在籍中',
+            'department': ('営業部', '人事部', '開発部')[i % 3],
+            'employment_type': '正社員' if i % 4 else 'パート',
+            'join_date': date(2020, 4, 1) + timedelta(days=i % 1000),
+            'wage_type': 'hourly' if i % 4 == 0 else 'monthly',
+            'base_wage': 1200 if i % 4 == 0 else 250000 + (i % 10) * 10000,
+            'transportation_allowance': 10000,
+            'standard_working_hours': 8.0,
+            'standard_working_days': 5,
+        }
+        for i in range(n_employees)
+    ]
+    if employees:
+        db.session.execute(insert(Employee), employees)
+    employee_ids = [row.id for row in Employee.query.filter_by(company_id=company.id).with_entities(Employee.id)]
+
+    day = date(year, month, 1)
+    workdays = []
+    while day.month == month:
+        if day.weekday() < 5:
+            workdays.append(day)
+        day += timedelta(days=1)
+
+    rows = []
+    for employee_id in employee_ids:
+        for n, work_date in enumerate(workdays):
+            rows.append({
+                'company_id': company.id,
+                'employee_id': employee_id,
+                'work_date': work_date,
+                'start_time': dtime(9, 0),
+                'end_time': dtime(18 + n % 3, 0),
+                'break_minutes': 60,
+                'regular_hours': 8.0,
+                'overtime_out_legal': float(n % 3),
+                'late_night_hours': 0.0,
+            })
+    for i in range(0, len(rows), 5000):
+        db.session.execute(insert(WorkingTimeRecord), rows[i:i + 5000])
+    rebuild(db.session.connection(), company.id)
+    db.session.commit()
+    return company.id
+
+
+class Timer:
+    """with 文で経過時間（秒）を計測する"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
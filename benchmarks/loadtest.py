@@ -0,0 +1,146 @@
+"""負荷試験ハーネス
+
+一時SQLiteデータベースを用意して gunicorn（gunicorn.conf.py）を起動し、
+ワーカー数ごとに主要ルートへ並列にリクエストを送って p50 / p99 レイテンシを表示する。
+
+    python benchmarks/loadtest.py [--workers 1,2,4] [--clients 16] [--seconds 10]
+"""
+import argparse
+import http.cookiejar
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from werkzeug.security import generate_password_hash
+
+from common import setup_app, seed_company
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMPANY_ROUTES = ['/company/dashboard', '/employees', '/api/employees']
+SAAS_ROUTES = ['/saas/dashboard', '/saas/companies', '/saas/plans']
+
+
+def prepare_database():
+    """計測用データを投入し、DATABASE_URL を返す"""
+    app = setup_app()
+    from models import db, User
+    with app.app_context():
+        company_id = seed_company('LOAD', 200, 2026, 9)
+        for n in range(200):
+            seed_company(f'LOAD{n:03d}', 5, 2026, 9)
+        db.session.add_all([
+            User(email='load-admin@example.com', password=generate_password_hash('load'),
+                 role='company_admin', company_id=company_id),
+            User(email='load-saas@example.com', password=generate_password_hash('load'), role='saas_admin'),
+        ])
+        db.session.commit()
+    return os.environ['DATABASE_URL']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_url, workers, port):
+    env = dict(os.environ, DATABASE_URL=database_url, WEB_CONCURRENCY=str(workers), PORT=str(port))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/login', timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn が起動しませんでした')
+
+
+def login(base_url, email, password):
+    """ログイン済みの opener を返す"""
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    data = urllib.parse.urlencode({'email': email, 'password': password}).encode()
+    opener.open(f'{base_url}/login', data=data, timeout=10)
+    return opener
+
+
+def run_load(base_url, clients, seconds):
+    """clients 本のスレッドで seconds 秒間リクエストを送り、ルートごとの応答時間（秒）を返す"""
+    openers = {
+        'company': login(base_url, 'load-admin@example.com', 'load'),
+        'saas': login(base_url, 'load-saas@example.com', 'load'),
+    }
+    latencies = defaultdict(list)
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.time() + seconds
+
+    def client(index):
+        routes = [(openers['company'], route) for route in COMPANY_ROUTES] + \
+                 [(openers['saas'], route) for route in SAAS_ROUTES]
+        n = index
+        while time.time() < stop_at:
+            opener, route = routes[n % len(routes)]
+            n += 1
+            start = time.perf_counter()
+            try:
+                opener.open(base_url + route, timeout=30).read()
+            except OSError:
+                with lock:
+                    errors[0] += 1
+                continue
+            with lock:
+                latencies[route].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=int, default=10)
+    args = parser.parse_args()
+
+    database_url = prepare_database()
+    print(f"{'workers':>7} {'route':<20} {'req':>6} {'p50(ms)':>9} {'p99(ms)':>9}")
+    for workers in [int(w) for w in args.workers.split(',')]:
+        port = free_port()
+        server = start_server(database_url, workers, port)
+        try:
+            latencies, errors = run_load(f'http://127.0.0.1:{port}', args.clients, args.seconds)
+        finally:
+            server.terminate()
+            server.wait()
+        total = sum(len(values) for values in latencies.values())
+        for route in COMPANY_ROUTES + SAAS_ROUTES:
+            values = latencies.get(route)
+            if values:
+                print(f'{workers:>7} {route:<20} {len(values):>6} {percentile(values, 0.5) * 1000:>9.1f} '
+                      f'{percentile(values, 0.99) * 1000:>9.1f}')
+        print(f'{workers:>7} {"(合計)":<20} {total:>6} {total / args.seconds:>8.0f}/s  エラー {errors}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""大規模テナントの計測用データ生成
+
+N 社を作成し、プラン（ベーシック / スタンダード / プレミアム）を順に割り当てて、各社に
+プランの上限人数（× fill）までの従業員・days 日分の勤怠・法定の有給休暇付与を一括 INSERT で投入する。
+投入後に月次勤怠集計と有給休暇台帳を作り直す。
+
+    python benchmarks/seed.py [--companies 20] [--fill 1.0] [--days 365] [--database-url URL]
+
+各社の企業管理者は admin@<企業コード小文字>.example.com、SaaS管理者は seed-saas@example.com
+（パスワードはいずれも PASSWORD）。
+"""
+import argparse
+import random
+from datetime import date, datetime, time as dtime, timedelta
+
+from common import setup_app, Timer
+
+PASSWORD = 'bench'
+BATCH_SIZE = 5000
+DEFAULT_PLANS = [
+    ('basic', 'ベーシック', 10, 5000),
+    ('standard', 'スタンダード', 50, 15000),
+    ('premium', 'プレミアム', 200, 40000),
+]
+DEPARTMENTS = ('営業部', '人事部', '開発部', '総務部', '経理部')
+ABSENT_RATE = 0.02
+PAID_LEAVE_RATE = 0.04
+
+
+def ensure_plans():
+    """既定の3プランがなければ作成し、上限人数の小さい順に返す"""
+    from models import db, Plan
+
+    for plan_name, display_name, max_employees, monthly_fee in DEFAULT_PLANS:
+        if not Plan.query.filter_by(plan_name=plan_name).first():
+            db.session.add(Plan(plan_name=plan_name, display_name=display_name, max_employees=max_employees,
+                                monthly_fee=monthly_fee, yearly_fee=monthly_fee * 10))
+    db.session.commit()
+    names = [plan_name for plan_name, *_ in DEFAULT_PLANS]
+    return Plan.query.filter(Plan.plan_name.in_(names)).order_by(Plan.max_employees).all()
+
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _attendance_rows(company_id, employee_ids, start, end, rng):
+    """平日の勤怠（欠勤・有給休暇・残業を含む）を1件ずつ返す"""
+    now = datetime.utcnow()
+    workdays = [start + timedelta(days=n) for n in range((end - start).days + 1)
+                if (start + timedelta(days=n)).weekday() < 5]
+    for employee_id in employee_ids:
+        for work_date in workdays:
+            row = {
+                'company_id': company_id, 'employee_id': employee_id, 'work_date': work_date,
+                'start_time': None, 'end_time': None,
+                'break_minutes': 60, 'is_absent': False, 'is_paid_leave': False, 'leave_days': 0,
+                'regular_hours': 0.0, 'overtime_in_legal': 0.0, 'overtime_out_legal': 0.0,
+                'legal_holiday_hours': 0.0, 'non_legal_holiday_hours': 0.0, 'late_night_hours': 0.0,
+                'created_at': now, 'updated_at': now,
+            }
+            draw = rng.random()
+            if draw < ABSENT_RATE:
+                row.update(is_absent=True, break_minutes=0)
+            elif draw < ABSENT_RATE + PAID_LEAVE_RATE:
+                row.update(is_paid_leave=True, leave_days=1.0, break_minutes=0)
+            else:
+                overtime = rng.choice((0, 0, 0, 1, 2, 3))
+                row.update(start_time=dtime(9, 0), end_time=dtime(18 + overtime, 0),
+                           regular_hours=8.0, overtime_out_legal=float(overtime))
+            yield row
+
+
+def seed_company(code, plan, n_employees, start, end, password_hash, rng):
+    """1社分（契約・企業管理者・従業員・勤怠）を投入し、(company_id, employee_ids, 勤怠件数) を返す"""
+    from sqlalchemy import insert, select
+    from models import db, Company, Contract, Employee, User, WorkingTimeRecord
+
+    company = Company(company_code=code, company_name=f'{code} 株式会社')
+    db.session.add(company)
+    db.session.flush()
+    db.session.add(Contract(company_id=company.id, plan_id=plan.id, start_date=start,
+                            end_date=end + timedelta(days=365), monthly_fee=plan.monthly_fee))
+    db.session.add(User(email=f'admin@{code.lower()}.example.com', password=password_hash,
+                        role='company_admin', company_id=company.id, name=f'{code} 管理者'))
+
+    employees = []
+    for i in range(n_employees):
+        hourly = i % 5 == 0
+        employees.append({
+            'company_id': company.id,
+            'employee_id': f'{code}-{i:05d}',
+            'name': f'社員 {i}',
+            'furigana': f'シャイン {i}',
+            'email': f'e{i}@{code.lower()}.example.com',
+            'status': '在籍中' if i % 20 else '退職',
+            'department': DEPARTMENTS[i % len(DEPARTMENTS)],
+            'position': '一般' if i % 7 else '主任',
+            'employment_type': 'パート' if hourly else '正社員',
+            'join_date': start - timedelta(days=rng.randint(30, 3650)),
+            'wage_type': 'hourly' if hourly else 'monthly',
+            'base_wage': rng.choice((1100, 1200, 1400)) if hourly else rng.randrange(200000, 500000, 10000),
+            'transportation_allowance': rng.randrange(0, 30000, 1000),
+            'standard_working_hours': 8.0,
+            'standard_working_days': 5,
+        })
+    if employees:
+        db.session.execute(insert(Employee), employees)
+    employee_ids = db.session.execute(
+        select(Employee.id).where(Employee.company_id == company.id).order_by(Employee.id)
+    ).scalars().all()
+
+    records = 0
+    for batch in _batches(_attendance_rows(company.id, employee_ids, start, end, rng)):
+        # ORM のイベントを経由しないため、月次勤怠集計と有給休暇台帳は最後にまとめて作り直す
+        db.session.execute(insert(WorkingTimeRecord.__table__), batch)
+        records += len(batch)
+    db.session.commit()
+    return company.id, employee_ids, records
+
+
+def seed(companies=20, fill=1.0, days=365, end=None, seed_value=0, prefix='SEED'):
+    """計測用データを投入して件数を返す（アプリケーションコンテキスト内で呼ぶ）"""
+    from werkzeug.security import generate_password_hash
+    from attendance_rollup import rebuild
+    from leave import grant_statutory_leave, rebuild_allocations
+    from models import db, User
+
+    rng = random.Random(seed_value)
+    end = end or date.today() - timedelta(days=1)
+    start = end - timedelta(days=days - 1)
+    plans = ensure_plans()
+    # ハッシュ計算は遅いため全アカウントで共有する
+    password_hash = generate_password_hash(PASSWORD)
+    if not User.query.filter_by(email='seed-saas@example.com').first():
+        db.session.add(User(email='seed-saas@example.com', password=password_hash, role='saas_admin',
+                            name='計測用SaaS管理者'))
+
+    summary = {'companies': [], 'employees': 0, 'records': 0, 'leave_credits': 0}
+    seeded_ids = []
+    for index in range(companies):
+        plan = plans[index % len(plans)]
+        code = f'{prefix}{index:04d}'
+        n_employees = max(1, round(plan.max_employees * fill))
+        company_id, employee_ids, records = seed_company(code, plan, n_employees, start, end, password_hash, rng)
+        rebuild(db.session.connection(), company_id)
+        db.session.commit()
+        summary['companies'].append({'company_id': company_id, 'company_code': code, 'plan': plan.plan_name,
+                                     'employees': len(employee_ids),
+                                     'admin_email': f'admin@{code.lower()}.example.com'})
+        summary['employees'] += len(employee_ids)
+        seeded_ids.extend(employee_ids)
+        summary['records'] += records
+
+    # 期間の初日時点で有効な付与と、期間中に到来した付与を登録し、取得日へ割り当てる
+    for as_of in (start, end):
+        summary['leave_credits'] += grant_statutory_leave(today=as_of, commit=False)['granted']
+    rebuild_allocations(db.session.connection(), seeded_ids, end)
+    db.session.commit()
+    summary.update(start=start, end=end)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='計測用データを生成する')
+    parser.add_argument('--companies', type=int, default=20)
+    parser.add_argument('--fill', type=float, default=1.0, help='プラン上限人数に対する従業員数の割合')
+    parser.add_argument('--days', type=int, default=365, help='勤怠を作成する日数（昨日まで）')
+    parser.add_argument('--seed', type=int, default=0, help='乱数の種')
+    parser.add_argument('--database-url', help='投入先（既定は一時SQLite）')
+    args = parser.parse_args()
+
+    app = setup_app(args.database_url)
+    with app.app_context():
+        with Timer() as timer:
+            summary = seed(args.companies, args.fill, args.days, seed_value=args.seed)
+    print(f"{len(summary['companies'])}社 / 従業員 {summary['employees']:,}名 / 勤怠 {summary['records']:,}件 / "
+          f"有給付与 {summary['leave_credits']:,}件（{summary['start']}〜{summary['end']}）: {timer.elapsed:.1f}秒")
+    print(f"データベース: {app.config['SQLALCHEMY_DATABASE_URI']}")
+    print(f"ログイン: {summary['companies'][-1]['admin_email']} / seed-saas@example.com（パスワード {PASSWORD}）")
+
+
+if __name__ == '__main__':
+    main()
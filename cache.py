@@ -0,0 +1,129 @@
+"""プロセス内キャッシュ
+
+有効期限（TTL）付きのLRUキャッシュ。ワーカープロセスごとに保持されるため、
+他プロセスでの更新は最大 TTL 秒遅れて反映される。
+"""
+import time
+from collections import OrderedDict
+from threading import Lock
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+_MISSING = object()
+_PENDING_KEY = 'cache_invalidations'
+
+
+class TTLCache:
+    """TTL・最大件数付きのスレッドセーフなLRUキャッシュ"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires_at = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        if not self.ttl:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (ttl or self.ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, factory, ttl=None):
+        """キャッシュにあればその値を、なければ factory() の結果を保存して返す"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def update(self, key, func):
+        """有効なエントリがあれば func(値) で置き換える（有効期限は延長しない）"""
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING and item[1] > time.monotonic():
+                self._data[key] = (func(item[0]), item[1])
+
+    def items(self):
+        """有効なエントリの (キー, 値) のリスト（ヒット率には計上しない）"""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (value, expires_at) in self._data.items() if expires_at > now]
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate):
+        """predicate(key) が真となるキーをすべて削除する"""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
+
+    def __len__(self):
+        return len(self._data)
+
+
+# =============================================================================
+# コミット後の無効化
+# =============================================================================
+
+def after_commit(target, callback):
+    """target のセッションがコミットされた時点で callback() を呼ぶ（ロールバック時は破棄）"""
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_KEY, []).append(callback)
+
+
+def invalidate_after_commit(target, cache, predicate):
+    """target のセッションがコミットされた時点で、predicate(key) が真のキーを削除する
+
+    フラッシュ時点で削除すると、コミット前に他のリクエストが古い値を再キャッシュしてしまうため。
+    """
+    after_commit(target, lambda: cache.delete_where(predicate))
+
+
+@event.listens_for(Session, 'after_commit')
+def _run_after_commit(session):
+    for callback in session.info.pop(_PENDING_KEY, []):
+        callback()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_invalidations(session, previous_transaction):
+    # セーブポイントのロールバックでは破棄しない（外側のトランザクションでコミットされる変更の分も含むため。
+    # ロールバックされた変更の分が残っても、コミット時に余分に無効化されるだけ）
+    if previous_transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,163 @@
+"""契約の期限処理（自動更新・失効）と期限間近の一覧
+
+有効な契約の期限（Contract.end_date）は (is_active, end_date) のインデックスを期限順のキューとして使い、
+基準日より前に期限が切れた契約を古い順に CONTRACT_TICK_BATCH 件ずつ処理して、バッチごとにコミットする。
+
+- auto_renew の契約: 期限の翌日から同じ課金サイクル（月次 30日後・年次 365日後まで）の契約を作り、元の契約を無効にする
+  （期限から日数が経っている場合は、基準日を含む期間の契約を作る）
+- それ以外の契約、または企業が無効の場合: is_active を False にする
+
+SaaS管理者ダッシュボードの「契約期限が近い企業」は expiring_contract テーブルに作っておいた一覧を読む。
+一覧は基準日が変わったとき、または企業・契約・プランが変更されたとき（data_version の companies）に一覧だけ作り直す。
+期限処理（契約の更新・失効）は `flask contracts-tick` を毎日実行して行い、画面表示のついでには行わない。
+ログイン時は、その企業の契約が期限切れのまま有効になっていればその場で処理する（roll_company）。
+"""
+import os
+from datetime import date, datetime, timedelta
+from sqlalchemy import delete, insert, select, true
+from entitlements import get_entitlement, lock_company
+from fragments import versions
+from models import db, Company, Contract, ContractTick, DataVersion, ExpiringContract, Plan
+
+BATCH_SIZE = int(os.environ.get('CONTRACT_TICK_BATCH', 500))
+EXPIRING_DAYS = int(os.environ.get('CONTRACT_EXPIRING_DAYS', 30))
+
+# 課金サイクルごとの契約期間（開始日から終了日までの日数）
+PERIOD_DAYS = {'monthly': 30, 'yearly': 365}
+
+
+def period_end(start_date, billing_cycle):
+    """開始日と課金サイクルから契約終了日を計算する"""
+    return start_date + timedelta(days=PERIOD_DAYS.get(billing_cycle, PERIOD_DAYS['monthly']))
+
+
+# =============================================================================
+# 期限処理
+# =============================================================================
+
+def _due_statement(today, company_id=None):
+    stmt = select(Contract.id).where(Contract.is_active == True, Contract.end_date < today)  # noqa: E712
+    if company_id is not None:
+        stmt = stmt.where(Contract.company_id == company_id)
+    return stmt.order_by(Contract.end_date, Contract.id).limit(BATCH_SIZE)
+
+
+def _roll(contract, today):
+    """期限切れの契約を無効にし、自動更新する場合は次の期間の契約を作る（更新したら True）"""
+    contract.is_active = False
+    if not contract.auto_renew or not contract.company.is_active:
+        return False
+
+    start_date = contract.end_date + timedelta(days=1)
+    end_date = period_end(start_date, contract.billing_cycle)
+    while end_date < today:
+        start_date = end_date + timedelta(days=1)
+        end_date = period_end(start_date, contract.billing_cycle)
+    db.session.add(Contract(
+        company_id=contract.company_id,
+        plan_id=contract.plan_id,
+        start_date=start_date,
+        end_date=end_date,
+        monthly_fee=contract.monthly_fee,
+        billing_cycle=contract.billing_cycle,
+        auto_renew=True,
+    ))
+    return True
+
+
+def roll_due(today=None, company_id=None):
+    """期限切れの有効契約を更新または失効させ、(更新件数, 失効件数) を返す"""
+    today = today or date.today()
+    renewed = deactivated = 0
+    while True:
+        contract_ids = db.session.execute(_due_statement(today, company_id)).scalars().all()
+        if not contract_ids:
+            break
+        for contract_id in contract_ids:
+            contract = db.session.get(Contract, contract_id)
+            # 他のプロセスが同じ契約を処理していないか、企業単位でロックしてから確かめる
+            lock_company(contract.company_id)
+            db.session.refresh(contract)
+            if not contract.is_active or contract.end_date >= today:
+                continue
+            if _roll(contract, today):
+                renewed += 1
+            else:
+                deactivated += 1
+        db.session.commit()
+    return renewed, deactivated
+
+
+def roll_company(company_id, today=None):
+    """企業の期限切れの契約を処理し、最新の契約スナップショットを返す（ログイン時用）"""
+    roll_due(today, company_id)
+    return get_entitlement(company_id)
+
+
+# =============================================================================
+# 期限間近の一覧
+# =============================================================================
+
+def rebuild_expiring(today=None, renewed=None, deactivated=None):
+    """期限が基準日から EXPIRING_DAYS 日以内の有効契約の一覧を作り直し、件数を返す
+
+    renewed / deactivated は期限処理の件数（None なら前回の期限処理の件数を残す）。
+    """
+    today = today or date.today()
+    source_version = versions(['companies'])['companies'][0]
+    # 実行状況の行をロックし、同時に作り直す処理を直列化する
+    state = db.session.get(ContractTick, 1, with_for_update=True)
+    db.session.execute(delete(ExpiringContract))
+
+    rows = db.session.execute(
+        select(
+            Contract.id.label('contract_id'), Contract.company_id, Company.company_name,
+            Plan.display_name.label('plan_name'), Contract.end_date,
+        ).join(Company, Company.id == Contract.company_id).join(Plan, Plan.id == Contract.plan_id).where(
+            Contract.is_active == True,  # noqa: E712
+            Contract.end_date >= today,
+            Contract.end_date <= today + timedelta(days=EXPIRING_DAYS),
+        ).order_by(Contract.end_date, Contract.id).execution_options(yield_per=BATCH_SIZE)
+    )
+    count = 0
+    for batch in rows.partitions():
+        db.session.execute(insert(ExpiringContract), [row._asdict() for row in batch])
+        count += len(batch)
+
+    state.as_of = today
+    state.source_version = source_version
+    if renewed is not None:
+        state.renewed = renewed
+        state.deactivated = deactivated
+    state.finished_at = datetime.utcnow()
+    db.session.commit()
+    return count
+
+
+def tick(today=None):
+    """期限処理と期限間近の一覧の作り直し（`flask contracts-tick`）"""
+    today = today or date.today()
+    renewed, deactivated = roll_due(today)
+    expiring = rebuild_expiring(today, renewed, deactivated)
+    return {'renewed': renewed, 'deactivated': deactivated, 'expiring': expiring}
+
+
+def _expiring_statement():
+    # 実行状況・data_version（companies）と一覧を1回のクエリで読む（一覧が空でも実行状況の1行は返る）
+    return select(
+        ContractTick.as_of, ContractTick.source_version, DataVersion.version, ExpiringContract,
+    ).select_from(ContractTick).outerjoin(
+        DataVersion, DataVersion.scope == 'companies'
+    ).outerjoin(ExpiringContract, true()).where(ContractTick.id == 1).order_by(
+        ExpiringContract.end_date, ExpiringContract.contract_id
+    )
+
+
+def expiring_soon(today=None):
+    """期限間近の契約の一覧（一覧が古ければ一覧だけ作り直す。契約の更新・失効は行わない）"""
+    today = today or date.today()
+    rows = db.session.execute(_expiring_statement()).all()
+    if not rows or rows[0].as_of != today or rows[0].source_version != (rows[0].version or 0):
+        rebuild_expiring(today)
+        rows = db.session.execute(_expiring_statement()).all()
+    return [row.ExpiringContract for row in rows if row.ExpiringContract is not None]
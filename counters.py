@@ -0,0 +1,98 @@
+"""ダッシュボード集計値のキャッシュ
+
+企業ダッシュボード・SaaS管理者ダッシュボードの COUNT 結果をキャッシュし、
+Employee / Contract / Company / WorkingTimeRecord の変更時にコミット後に無効化する。
+"""
+import os
+from datetime import date
+from sqlalchemy import event, func, select
+from attendance_rollup import records_since
+from cache import TTLCache, invalidate_after_commit
+from models import db, Company, Contract, Employee, WorkingTimeRecord
+
+counter_cache = TTLCache(
+    maxsize=int(os.environ.get('COUNTER_CACHE_SIZE', 4096)),
+    ttl=int(os.environ.get('COUNTER_CACHE_TTL', 60)),
+)
+
+
+# =============================================================================
+# 読み出し
+# =============================================================================
+
+def company_records_count(company_id, month_start=None):
+    """指定月初以降の勤怠記録件数（月次勤怠集計から合計する）"""
+    month_start = month_start or date.today().replace(day=1)
+    return counter_cache.get_or_set(
+        ('company', company_id, 'records', month_start.isoformat()),
+        lambda: records_since(company_id, month_start.year, month_start.month)
+    )
+
+
+def global_counts():
+    """SaaS管理者ダッシュボードの全体集計（アクティブ企業数・有効契約数・在籍従業員数）"""
+    today = date.today()
+    return {
+        'total_companies': counter_cache.get_or_set(
+            ('global', 'companies'),
+            lambda: db.session.execute(
+                select(func.count()).select_from(Company).where(Company.is_active == True)  # noqa: E712
+            ).scalar()
+        ),
+        'active_contracts': counter_cache.get_or_set(
+            ('global', 'active_contracts', today.isoformat()),
+            lambda: db.session.execute(
+                select(func.count()).select_from(Contract).where(
+                    Contract.is_active == True, Contract.end_date >= today  # noqa: E712
+                )
+            ).scalar()
+        ),
+        'total_employees': counter_cache.get_or_set(
+            ('global', 'employees'),
+            lambda: db.session.execute(
+                select(func.count()).select_from(Employee).where(Employee.status == '在籍中')
+            ).scalar()
+        ),
+    }
+
+
+# =============================================================================
+# 無効化
+# =============================================================================
+
+def invalidate_company(company_id):
+    """企業単位の集計と全体集計をすべて無効化する（一括INSERTなどイベントを経由しない更新用）"""
+    counter_cache.delete_where(lambda key: key[0] == 'global' or key[:2] == ('company', company_id))
+
+
+def _schedule(target, predicate):
+    invalidate_after_commit(target, counter_cache, predicate)
+
+
+def _on_employee_change(mapper, connection, target):
+    # 企業ごとの在籍人数は契約スナップショット（entitlements）が持つ
+    _schedule(target, lambda key: key == ('global', 'employees'))
+
+
+def _on_record_change(mapper, connection, target):
+    company_id = target.company_id
+    _schedule(target, lambda key: key[:3] == ('company', company_id, 'records'))
+
+
+def _on_contract_change(mapper, connection, target):
+    _schedule(target, lambda key: key[:2] == ('global', 'active_contracts'))
+
+
+def _on_company_change(mapper, connection, target):
+    _schedule(target, lambda key: key == ('global', 'companies'))
+
+
+for _model, _listener in (
+    (Employee, _on_employee_change),
+    (WorkingTimeRecord, _on_record_change),
+    (Contract, _on_contract_change),
+    (Company, _on_company_change),
+):
+    for _name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _name, _listener)
+
@@ -0,0 +1,49 @@
+"""データベース接続設定
+
+接続プールやSQLiteのPRAGMAなど、複数ワーカー・複数スレッドで動かすための設定をまとめる。
+"""
+import os
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def worker_threads():
+    """1ワーカーあたりのスレッド数（gunicorn.conf.py と接続プールで共有）"""
+    return int(os.environ.get('GUNICORN_THREADS', 4))
+
+
+def database_url():
+    """DATABASE_URL を SQLAlchemy が解釈できる形式で返す"""
+    url = os.environ.get('DATABASE_URL', 'sqlite:///employees.db')
+    # Render / Heroku の postgres:// 形式は SQLAlchemy 1.4 以降で使えない
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url):
+    """SQLALCHEMY_ENGINE_OPTIONS を返す"""
+    if url.startswith('sqlite'):
+        # ロック待ちは PRAGMA busy_timeout で行う
+        return {'connect_args': {'check_same_thread': False}}
+    return {
+        # スレッド数分を常時確保し、瞬間的な超過は max_overflow で吸収する
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', worker_threads())),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', worker_threads())),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_pre_ping': True,
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+
+
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """SQLite を WAL モードにし、書き込みロック待ちでエラーにせず待機させる"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f"PRAGMA busy_timeout={int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}")
+    cursor.close()
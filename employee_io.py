@@ -0,0 +1,255 @@
+"""従業員の一括インポート・エクスポート
+
+Excel（.xlsx）は openpyxl の read-only / write-only モード、CSV は csv モジュールで
+1行ずつ処理し、ファイルサイズに比例してメモリを消費しないようにする。
+"""
+import csv
+import io
+import os
+import tempfile
+from datetime import datetime, date
+from sqlalchemy import select, insert
+from models import db, Employee
+from counters import invalidate_company
+import entitlements
+import fragments
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+# (列名, 見出し, 型)
+EMPLOYEE_COLUMNS = [
+    ('employee_id', '社員番号', 'str'),
+    ('name', '氏名', 'str'),
+    ('furigana', 'フリガナ', 'str'),
+    ('email', 'メールアドレス', 'str'),
+    ('phone', '電話番号', 'str'),
+    ('birth_date', '生年月日', 'date'),
+    ('gender', '性別', 'str'),
+    ('address', '住所', 'str'),
+    ('join_date', '入社日', 'date'),
+    ('department', '部署', 'str'),
+    ('position', '役職', 'str'),
+    ('employment_type', '雇用形態', 'str'),
+    ('status', 'ステータス', 'str'),
+    ('wage_type', '給与形態', 'str'),
+    ('base_wage', '基本給', 'int'),
+    ('transportation_allowance', '通勤手当', 'int'),
+    ('working_time_system', '勤務形態', 'str'),
+    ('standard_working_hours', '所定労働時間', 'float'),
+    ('standard_working_days', '所定労働日数', 'int'),
+]
+
+DEFAULTS = {
+    'status': '在籍中',
+    'base_wage': 0,
+    'transportation_allowance': 0,
+    'standard_working_hours': 8.0,
+    'standard_working_days': 5,
+}
+
+HEADER_ALIASES = {}
+for _field, _label, _ in EMPLOYEE_COLUMNS:
+    HEADER_ALIASES[_field] = _field
+    HEADER_ALIASES[_label] = _field
+COLUMN_TYPES = {field: kind for field, _, kind in EMPLOYEE_COLUMNS}
+COLUMN_LABELS = {field: label for field, label, _ in EMPLOYEE_COLUMNS}
+
+
+class EmployeeImportError(Exception):
+    """インポート失敗（行番号付きのエラー一覧を保持する）"""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+# =============================================================================
+# インポート
+# =============================================================================
+
+def iter_rows(stream, filename):
+    """アップロードファイルを1行ずつ値のタプルとして返す"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.xlsx':
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    elif extension == '.csv':
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        try:
+            yield from csv.reader(text)
+        finally:
+            # 呼び出し元が先にファイルを閉じた後でジェネレータが破棄される場合がある
+            if not text.closed:
+                text.detach()
+    else:
+        raise EmployeeImportError('対応していないファイル形式です（.xlsx または .csv）。')
+
+
+def _convert(value, kind):
+    if value is None or (isinstance(value, str) and value.strip() == ''):
+        return None
+    if kind == 'date':
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        text = str(value).strip().replace('/', '-')
+        return datetime.strptime(text, '%Y-%m-%d').date()
+    if kind == 'int':
+        return int(float(value))
+    if kind == 'float':
+        return float(value)
+    return str(value).strip()
+
+
+def validate_row(header, values):
+    """1行分の値を検証し、Employee の列に対応する dict を返す（不正な場合は ValueError）"""
+    row = {}
+    for field, value in zip(header, values):
+        if field is None:
+            continue
+        try:
+            row[field] = _convert(value, COLUMN_TYPES[field])
+        except (TypeError, ValueError):
+            raise ValueError(f'{COLUMN_LABELS[field]}の形式が正しくありません（{value}）')
+    if not row.get('name'):
+        raise ValueError('氏名は必須です')
+    for field, default in DEFAULTS.items():
+        if row.get(field) is None:
+            row[field] = default
+    return row
+
+
+def import_employees(company_id, stream, filename):
+    """ファイルから従業員を一括登録し、登録件数を返す
+
+    CHUNK_SIZE 行ごとに検証・一括INSERTし、全件成功した場合のみコミットする。
+    従業員数の上限チェックはファイル全体の在籍者数に対して1回だけ、
+    企業行をロックしたうえでコミット直前に行う。
+    """
+    rows = iter_rows(stream, filename)
+    try:
+        header_values = next(rows)
+    except StopIteration:
+        raise EmployeeImportError('ファイルが空です。')
+    header = [HEADER_ALIASES.get(str(value).strip()) if value is not None else None for value in header_values]
+    if 'name' not in header:
+        raise EmployeeImportError('見出し行に「氏名」列がありません。')
+
+    existing_codes = set(db.session.execute(
+        select(Employee.employee_id).where(
+            Employee.company_id == company_id, Employee.employee_id.isnot(None)
+        )
+    ).scalars())
+
+    errors, chunk = [], []
+    inserted = active = 0
+
+    def flush():
+        nonlocal inserted
+        if chunk and not errors:
+            db.session.execute(insert(Employee), chunk)
+            inserted += len(chunk)
+        chunk.clear()
+
+    try:
+        for line_number, values in enumerate(rows, start=2):
+            if not any(value not in (None, '') for value in values):
+                continue
+            try:
+                row = validate_row(header, values)
+                code = row.get('employee_id')
+                if code:
+                    if code in existing_codes:
+                        raise ValueError(f'社員番号 {code} は既に登録されています')
+                    existing_codes.add(code)
+            except ValueError as e:
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append((line_number, str(e)))
+                continue
+
+            row['company_id'] = company_id
+            if row['status'] == '在籍中':
+                active += 1
+            chunk.append(row)
+            if len(chunk) >= CHUNK_SIZE:
+                flush()
+        flush()
+
+        if errors:
+            suffix = '以上' if len(errors) >= MAX_REPORTED_ERRORS else ''
+            raise EmployeeImportError(f'エラーが{len(errors)}件{suffix}あるため取り込みを中止しました。', errors)
+
+        try:
+            entitlements.check_capacity(company_id, adding=active, already_inserted=True)
+        except entitlements.CapacityExceeded as e:
+            raise EmployeeImportError(str(e))
+
+        # 一括 INSERT は ORM のイベントを経由しないため、従業員一覧のバージョンをここで進める
+        fragments.bump(db.session.connection(), fragments.employee_scope(company_id))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    invalidate_company(company_id)
+    entitlements.invalidate(company_id)
+    return inserted
+
+
+# =============================================================================
+# エクスポート
+# =============================================================================
+
+def _employee_rows(company_id):
+    """ORMオブジェクトを生成せず、列値のタプルを少しずつ取得する"""
+    columns = [getattr(Employee, field) for field, _, _ in EMPLOYEE_COLUMNS]
+    stmt = select(*columns).where(
+        Employee.company_id == company_id
+    ).order_by(Employee.employee_id, Employee.id).execution_options(yield_per=CHUNK_SIZE)
+    return db.session.execute(stmt)
+
+
+def export_csv(company_id, progress=None):
+    """CSV（UTF-8 BOM付き）を少しずつ生成する（progress には CHUNK_SIZE 行ごとに出力済み行数を渡す）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow([label for _, label, _ in EMPLOYEE_COLUMNS])
+
+    for count, row in enumerate(_employee_rows(company_id), start=1):
+        writer.writerow(['' if value is None else value for value in row])
+        if count % CHUNK_SIZE == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            if progress:
+                progress(count)
+    yield buffer.getvalue().encode('utf-8')
+
+
+def export_xlsx(company_id, chunk_size=64 * 1024, progress=None):
+    """Excel を write-only モードで一時ファイルに書き出し、少しずつ返す（progress は export_csv と同じ）"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('従業員')
+    sheet.append([label for _, label, _ in EMPLOYEE_COLUMNS])
+    for count, row in enumerate(_employee_rows(company_id), start=1):
+        sheet.append(list(row))
+        if progress and count % CHUNK_SIZE == 0:
+            progress(count)
+
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            data = output.read(chunk_size)
+            if not data:
+                break
+            yield data
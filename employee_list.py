@@ -0,0 +1,96 @@
+"""従業員一覧の取得
+
+(社員番号, id) のキーセットでページングし、一覧表示に必要な列だけを取得する。
+画面（/employees）と JSON API（/api/employees）で共通に使う。
+"""
+import base64
+import json
+from sqlalchemy import select, func, and_, or_
+from models import db, Employee
+
+PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+LIST_COLUMNS = (
+    Employee.id, Employee.employee_id, Employee.name, Employee.furigana,
+    Employee.department, Employee.position, Employee.employment_type,
+    Employee.join_date, Employee.status,
+)
+FILTER_FIELDS = ('department', 'status', 'employment_type')
+
+# 社員番号が未設定の従業員も並べられるよう空文字として扱う
+_sort_code = func.coalesce(Employee.employee_id, '')
+
+
+def encode_cursor(row):
+    raw = json.dumps([row.employee_id or '', row.id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """不正なカーソルは None（先頭ページ）として扱う"""
+    if not token:
+        return None
+    try:
+        code, employee_pk = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return str(code), int(employee_pk)
+    except (ValueError, TypeError):
+        return None
+
+
+def page_statement(company_id, filters=None, cursor=None, limit=PER_PAGE):
+    """1ページ分（+1件）を取得する SELECT 文（同期・非同期で共通）"""
+    limit = max(1, min(limit, MAX_PER_PAGE))
+    stmt = select(*LIST_COLUMNS).where(Employee.company_id == company_id)
+    for field, value in (filters or {}).items():
+        if field in FILTER_FIELDS and value:
+            stmt = stmt.where(getattr(Employee, field) == value)
+
+    position = decode_cursor(cursor)
+    if position:
+        code, employee_pk = position
+        stmt = stmt.where(or_(_sort_code > code, and_(_sort_code == code, Employee.id > employee_pk)))
+    return stmt.order_by(_sort_code, Employee.id).limit(limit + 1)
+
+
+def split_page(rows, limit=PER_PAGE):
+    """page_statement の結果を (1ページ分, 次ページのカーソル) に分ける"""
+    limit = max(1, min(limit, MAX_PER_PAGE))
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def employee_page(company_id, filters=None, cursor=None, limit=PER_PAGE):
+    """1ページ分の従業員（Row のリスト）と次ページのカーソルを返す"""
+    rows = db.session.execute(page_statement(company_id, filters, cursor, limit)).all()
+    return split_page(rows, limit)
+
+
+def filter_options_statement(company_id):
+    return select(Employee.department, Employee.employment_type).where(
+        Employee.company_id == company_id
+    ).group_by(Employee.department, Employee.employment_type)
+
+
+def filter_options(company_id, rows=None):
+    """絞り込み用の部署・雇用形態の選択肢（rows は filter_options_statement の実行結果）"""
+    if rows is None:
+        rows = db.session.execute(filter_options_statement(company_id)).all()
+    return {
+        'department': sorted({row.department for row in rows if row.department}),
+        'employment_type': sorted({row.employment_type for row in rows if row.employment_type}),
+    }
+
+
+def serialize(row):
+    return {
+        'id': row.id,
+        'employee_id': row.employee_id,
+        'name': row.name,
+        'furigana': row.furigana,
+        'department': row.department,
+        'position': row.position,
+        'employment_type': row.employment_type,
+        'join_date': row.join_date.isoformat() if row.join_date else None,
+        'status': row.status,
+    }
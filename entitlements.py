@@ -0,0 +1,166 @@
+"""契約内容（利用権）のスナップショット
+
+企業ごとの有効契約・プラン上限・契約期限・在籍従業員数をキャッシュし、
+ログイン時の契約チェックや従業員登録時の上限チェックで毎回 Contract / Plan を引かないようにする。
+Contract / Plan / Employee の変更はコミット後にその企業のスナップショットを破棄し、次の参照で読み直す。
+
+上限チェック自体は、同時登録で上限を超えないよう企業行をロックしたうえで
+その時点の契約・プランの上限とトランザクション内の実件数に対して行う（check_capacity）。
+"""
+import os
+from collections import namedtuple
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm.attributes import get_history
+from cache import TTLCache, after_commit
+from models import db, track_previous_values, Company, Contract, Employee, Plan
+
+ACTIVE_STATUS = '在籍中'
+
+entitlement_cache = TTLCache(
+    maxsize=int(os.environ.get('ENTITLEMENT_CACHE_SIZE', 10000)),
+    ttl=int(os.environ.get('ENTITLEMENT_CACHE_TTL', 60)),
+)
+
+Entitlement = namedtuple('Entitlement', [
+    'company_id', 'contract_id', 'plan_id', 'plan_display_name', 'max_employees',
+    'start_date', 'end_date', 'billing_cycle', 'headcount',
+])
+
+
+class CapacityExceeded(Exception):
+    """プランの従業員上限を超える登録"""
+
+    def __init__(self, max_employees, current, adding):
+        super().__init__(f'従業員数が上限（{max_employees}名）を超えます（現在 {current}名 + 登録 {adding}名）。')
+        self.max_employees = max_employees
+        self.current = current
+        self.adding = adding
+
+
+def headcount_statement(company_id):
+    return select(func.count()).select_from(Employee).where(
+        Employee.company_id == company_id, Employee.status == ACTIVE_STATUS
+    )
+
+
+def contract_statement(company_id):
+    return select(
+        Contract.id, Contract.plan_id, Plan.display_name, Plan.max_employees,
+        Contract.start_date, Contract.end_date, Contract.billing_cycle,
+    ).join(Plan, Plan.id == Contract.plan_id).where(
+        Contract.company_id == company_id, Contract.is_active == True  # noqa: E712
+    ).order_by(Contract.end_date.desc()).limit(1)
+
+
+def build_entitlement(company_id, row, headcount):
+    """contract_statement の結果（なければ None）と在籍人数からスナップショットを作る"""
+    if row is None:
+        return Entitlement(company_id, None, None, None, None, None, None, None, headcount)
+    return Entitlement(company_id, *row, headcount)
+
+
+def _load(company_id):
+    row = db.session.execute(contract_statement(company_id)).first()
+    headcount = db.session.execute(headcount_statement(company_id)).scalar()
+    return build_entitlement(company_id, row, headcount)
+
+
+def get_entitlement(company_id):
+    """企業の契約スナップショットを返す（有効契約がなければ contract_id が None）"""
+    return entitlement_cache.get_or_set(company_id, lambda: _load(company_id))
+
+
+# =============================================================================
+# 上限チェック
+# =============================================================================
+
+def lock_company(company_id):
+    """企業行に書き込みロックをかける（PostgreSQL では行ロック、SQLite ではDB書き込みロック）
+
+    同じ企業への従業員登録をトランザクション終了まで直列化する。
+    """
+    db.session.execute(update(Company).where(Company.id == company_id).values(id=Company.id))
+
+
+def check_capacity(company_id, adding=1, already_inserted=False):
+    """ロックを取得したうえで上限を確認し、超える場合は CapacityExceeded を送出する
+
+    already_inserted=True の場合は、同一トランザクションで登録済みの adding 名を含めて数える。
+    有効契約がない企業は従来どおり上限なしとして扱う。
+    上限はスナップショットを使わず、ロックの後に契約・プランから読み直す（プラン変更の直後でも古い上限で判定しない）。
+    ロック後の契約内容と在籍人数（登録分を含む）で作ったスナップショットを返す。
+    """
+    if adding <= 0:
+        return get_entitlement(company_id)
+    lock_company(company_id)
+    row = db.session.execute(contract_statement(company_id)).first()
+    headcount = db.session.execute(headcount_statement(company_id)).scalar()
+    entitlement = build_entitlement(company_id, row, headcount)
+    if entitlement.max_employees is None:
+        return entitlement
+    current = headcount - adding if already_inserted else headcount
+    if current + adding > entitlement.max_employees:
+        raise CapacityExceeded(entitlement.max_employees, current, adding)
+    return entitlement
+
+
+# =============================================================================
+# スナップショットの更新
+# =============================================================================
+
+def invalidate(company_id):
+    entitlement_cache.delete(company_id)
+
+
+# 在籍人数の増減はキャッシュ済みの値に足し込まず、コミット後にスナップショットごと破棄する
+# （コミットからコールバックまでの間に他のスレッドがコミット後の値を読み込んでいると二重に数えるため）
+
+def _on_employee_insert(mapper, connection, target):
+    if target.status == ACTIVE_STATUS:
+        company_id = target.company_id
+        after_commit(target, lambda: invalidate(company_id))
+
+
+def _on_employee_update(mapper, connection, target):
+    if get_history(target, 'company_id').has_changes():
+        company_ids = {target.company_id, *get_history(target, 'company_id').deleted}
+        after_commit(target, lambda: [invalidate(company_id) for company_id in company_ids])
+        return
+    history = get_history(target, 'status')
+    if not history.has_changes():
+        return
+    was_active = ACTIVE_STATUS in (history.deleted or ())
+    if (target.status == ACTIVE_STATUS) != was_active:
+        company_id = target.company_id
+        after_commit(target, lambda: invalidate(company_id))
+
+
+def _on_employee_delete(mapper, connection, target):
+    if target.status == ACTIVE_STATUS:
+        company_id = target.company_id
+        after_commit(target, lambda: invalidate(company_id))
+
+
+def _on_contract_change(mapper, connection, target):
+    company_id = target.company_id
+    after_commit(target, lambda: invalidate(company_id))
+
+
+def _on_plan_update(mapper, connection, target):
+    plan_id = target.id
+
+    def apply():
+        for company_id, entitlement in entitlement_cache.items():
+            if entitlement.plan_id == plan_id:
+                invalidate(company_id)
+    after_commit(target, apply)
+
+
+event.listen(Employee, 'after_insert', _on_employee_insert)
+event.listen(Employee, 'after_update', _on_employee_update)
+event.listen(Employee, 'after_delete', _on_employee_delete)
+for _name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Contract, _name, _on_contract_change)
+event.listen(Plan, 'after_update', _on_plan_update)
+# コミット後に代入した場合も変更前の所属企業・在籍区分を履歴に残す（移動元の企業・退職の判定に使う）
+track_previous_values(Employee.company_id, Employee.status)
@@ -0,0 +1,165 @@
+"""描画済みページ断片のキャッシュと条件付きGET
+
+ページ本体（base.html の content ブロック）を、テンプレート・データのバージョン・クエリ文字列をキーに
+プロセス内の TTLCache にキャッシュする。レイアウト（ナビゲーション・フラッシュメッセージ）は毎回描画する。
+
+データのバージョンは data_version テーブルにスコープごとのカウンタとして持つ。
+
+- plans: Plan / Contract の変更（プラン管理）
+- companies: Company / Contract / Plan の変更（企業管理）
+- employees:<企業ID>: Employee の変更（従業員一覧）
+
+ORM の書き込みはフラッシュ時に同じトランザクション内でカウンタを進めるため、他のワーカープロセスでの更新も
+次のリクエストから反映される。イベントを経由しない一括更新では bump() を呼ぶ（呼ばない場合も TTL で入れ替わる）。
+
+バージョンから ETag と Last-Modified を作り、ブラウザのキャッシュが最新なら描画せずに 304 を返す。
+"""
+import hashlib
+import os
+from datetime import datetime
+from functools import lru_cache
+from importlib import import_module
+from flask import current_app, make_response, render_template, request, session
+from flask_login import current_user
+from markupsafe import Markup
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session, object_session
+from werkzeug.http import is_resource_modified
+from cache import TTLCache
+from models import db, Company, Contract, DataVersion, Employee, Plan
+
+_PENDING_KEY = 'data_version_scopes'
+
+fragment_cache = TTLCache(
+    maxsize=int(os.environ.get('FRAGMENT_CACHE_SIZE', 512)),
+    ttl=int(os.environ.get('FRAGMENT_CACHE_TTL', 600)),
+)
+# これより大きい断片はキャッシュしない（件数上限と合わせてメモリ使用量を抑える）
+MAX_FRAGMENT_BYTES = int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 256 * 1024))
+
+
+def employee_scope(company_id):
+    return f'employees:{company_id}'
+
+
+# =============================================================================
+# データのバージョン
+# =============================================================================
+
+def bump(connection, *scopes):
+    """スコープのバージョンを1つ進める（行がなければ作成する）"""
+    table = DataVersion.__table__
+    now = datetime.utcnow()
+    dialect = connection.dialect.name
+    # 複数のスコープを同時に更新するトランザクション同士でデッドロックしないよう順序をそろえる
+    for scope in sorted(set(scopes)):
+        if dialect in ('sqlite', 'postgresql'):
+            stmt = import_module(f'sqlalchemy.dialects.{dialect}').insert(table).values(
+                scope=scope, version=1, updated_at=now
+            )
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=[table.c.scope], set_={'version': table.c.version + 1, 'updated_at': now}
+            ))
+        elif not connection.execute(
+            update(table).where(table.c.scope == scope).values(version=table.c.version + 1, updated_at=now)
+        ).rowcount:
+            connection.execute(insert(table).values(scope=scope, version=1, updated_at=now))
+
+
+def versions(scopes):
+    """{スコープ: (バージョン, 更新日時)}（未作成のスコープは (0, None)）"""
+    rows = db.session.execute(
+        select(DataVersion.scope, DataVersion.version, DataVersion.updated_at).where(DataVersion.scope.in_(scopes))
+    ).all()
+    found = {scope: (version, updated_at) for scope, version, updated_at in rows}
+    return {scope: found.get(scope, (0, None)) for scope in scopes}
+
+
+def _scopes(target):
+    if isinstance(target, Employee):
+        return [employee_scope(target.company_id)]
+    if isinstance(target, Company):
+        return ['companies']
+    return ['plans', 'companies']
+
+
+def _on_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_KEY, set()).update(_scopes(target))
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_pending(session, flush_context):
+    scopes = session.info.pop(_PENDING_KEY, None)
+    if scopes:
+        bump(session.connection(), *scopes)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
+
+
+for _model in (Employee, Company, Plan, Contract):
+    for _name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _name, _on_change)
+
+
+# =============================================================================
+# 描画
+# =============================================================================
+
+@lru_cache(maxsize=None)
+def _template_stamp(template_name):
+    """テンプレートとレイアウトの更新日時（デプロイでテンプレートが変わったら ETag も変える）"""
+    loader = current_app.jinja_env.loader
+    stamps = []
+    for name in (template_name, 'base.html'):
+        _, filename, _ = loader.get_source(current_app.jinja_env, name)
+        stamps.append(str(int(os.path.getmtime(filename))))
+    return '-'.join(stamps)
+
+
+def _render_content(template_name, context):
+    """テンプレートの content ブロックだけを描画する"""
+    template = current_app.jinja_env.get_template(template_name)
+    current_app.update_template_context(context)
+    return Markup(''.join(template.blocks['content'](template.new_context(context))))
+
+
+def render_page(template_name, scopes, build_context):
+    """データのバージョンが変わるまで content ブロックを使い回してページを返す
+
+    build_context() はテンプレートに渡す dict を返す関数で、キャッシュがない場合だけ呼ばれる。
+    """
+    stamp = versions(scopes)
+    version_key = tuple((scope, stamp[scope][0]) for scope in scopes)
+    last_modified = max((updated_at for _, updated_at in stamp.values() if updated_at), default=None)
+    # フラッシュメッセージを表示するページはブラウザに使い回させない
+    has_flashes = bool(session.get('_flashes'))
+
+    etag = hashlib.sha1(repr((
+        template_name, _template_stamp(template_name), version_key, request.full_path,
+        current_user.get_id(), current_user.name, current_user.email,
+    )).encode()).hexdigest()
+    if not has_flashes and not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    key = (template_name, version_key, request.query_string)
+    content = fragment_cache.get(key)
+    if content is None:
+        content = _render_content(template_name, build_context())
+        if len(content.encode()) <= MAX_FRAGMENT_BYTES:
+            fragment_cache.set(key, content)
+
+    response = make_response(render_template(template_name, content_html=content))
+    response.headers['Cache-Control'] = 'private, no-cache'
+    if not has_flashes:
+        response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified
+    return response
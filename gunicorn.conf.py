@@ -0,0 +1,36 @@
+# gunicorn 設定（gunicorn app:app -c gunicorn.conf.py）
+# ワーカー数・スレッド数は環境変数で上書きできる
+import multiprocessing
+import os
+
+from db_config import worker_threads
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# CPUコア数から決める（I/O待ちが多いため gthread でワーカーあたり複数スレッド）
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = worker_threads()
+
+# アプリをマスターで1回だけ読み込み、ワーカー（max_requests での再起動を含む）は fork するだけで起動する
+# （GUNICORN_PRELOAD=0 で無効。DB接続はワーカーごとに最初のリクエストで作られる）
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1').lower() not in ('0', 'false', 'no', 'off')
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# メモリ断片化対策として一定リクエストごとにワーカーを再起動する
+max_requests = 1000
+max_requests_jitter = 100
+
+
+def post_fork(server, worker):
+    """preload 時、マスターで作られた接続があればワーカーでは使い回さず作り直す"""
+    if not preload_app:
+        return
+    from app import app
+    from models import db
+
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,415 @@
+"""バックグラウンドジョブ
+
+給与計算・従業員の書き出し・一括取込など時間のかかる処理を job テーブルに登録し、
+プロセス内のワーカースレッド（concurrent.futures）で実行する。外部のメッセージブローカーは使わない。
+
+ジョブの取得は status='queued' を条件にした UPDATE で行うため、複数の gunicorn ワーカーや
+`flask jobs-worker` が同じテーブルを共有しても、1件のジョブは1か所でしか実行されない。
+進捗・中止要求は別コネクションの短いトランザクションで読み書きする。SQLite では書き込みロックを
+持ったまま別コネクションから書けないため、ハンドラは progress() を書き込みトランザクションの外で呼ぶこと。
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import OperationalError
+from models import db, Employee, Job
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+STATUS_LABELS = {QUEUED: '待機中', RUNNING: '実行中', SUCCEEDED: '完了', FAILED: '失敗', CANCELLED: '中止'}
+
+POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 2))
+STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 900))
+RETRY_DELAY_SECONDS = 30
+
+HANDLERS = {}
+
+_jobs = Job.__table__
+
+
+def handler(kind, label):
+    """ジョブ種別の登録用デコレータ"""
+    def register(func):
+        HANDLERS[kind] = (label, func)
+        return func
+    return register
+
+
+class JobCancelled(Exception):
+    """中止要求を受けてジョブを打ち切る"""
+
+
+def worker_count():
+    """プロセスあたりのワーカースレッド数（0 ならこのプロセスではジョブを実行しない）"""
+    return int(os.environ.get('JOB_WORKERS', 2))
+
+
+def storage_dir(app):
+    """アップロード・生成ファイルの保存先"""
+    path = os.environ.get('JOB_STORAGE_DIR') or os.path.join(app.instance_path, 'jobs')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _update_job(job_id, **values):
+    with db.engine.begin() as connection:
+        connection.execute(update(_jobs).where(_jobs.c.id == job_id).values(**values))
+
+
+class JobContext:
+    """ハンドラに渡す実行中ジョブの情報"""
+
+    def __init__(self, job, app):
+        self.id = job.id
+        self.company_id = job.company_id
+        self.user_id = job.user_id
+        self.params = json.loads(job.params or '{}')
+        self.input_path = job.input_path
+        self.output_path = None
+        self.app = app
+
+    def output_file(self, extension):
+        """生成ファイルのパスを決めて返す（完了時にジョブへ記録される）"""
+        self.output_path = os.path.join(storage_dir(self.app), f'job-{self.id}.{extension}')
+        return self.output_path
+
+    def progress(self, current, total=None, message=None):
+        """進捗を記録し、中止要求があれば JobCancelled を送出する"""
+        values = {'progress_current': current, 'heartbeat_at': datetime.utcnow()}
+        if total is not None:
+            values['progress_total'] = total
+        if message is not None:
+            values['message'] = message[:500]
+        with db.engine.begin() as connection:
+            connection.execute(update(_jobs).where(_jobs.c.id == self.id).values(**values))
+            cancel_requested = connection.execute(
+                select(_jobs.c.cancel_requested).where(_jobs.c.id == self.id)
+            ).scalar()
+        if cancel_requested:
+            raise JobCancelled()
+
+
+# =============================================================================
+# 登録・操作
+# =============================================================================
+
+def enqueue(kind, company_id=None, user_id=None, params=None, input_path=None, max_attempts=3):
+    """ジョブを登録して返す"""
+    if kind not in HANDLERS:
+        raise ValueError(f'未対応のジョブ種別です: {kind}')
+    job = Job(kind=kind, company_id=company_id, user_id=user_id, params=json.dumps(params or {}),
+              input_path=input_path, max_attempts=max_attempts, status=QUEUED, run_after=datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+    runner.wakeup()
+    return job
+
+
+def cancel(job):
+    """待機中のジョブは中止し、実行中のジョブには中止を要求する。操作できた場合は True"""
+    now = datetime.utcnow()
+    cancelled = db.session.execute(
+        update(_jobs).where(_jobs.c.id == job.id, _jobs.c.status == QUEUED).values(
+            status=CANCELLED, message='中止しました', finished_at=now
+        )
+    ).rowcount
+    if not cancelled:
+        cancelled = db.session.execute(
+            update(_jobs).where(_jobs.c.id == job.id, _jobs.c.status == RUNNING).values(cancel_requested=True)
+        ).rowcount
+    db.session.commit()
+    db.session.refresh(job)
+    return bool(cancelled)
+
+
+def retry(job):
+    """失敗・中止したジョブを再登録する。再登録できた場合は True"""
+    retried = db.session.execute(
+        update(_jobs).where(_jobs.c.id == job.id, _jobs.c.status.in_([FAILED, CANCELLED])).values(
+            status=QUEUED, attempts=0, progress_current=0, progress_total=None, message=None, error=None,
+            result=None, cancel_requested=False, run_after=datetime.utcnow(), started_at=None, finished_at=None,
+        )
+    ).rowcount
+    db.session.commit()
+    db.session.refresh(job)
+    if retried:
+        runner.wakeup()
+    return bool(retried)
+
+
+def to_dict(job):
+    """ジョブの状態（ステータスAPI用）"""
+    percent = None
+    if job.progress_total:
+        percent = min(100, round((job.progress_current or 0) * 100 / job.progress_total))
+    elif job.status == SUCCEEDED:
+        percent = 100
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'label': HANDLERS.get(job.kind, (job.kind,))[0],
+        'status': job.status,
+        'status_label': STATUS_LABELS.get(job.status, job.status),
+        'progress': {'current': job.progress_current or 0, 'total': job.progress_total, 'percent': percent},
+        'message': job.message,
+        'error': job.error,
+        'result': json.loads(job.result) if job.result else None,
+        'attempts': job.attempts,
+        'cancel_requested': bool(job.cancel_requested),
+        'downloadable': job.status == SUCCEEDED and bool(job.output_path),
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+# =============================================================================
+# 実行
+# =============================================================================
+
+def claim_next(worker):
+    """実行可能なジョブを1件取得して実行中にし、その ID を返す（なければ None）"""
+    now = datetime.utcnow()
+    with db.engine.begin() as connection:
+        candidates = connection.execute(
+            select(_jobs.c.id).where(_jobs.c.status == QUEUED, _jobs.c.run_after <= now)
+            .order_by(_jobs.c.id).limit(5)
+        ).scalars().all()
+        for job_id in candidates:
+            claimed = connection.execute(
+                update(_jobs).where(_jobs.c.id == job_id, _jobs.c.status == QUEUED).values(
+                    status=RUNNING, worker=worker, attempts=_jobs.c.attempts + 1,
+                    started_at=now, heartbeat_at=now, cancel_requested=False,
+                )
+            ).rowcount
+            if claimed:
+                return job_id
+    return None
+
+
+def requeue_stale(now=None):
+    """ワーカーが停止して応答のなくなった実行中ジョブを、再試行回数内なら待機中に戻す"""
+    now = now or datetime.utcnow()
+    stale = (_jobs.c.status == RUNNING) & (_jobs.c.heartbeat_at < now - timedelta(seconds=STALE_SECONDS))
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(_jobs).where(stale, _jobs.c.attempts < _jobs.c.max_attempts).values(
+                status=QUEUED, worker=None, run_after=now, message='ワーカーが停止したため再実行します'
+            )
+        )
+        connection.execute(
+            update(_jobs).where(stale).values(
+                status=FAILED, error='ワーカーが応答しなくなりました', finished_at=now
+            )
+        )
+
+
+def run_job(app, job_id):
+    """取得済みのジョブを実行し、結果を記録する"""
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        context = JobContext(job, app)
+        attempts, max_attempts = job.attempts, job.max_attempts
+        label, func = HANDLERS.get(job.kind, (None, None))
+        db.session.commit()
+        try:
+            if func is None:
+                raise ValueError(f'未対応のジョブ種別です: {job.kind}')
+            result = func(context)
+            db.session.commit()
+        except JobCancelled:
+            db.session.rollback()
+            _update_job(job_id, status=CANCELLED, message='中止しました', finished_at=datetime.utcnow())
+        except OperationalError as e:
+            db.session.rollback()
+            logger.warning('ジョブ %s が失敗しました（%s/%s 回目）: %s', job_id, attempts, max_attempts, e)
+            if attempts < max_attempts:
+                _update_job(job_id, status=QUEUED, worker=None, error=str(e.orig),
+                            run_after=datetime.utcnow() + timedelta(seconds=RETRY_DELAY_SECONDS * attempts))
+            else:
+                _update_job(job_id, status=FAILED, error=str(e.orig), finished_at=datetime.utcnow())
+        except Exception as e:
+            db.session.rollback()
+            errors = getattr(e, 'errors', None)
+            if errors is None:
+                logger.exception('ジョブ %s が失敗しました', job_id)
+            else:
+                # 取込ファイルの誤りなど利用者が直すべきエラーはスタックトレースを残さない
+                logger.warning('ジョブ %s が失敗しました: %s', job_id, e)
+            _update_job(job_id, status=FAILED, error=str(e), finished_at=datetime.utcnow(),
+                        result=json.dumps({'errors': errors}, ensure_ascii=False, default=str) if errors else None)
+        else:
+            values = {'status': SUCCEEDED, 'message': '完了しました', 'finished_at': datetime.utcnow(),
+                      'error': None, 'output_path': context.output_path,
+                      'result': json.dumps(result, ensure_ascii=False, default=str) if result is not None else None}
+            _update_job(job_id, **values)
+            if context.input_path and os.path.exists(context.input_path):
+                os.remove(context.input_path)
+        finally:
+            db.session.remove()
+
+
+class JobRunner:
+    """ジョブを取得してスレッドプールで実行するディスパッチャ（プロセスごとに1つ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._running = set()
+
+    def start(self, app, workers=None):
+        """このプロセスでディスパッチャを開始する（開始済み・ワーカー数0なら何もしない）"""
+        if self._pid == os.getpid():
+            return False
+        workers = worker_count() if workers is None else workers
+        if workers <= 0:
+            return False
+        with self._lock:
+            if self._pid == os.getpid():
+                return False
+            self._pid = os.getpid()
+            self.app = app
+            self.name = f'{socket.gethostname()}:{os.getpid()}'
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+            self._slots = threading.BoundedSemaphore(workers)
+            self._running = set()
+            threading.Thread(target=self._loop, name='job-dispatcher', daemon=True).start()
+        return True
+
+    def wakeup(self):
+        self._wakeup.set()
+
+    def run_forever(self, app, workers=None):
+        """ディスパッチャを開始して停止まで待つ（`flask jobs-worker` 用）"""
+        self.start(app, workers or max(worker_count(), 1))
+        while True:
+            time.sleep(3600)
+
+    def _loop(self):
+        while True:
+            try:
+                self.dispatch()
+            except Exception:
+                logger.exception('ジョブの取得に失敗しました')
+            self._wakeup.wait(POLL_INTERVAL)
+            self._wakeup.clear()
+
+    def dispatch(self):
+        """空きスレッドの数だけジョブを取得して実行を開始する"""
+        with self.app.app_context():
+            self._heartbeat()
+            requeue_stale()
+            while self._slots.acquire(blocking=False):
+                job_id = claim_next(self.name)
+                if job_id is None:
+                    self._slots.release()
+                    break
+                self._running.add(job_id)
+                self._executor.submit(self._run, job_id)
+
+    def _run(self, job_id):
+        try:
+            run_job(self.app, job_id)
+        finally:
+            self._running.discard(job_id)
+            self._slots.release()
+            self._wakeup.set()
+
+    def _heartbeat(self):
+        running = list(self._running)
+        if not running:
+            return
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(
+                    update(_jobs).where(_jobs.c.id.in_(running)).values(heartbeat_at=datetime.utcnow())
+                )
+        except OperationalError as e:
+            logger.warning('ジョブのハートビートを記録できませんでした: %s', e)
+
+
+runner = JobRunner()
+
+
+# =============================================================================
+# ジョブ種別
+# =============================================================================
+
+@handler('payroll', '給与計算')
+def payroll_job(context):
+    from payroll import run_company_payroll
+    from worktime import recompute_company_month
+
+    year, month = context.params['year'], context.params['month']
+    context.progress(0, 2, f'{year}年{month}月の労働時間区分を再計算しています')
+    recompute_company_month(context.company_id, year, month)
+    context.progress(1, 2, f'{year}年{month}月の給与を計算しています')
+    result = run_company_payroll(context.company_id, year, month)
+    context.progress(2, 2)
+    return {'year': year, 'month': month, **result}
+
+
+@handler('employee_export', '従業員の書き出し')
+def employee_export_job(context):
+    from employee_io import export_csv, export_xlsx
+
+    file_format = 'csv' if context.params.get('format') == 'csv' else 'xlsx'
+    total = db.session.execute(
+        select(func.count()).select_from(Employee).where(Employee.company_id == context.company_id)
+    ).scalar()
+    context.progress(0, total, '書き出しています')
+    exporter = export_csv if file_format == 'csv' else export_xlsx
+    with open(context.output_file(file_format), 'wb') as output:
+        for chunk in exporter(context.company_id, progress=lambda count: context.progress(count, total)):
+            output.write(chunk)
+    context.progress(total, total)
+    return {'rows': total, 'filename': f"employees_{datetime.now().strftime('%Y%m%d')}.{file_format}"}
+
+
+@handler('payslips', '給与明細の発行')
+def payslips_job(context):
+    from payslip import count_payslips, payslip_filename, payslips_workbook, payslips_zip
+
+    year, month = context.params['year'], context.params['month']
+    file_format = 'xlsx' if context.params.get('format') == 'xlsx' else 'zip'
+    total = count_payslips(context.company_id, year, month)
+    if not total:
+        raise ValueError(f'{year}年{month}月の給与計算結果がありません。先に給与計算を実行してください。')
+    context.progress(0, total, '給与明細を作成しています')
+    generator = payslips_workbook if file_format == 'xlsx' else payslips_zip
+    with open(context.output_file(file_format), 'wb') as output:
+        for chunk in generator(context.company_id, year, month, progress=lambda count: context.progress(count, total)):
+            output.write(chunk)
+    context.progress(total, total)
+    return {'employees': total, 'filename': payslip_filename(year, month, file_format)}
+
+
+@handler('employee_import', '従業員の一括登録')
+def employee_import_job(context):
+    from employee_io import import_employees
+
+    context.progress(0, None, f"{context.params['filename']} を取り込んでいます")
+    with open(context.input_path, 'rb') as stream:
+        inserted = import_employees(context.company_id, stream, context.params['filename'])
+    return {'inserted': inserted}
+
+
+@handler('attendance_import', '勤怠の一括取込')
+def attendance_import_job(context):
+    from attendance_io import ingest_attendance
+
+    context.progress(0, None, f"{context.params['filename']} を取り込んでいます")
+    with open(context.input_path, 'rb') as stream:
+        return ingest_attendance(
+            context.company_id, stream, context.params['format'],
+            progress=lambda rows: context.progress(rows, None, f'{rows:,}行を取り込みました'),
+        )
@@ -0,0 +1,438 @@
+"""有給休暇台帳
+
+有給休暇の取得（WorkingTimeRecord.is_paid_leave）を、取得日時点で有効な付与（LeaveCredit）の
+古いものから順に消化し（先入先出）、その内訳を LeaveConsumption に記録する。
+従業員ごとの残日数は LeaveBalance に保持し、勤怠・付与が変更されるたびにその従業員分だけ更新する。
+
+付与は expiry_date 当日から無効。期限切れの反映は expire_balances() で一括して行うほか、
+get_balance() の時点で次回期限を過ぎていればその従業員分を再集計する。
+勤怠の変更はフラッシュ中に同じコネクションで反映するため、ロールバック時は台帳も元に戻る。
+"""
+import calendar
+from collections import defaultdict
+from datetime import date, datetime
+from sqlalchemy import and_, bindparam, delete, event, func, insert, or_, select, update
+from sqlalchemy.orm.attributes import get_history, set_committed_value
+from attendance_rollup import record_leave_days
+from models import db, track_previous_values, Employee, LeaveBalance, LeaveConsumption, LeaveCredit, WorkingTimeRecord
+
+ACTIVE_STATUS = '在籍中'
+EXPIRY_MONTHS = 24  # 付与日から2年で時効
+AUTO_GRANT_NOTE = '法定付与'
+CHUNK_SIZE = 500
+
+# 勤続6か月で初回付与、以後1年ごと。6年6か月以降は毎年同じ日数
+STATUTORY_DAYS = (10, 11, 12, 14, 16, 18, 20)
+# 週所定労働日数4日以下かつ週30時間未満の比例付与
+PROPORTIONAL_DAYS = {
+    4: (7, 8, 9, 10, 12, 13, 15),
+    3: (5, 6, 6, 8, 9, 10, 11),
+    2: (3, 4, 4, 5, 6, 6, 7),
+    1: (1, 2, 2, 2, 3, 3, 3),
+}
+
+LEAVE_FIELDS = ('is_paid_leave', 'leave_days', 'work_date', 'employee_id')
+CREDIT_FIELDS = ('employee_id', 'grant_date', 'expiry_date', 'days_granted')
+
+_credits = LeaveCredit.__table__
+_consumption = LeaveConsumption.__table__
+_balances = LeaveBalance.__table__
+_records = WorkingTimeRecord.__table__
+_RELEASED_KEY = 'leave_released_records'
+
+
+def _chunks(values, size=CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def add_months(day, months):
+    """day の months か月後（該当日がない月は月末）"""
+    index = day.month - 1 + months
+    year, month = day.year + index // 12, index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+# =============================================================================
+# 先入先出の割当
+# =============================================================================
+
+def allocate(days, work_date, credits):
+    """取得日時点で有効な付与の古い順に days を割り当て、[(credit_id, 日数)] を返す
+
+    credits は [credit_id, grant_date, expiry_date, 残日数] のリスト（付与日昇順）で、
+    残日数はその場で減らす。割り当てきれなかった日数は credit_id=None として返す。
+    """
+    allocations = []
+    for credit in credits:
+        if days <= 0:
+            break
+        credit_id, grant_date, expiry_date, remaining = credit
+        if remaining <= 0 or grant_date > work_date or (expiry_date is not None and expiry_date <= work_date):
+            continue
+        used = min(days, remaining)
+        credit[3] = remaining - used
+        days -= used
+        allocations.append((credit_id, used))
+    if days > 0:
+        allocations.append((None, days))
+    return allocations
+
+
+def _save_allocations(connection, rows):
+    """消化割当を記録し、付与の使用日数・残日数へ反映する"""
+    if not rows:
+        return
+    connection.execute(insert(_consumption), rows)
+    used = defaultdict(float)
+    for row in rows:
+        if row['credit_id'] is not None:
+            used[row['credit_id']] += row['days']
+    if used:
+        connection.execute(
+            update(_credits).where(_credits.c.id == bindparam('b_id')).values(
+                days_used=_credits.c.days_used + bindparam('b_days'),
+                days_remaining=_credits.c.days_remaining - bindparam('b_days'),
+            ),
+            [{'b_id': credit_id, 'b_days': days} for credit_id, days in used.items()]
+        )
+
+
+def _release(connection, record_id):
+    """勤怠1件の消化割当を取り消して付与の残日数を戻す（割当があれば True）"""
+    rows = connection.execute(
+        select(_consumption.c.credit_id, _consumption.c.days).where(_consumption.c.record_id == record_id)
+    ).all()
+    if not rows:
+        return False
+    returned = [{'b_id': credit_id, 'b_days': days} for credit_id, days in rows if credit_id is not None]
+    if returned:
+        connection.execute(
+            update(_credits).where(_credits.c.id == bindparam('b_id')).values(
+                days_used=_credits.c.days_used - bindparam('b_days'),
+                days_remaining=_credits.c.days_remaining + bindparam('b_days'),
+            ),
+            returned
+        )
+    connection.execute(delete(_consumption).where(_consumption.c.record_id == record_id))
+    return True
+
+
+def _consume(connection, record, days):
+    """勤怠1件の取得日数を、その従業員の付与へ割り当てる"""
+    credits = [list(row) for row in connection.execute(
+        select(_credits.c.id, _credits.c.grant_date, _credits.c.expiry_date, _credits.c.days_remaining).where(
+            _credits.c.employee_id == record.employee_id,
+            _credits.c.days_remaining > 0,
+            _credits.c.grant_date <= record.work_date,
+            or_(_credits.c.expiry_date.is_(None), _credits.c.expiry_date > record.work_date),
+        ).order_by(_credits.c.grant_date, _credits.c.id)
+    )]
+    _save_allocations(connection, [
+        {'company_id': record.company_id, 'employee_id': record.employee_id, 'record_id': record.id,
+         'credit_id': credit_id, 'days': used}
+        for credit_id, used in allocate(days, record.work_date, credits)
+    ])
+
+
+def _allocated_after(connection, employee_id, work_date, record_id):
+    """その従業員に、(work_date, record_id) より後の勤怠の消化割当があるか
+
+    割当は取得日順に行うため、これより前の日付の取得を追加・変更・取消した場合は
+    差分では済まず、その従業員の割当を作り直す必要がある。
+    """
+    return connection.execute(
+        select(_consumption.c.id).join(_records, _records.c.id == _consumption.c.record_id).where(
+            _consumption.c.employee_id == employee_id,
+            or_(_records.c.work_date > work_date,
+                and_(_records.c.work_date == work_date, _records.c.id > record_id)),
+        ).limit(1)
+    ).first() is not None
+
+
+# =============================================================================
+# 残日数の集計
+# =============================================================================
+
+def refresh_balances(connection, employee_ids=None, today=None):
+    """指定従業員（None なら全従業員）の LeaveBalance を付与・割当から再集計する"""
+    today = today or date.today()
+    if employee_ids is None:
+        chunks = [None]
+    else:
+        chunks = list(_chunks(sorted(set(employee_ids))))
+    for chunk in chunks:
+        def scoped(stmt, column):
+            return stmt if chunk is None else stmt.where(column.in_(chunk))
+
+        employees = connection.execute(scoped(select(Employee.id, Employee.company_id), Employee.id)).all()
+        remaining = {row[0]: row[1:] for row in connection.execute(scoped(
+            select(_credits.c.employee_id, func.sum(_credits.c.days_remaining), func.min(_credits.c.expiry_date)).where(
+                _credits.c.days_remaining > 0,
+                or_(_credits.c.expiry_date.is_(None), _credits.c.expiry_date > today),
+            ).group_by(_credits.c.employee_id),
+            _credits.c.employee_id,
+        ))}
+        unallocated = dict(connection.execute(scoped(
+            select(_consumption.c.employee_id, func.sum(_consumption.c.days)).where(
+                _consumption.c.credit_id.is_(None)
+            ).group_by(_consumption.c.employee_id),
+            _consumption.c.employee_id,
+        )).all())
+        existing = set(connection.execute(scoped(select(_balances.c.employee_id), _balances.c.employee_id)).scalars())
+
+        now = datetime.utcnow()
+        inserts, updates = [], []
+        for employee_id, company_id in employees:
+            days_remaining, next_expiry = remaining.get(employee_id, (0.0, None))
+            values = {
+                'company_id': company_id,
+                'days_remaining': days_remaining or 0.0,
+                'days_unallocated': unallocated.get(employee_id) or 0.0,
+                'next_expiry_date': next_expiry,
+                'as_of': today,
+                'updated_at': now,
+            }
+            if employee_id in existing:
+                updates.append({'b_employee_id': employee_id, **values})
+            else:
+                inserts.append({'employee_id': employee_id, **values})
+        if updates:
+            connection.execute(
+                update(_balances).where(_balances.c.employee_id == bindparam('b_employee_id')),
+                updates
+            )
+        if inserts:
+            connection.execute(insert(_balances), inserts)
+
+
+def rebuild_allocations(connection, employee_ids=None, today=None):
+    """指定従業員（None なら全従業員）の消化割当を作り直し、残日数を再集計する
+
+    一括取込やデータ修正など、勤怠・付与を ORM のイベントを経由せずに更新した後に呼ぶ。
+    """
+    if employee_ids is None:
+        employee_ids = connection.execute(select(Employee.id)).scalars().all()
+    employee_ids = sorted(set(employee_ids))
+    for chunk in _chunks(employee_ids):
+        connection.execute(delete(_consumption).where(_consumption.c.employee_id.in_(chunk)))
+        connection.execute(
+            update(_credits).where(_credits.c.employee_id.in_(chunk)).values(
+                days_used=0, days_remaining=_credits.c.days_granted
+            )
+        )
+        credits = defaultdict(list)
+        for row in connection.execute(
+            select(_credits.c.id, _credits.c.employee_id, _credits.c.grant_date, _credits.c.expiry_date,
+                   _credits.c.days_granted)
+            .where(_credits.c.employee_id.in_(chunk))
+            .order_by(_credits.c.employee_id, _credits.c.grant_date, _credits.c.id)
+        ):
+            credits[row.employee_id].append([row.id, row.grant_date, row.expiry_date, row.days_granted])
+
+        rows = []
+        for record in connection.execute(
+            select(_records.c.id, _records.c.company_id, _records.c.employee_id, _records.c.work_date,
+                   _records.c.leave_days)
+            .where(_records.c.employee_id.in_(chunk), _records.c.is_paid_leave == True)  # noqa: E712
+            .order_by(_records.c.employee_id, _records.c.work_date, _records.c.id)
+        ):
+            days = record_leave_days(True, record.leave_days)
+            for credit_id, used in allocate(days, record.work_date, credits[record.employee_id]):
+                rows.append({'company_id': record.company_id, 'employee_id': record.employee_id,
+                             'record_id': record.id, 'credit_id': credit_id, 'days': used})
+        _save_allocations(connection, rows)
+    refresh_balances(connection, employee_ids, today)
+
+
+def get_balance(employee_id, today=None):
+    """従業員の LeaveBalance（台帳未作成なら None）。次回期限を過ぎていれば再集計してから返す"""
+    today = today or date.today()
+    balance = db.session.get(LeaveBalance, employee_id)
+    if balance is not None and balance.next_expiry_date is not None and balance.next_expiry_date <= today:
+        refresh_balances(db.session.connection(), [employee_id], today)
+        db.session.refresh(balance)
+    return balance
+
+
+def expire_balances(today=None, commit=True):
+    """有効期限を迎えた付与を残日数から外す。再集計した従業員数を返す"""
+    today = today or date.today()
+    connection = db.session.connection()
+    employee_ids = connection.execute(
+        select(_balances.c.employee_id).where(_balances.c.next_expiry_date <= today)
+    ).scalars().all()
+    if employee_ids:
+        refresh_balances(connection, employee_ids, today)
+    if commit:
+        db.session.commit()
+    return len(employee_ids)
+
+
+# =============================================================================
+# 法定付与
+# =============================================================================
+
+def statutory_days(service_index, working_days, working_hours):
+    """勤続区分（0: 6か月, 1: 1年6か月, … 6: 6年6か月以上）と週の所定労働から付与日数を返す"""
+    service_index = min(service_index, len(STATUTORY_DAYS) - 1)
+    working_days = working_days or 5
+    working_hours = working_hours or 8.0
+    if working_days in PROPORTIONAL_DAYS and working_days * working_hours < 30:
+        return PROPORTIONAL_DAYS[working_days][service_index]
+    return STATUTORY_DAYS[service_index]
+
+
+def grant_schedule(join_date, until):
+    """入社日から until までの法定付与日と勤続区分を順に返す"""
+    index = 0
+    while True:
+        grant_date = add_months(join_date, 6 + 12 * index)
+        if grant_date > until:
+            return
+        yield grant_date, index
+        index += 1
+
+
+def grant_statutory_leave(today=None, company_id=None, commit=True):
+    """在籍中の全従業員（company_id 指定時はその企業のみ）に、today までに到来した法定付与を行う
+
+    従業員ごとの最終付与日を1回のクエリで読み、最終付与日より後で時効前の付与をまとめて登録する。
+    出勤率8割の要件は勤怠から判定できないため考慮しない。
+    """
+    today = today or date.today()
+    connection = db.session.connection()
+    last_grant = (
+        select(_credits.c.employee_id, func.max(_credits.c.grant_date).label('last_grant_date'))
+        .group_by(_credits.c.employee_id)
+        .subquery()
+    )
+    stmt = (
+        select(Employee.id, Employee.company_id, Employee.join_date, Employee.standard_working_days,
+               Employee.standard_working_hours, last_grant.c.last_grant_date)
+        .outerjoin(last_grant, last_grant.c.employee_id == Employee.id)
+        .where(Employee.status == ACTIVE_STATUS, Employee.join_date.is_not(None))
+    )
+    if company_id is not None:
+        stmt = stmt.where(Employee.company_id == company_id)
+
+    now = datetime.utcnow()
+    rows = []
+    employees = 0
+    for employee_id, emp_company_id, join_date, working_days, working_hours, last_grant_date in connection.execute(stmt):
+        employees += 1
+        for grant_date, index in grant_schedule(join_date, today):
+            expiry_date = add_months(grant_date, EXPIRY_MONTHS)
+            if (last_grant_date is not None and grant_date <= last_grant_date) or expiry_date <= today:
+                continue
+            days = statutory_days(index, working_days, working_hours)
+            rows.append({
+                'company_id': emp_company_id, 'employee_id': employee_id, 'grant_date': grant_date,
+                'days_granted': days, 'expiry_date': expiry_date, 'days_used': 0, 'days_remaining': days,
+                'fiscal_year': grant_date.year, 'notes': AUTO_GRANT_NOTE, 'created_at': now,
+            })
+
+    if rows:
+        connection.execute(insert(_credits), rows)
+        granted_ids = {row['employee_id'] for row in rows}
+        # 付与前に残日数不足だった取得は、新しい付与で賄える場合があるため割り当て直す
+        shortfall_ids = set()
+        for chunk in _chunks(sorted(granted_ids)):
+            shortfall_ids.update(connection.execute(
+                select(_consumption.c.employee_id).where(
+                    _consumption.c.employee_id.in_(chunk), _consumption.c.credit_id.is_(None)
+                ).distinct()
+            ).scalars())
+        if shortfall_ids:
+            rebuild_allocations(connection, shortfall_ids, today)
+        refresh_balances(connection, granted_ids - shortfall_ids, today)
+    if commit:
+        db.session.commit()
+    return {'employees': employees, 'granted': len(rows), 'days': sum(row['days_granted'] for row in rows)}
+
+
+# =============================================================================
+# 変更の反映
+# =============================================================================
+
+def _on_record_insert(mapper, connection, target):
+    days = record_leave_days(target.is_paid_leave, target.leave_days)
+    if not days:
+        return
+    if _allocated_after(connection, target.employee_id, target.work_date, target.id):
+        rebuild_allocations(connection, [target.employee_id])
+        return
+    _consume(connection, target, days)
+    refresh_balances(connection, [target.employee_id])
+
+
+def _on_record_update(mapper, connection, target):
+    if not any(get_history(target, field).has_changes() for field in LEAVE_FIELDS):
+        return
+    employee_ids = {target.employee_id, *get_history(target, 'employee_id').deleted}
+    earliest = min([target.work_date, *get_history(target, 'work_date').deleted])
+    changed = _release(connection, target.id)
+    # 取消・変更した日より後の割当がある従業員は、取得日順に割り当て直す
+    stale = {employee_id for employee_id in employee_ids
+             if _allocated_after(connection, employee_id, earliest, target.id)}
+    days = record_leave_days(target.is_paid_leave, target.leave_days)
+    if stale:
+        rebuild_allocations(connection, stale)
+    if days and target.employee_id not in stale:
+        _consume(connection, target, days)
+    if changed or days:
+        refresh_balances(connection, employee_ids - stale)
+
+
+def _on_record_delete(mapper, connection, target):
+    if _release(connection, target.id):
+        connection.info.setdefault(_RELEASED_KEY, set()).add(target.id)
+
+
+def _on_record_after_delete(mapper, connection, target):
+    released = connection.info.get(_RELEASED_KEY, set())
+    if target.id not in released:
+        return
+    released.discard(target.id)
+    if _allocated_after(connection, target.employee_id, target.work_date, target.id):
+        rebuild_allocations(connection, [target.employee_id])
+    else:
+        refresh_balances(connection, [target.employee_id])
+
+
+def _on_credit_insert(mapper, connection, target):
+    days_used = target.days_used or 0
+    connection.execute(
+        update(_credits).where(_credits.c.id == target.id).values(
+            days_used=days_used, days_remaining=target.days_granted - days_used
+        )
+    )
+    set_committed_value(target, 'days_used', days_used)
+    set_committed_value(target, 'days_remaining', target.days_granted - days_used)
+    rebuild_allocations(connection, [target.employee_id])
+
+
+def _on_credit_update(mapper, connection, target):
+    if any(get_history(target, field).has_changes() for field in CREDIT_FIELDS):
+        rebuild_allocations(connection, {target.employee_id, *get_history(target, 'employee_id').deleted})
+
+
+def _on_credit_before_delete(mapper, connection, target):
+    connection.execute(update(_consumption).where(_consumption.c.credit_id == target.id).values(credit_id=None))
+
+
+def _on_credit_delete(mapper, connection, target):
+    rebuild_allocations(connection, [target.employee_id])
+
+
+event.listen(WorkingTimeRecord, 'after_insert', _on_record_insert)
+event.listen(WorkingTimeRecord, 'after_update', _on_record_update)
+event.listen(WorkingTimeRecord, 'before_delete', _on_record_delete)
+event.listen(WorkingTimeRecord, 'after_delete', _on_record_after_delete)
+event.listen(LeaveCredit, 'after_insert', _on_credit_insert)
+event.listen(LeaveCredit, 'after_update', _on_credit_update)
+event.listen(LeaveCredit, 'before_delete', _on_credit_before_delete)
+event.listen(LeaveCredit, 'after_delete', _on_credit_delete)
+# コミット後に代入した場合も変更前の従業員・取得日を履歴に残す（移動元の従業員・割り当て直す範囲の判定に使う）
+track_previous_values(WorkingTimeRecord.employee_id, WorkingTimeRecord.work_date, LeaveCredit.employee_id)
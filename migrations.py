@@ -0,0 +1,215 @@
+"""スキーママイグレーション
+
+適用済みのバージョンを schema_version テーブルで管理し、未適用のマイグレーションを順に実行する。
+各マイグレーションは冪等に書くこと（新規DBでは初期スキーマで既に作成済みの場合がある）。
+"""
+from datetime import date, datetime
+from sqlalchemy import delete, func, inspect, or_, select, text
+from models import db
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """マイグレーション登録用デコレータ"""
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return func
+    return register
+
+
+# =============================================================================
+# ヘルパー
+# =============================================================================
+
+def index_names(connection, table_name):
+    """テーブルに存在するインデックス名（式インデックスを含む）"""
+    if connection.dialect.name == 'sqlite':
+        return set(connection.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"
+        ), {'table': table_name}).scalars())
+    if connection.dialect.name == 'postgresql':
+        return set(connection.execute(text(
+            'SELECT indexname FROM pg_indexes WHERE tablename = :table'
+        ), {'table': table_name}).scalars())
+    return {index['name'] for index in inspect(connection).get_indexes(table_name)}
+
+
+def create_missing_indexes(connection, tables=None):
+    """モデルに定義されたインデックスのうち、DBに存在しないものを作成する"""
+    created = []
+    for table in db.metadata.sorted_tables:
+        if tables is not None and table.name not in tables:
+            continue
+        existing = index_names(connection, table.name)
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+                created.append(index.name)
+    return created
+
+
+def add_missing_columns(connection, table_name):
+    """モデルに定義された列のうち、DBに存在しないものを ALTER TABLE で追加する"""
+    inspector = inspect(connection)
+    existing = {column['name'] for column in inspector.get_columns(table_name)}
+    table = db.metadata.tables[table_name]
+    preparer = connection.dialect.identifier_preparer
+    added = []
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        column_type = column.type.compile(dialect=connection.dialect)
+        ddl = f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column_type}'
+        default = column.default.arg if column.default is not None and column.default.is_scalar else None
+        if default is not None:
+            ddl += f' DEFAULT {_literal(connection, default)}'
+        connection.execute(text(ddl))
+        added.append(column.name)
+    return added
+
+
+def _literal(connection, value):
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+# =============================================================================
+# マイグレーション定義
+# =============================================================================
+
+# マイグレーション導入前からあるテーブル（以降のテーブルはそれぞれのマイグレーションで作る）
+BASELINE_TABLES = (
+    'company', 'plan', 'contract', 'user', 'employee', 'working_time_record', 'payroll_calculation', 'leave_credit',
+)
+
+
+@migration(1, '初期スキーマ')
+def initial_schema(connection):
+    db.metadata.create_all(connection, tables=[db.metadata.tables[name] for name in BASELINE_TABLES])
+
+
+@migration(2, 'テナント別検索用の複合インデックス')
+def tenant_indexes(connection):
+    payroll = db.metadata.tables['payroll_calculation']
+    if 'uq_payroll_employee_month' not in index_names(connection, 'payroll_calculation'):
+        # 一意インデックスの作成前に、同じ従業員・年月の計算結果は最後に保存したもの（ID最大）だけを残す
+        latest = select(func.max(payroll.c.id)).group_by(
+            payroll.c.company_id, payroll.c.employee_id, payroll.c.year, payroll.c.month
+        )
+        connection.execute(delete(payroll).where(payroll.c.id.not_in(latest)))
+    create_missing_indexes(connection, tables={
+        'contract', 'employee', 'working_time_record', 'payroll_calculation', 'leave_credit', 'user',
+    })
+
+
+@migration(3, '従業員一覧の並び順に合わせた式インデックス')
+def employee_sort_index(connection):
+    if 'ix_employee_company_employee_id' in index_names(connection, 'employee'):
+        connection.execute(text('DROP INDEX ix_employee_company_employee_id'))
+    create_missing_indexes(connection, tables={'employee'})
+
+
+@migration(4, '有給休暇台帳（消化割当・残日数）')
+def leave_ledger(connection):
+    from leave import rebuild_allocations
+
+    db.metadata.create_all(connection, tables=[
+        db.metadata.tables['leave_consumption'], db.metadata.tables['leave_balance'],
+    ])
+    rebuild_allocations(connection)
+
+
+@migration(5, '月次勤怠集計')
+def attendance_monthly(connection):
+    from attendance_rollup import rebuild
+
+    db.metadata.create_all(connection, tables=[db.metadata.tables['attendance_monthly']])
+    # この時点では勤怠アーカイブ（マイグレーション 9）のテーブルがないため、勤怠記録だけから作る
+    rebuild(connection, archives=False)
+
+
+@migration(6, 'バックグラウンドジョブ')
+def job_table(connection):
+    db.metadata.create_all(connection, tables=[db.metadata.tables['job']])
+
+
+@migration(7, 'データバージョン（ページ断片キャッシュ）')
+def data_version_table(connection):
+    db.metadata.create_all(connection, tables=[db.metadata.tables['data_version']])
+
+
+@migration(8, '契約の自動更新と期限間近の一覧')
+def contract_schedule(connection):
+    add_missing_columns(connection, 'contract')
+    db.metadata.create_all(connection, tables=[
+        db.metadata.tables['expiring_contract'], db.metadata.tables['contract_tick'],
+    ])
+    # 実行状況の行は1行だけ作っておき、一覧の作り直しはこの行をロックして直列化する（初回は必ず作り直す）
+    tick = db.metadata.tables['contract_tick']
+    if connection.execute(select(func.count()).select_from(tick)).scalar() == 0:
+        connection.execute(tick.insert().values(id=1, as_of=date.min, source_version=-1, renewed=0, deactivated=0,
+                                                finished_at=datetime.utcnow()))
+
+
+@migration(9, '勤怠アーカイブ')
+def attendance_archive_table(connection):
+    db.metadata.create_all(connection, tables=[db.metadata.tables['attendance_archive']])
+
+
+@migration(10, '有給取得日数の未入力を1日として集計')
+def paid_leave_default_days(connection):
+    from attendance_rollup import rebuild
+
+    # 日数が未入力・0 の有給は月次勤怠集計では0日、有給休暇台帳では1日と数えていたため、該当する企業を作り直す
+    records = db.metadata.tables['working_time_record']
+    company_ids = connection.execute(select(records.c.company_id).where(
+        records.c.is_paid_leave == True,  # noqa: E712
+        or_(records.c.leave_days.is_(None), records.c.leave_days == 0),
+    ).distinct()).scalars().all()
+    for company_id in company_ids:
+        rebuild(connection, company_id)
+
+
+# =============================================================================
+# 実行
+# =============================================================================
+
+def _ensure_version_table(connection):
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_version ('
+        'version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at TIMESTAMP)'
+    ))
+
+
+def current_version(connection):
+    _ensure_version_table(connection)
+    return connection.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+
+
+def pending_migrations(connection):
+    version = current_version(connection)
+    return [item for item in MIGRATIONS if item[0] > version]
+
+
+def upgrade(engine=None):
+    """未適用のマイグレーションを適用し、適用したバージョンのリストを返す"""
+    engine = engine or db.engine
+    applied = []
+    with engine.begin() as connection:
+        _ensure_version_table(connection)
+    for version, description, func in MIGRATIONS:
+        with engine.begin() as connection:
+            if version <= current_version(connection):
+                continue
+            func(connection)
+            connection.execute(
+                text('INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)'),
+                {'v': version, 'd': description, 't': datetime.utcnow()}
+            )
+        applied.append((version, description))
+    return applied
@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import event
 from datetime import datetime, date
 
 db = SQLAlchemy()
@@ -21,6 +22,13 @@ class Company(db.Model):
     users = db.relationship('User', backref='company', lazy=True)
     employees = db.relationship('Employee', backref='company', lazy=True)
     contracts = db.relationship('Contract', backref='company', lazy=True)
+    # 有効な契約（1社につき1件を前提とする）
+    active_contract = db.relationship(
+        'Contract',
+        primaryjoin='and_(Company.id == Contract.company_id, Contract.is_active == True)',
+        viewonly=True,
+        uselist=False,
+    )
 
 # プラン定義
 class Plan(db.Model):
@@ -39,6 +47,10 @@ class Plan(db.Model):
 # 契約管理
 class Contract(db.Model):
     __tablename__ = 'contract'
+    __table_args__ = (
+        db.Index('ix_contract_company_active_end', 'company_id', 'is_active', 'end_date'),
+        db.Index('ix_contract_active_end', 'is_active', 'end_date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
@@ -48,6 +60,7 @@ class Contract(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     monthly_fee = db.Column(db.Integer)  # 契約時の月額（プラン変更履歴用）
     billing_cycle = db.Column(db.String(20), default='monthly')  # monthly / yearly
+    auto_renew = db.Column(db.Boolean, default=False)  # 期限の翌日から同じ課金サイクルで自動更新する
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -64,7 +77,7 @@ class User(UserMixin, db.Model):
     password = db.Column(db.String(200), nullable=False)
     name = db.Column(db.String(100))
     role = db.Column(db.String(20), nullable=False)  # saas_admin, company_admin
-    company_id = db.Column(db.Integer, db.ForeignKey('company.id'))
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), index=True)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime)
@@ -72,6 +85,9 @@ class User(UserMixin, db.Model):
 # 従業員マスタ
 class Employee(db.Model):
     __tablename__ = 'employee'
+    __table_args__ = (
+        db.Index('ix_employee_company_status', 'company_id', 'status'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
@@ -107,9 +123,16 @@ class Employee(db.Model):
     payroll_calculations = db.relationship('PayrollCalculation', backref='employee', lazy=True)
     leave_credits = db.relationship('LeaveCredit', backref='employee', lazy=True)
 
+# 従業員一覧の並び順（社員番号未設定は空文字扱い, id）に対応する式インデックス
+db.Index('ix_employee_company_sort', Employee.company_id, db.func.coalesce(Employee.employee_id, ''), Employee.id)
+
 # 労働時間記録
 class WorkingTimeRecord(db.Model):
     __tablename__ = 'working_time_record'
+    __table_args__ = (
+        db.Index('ix_working_time_record_company_date', 'company_id', 'work_date'),
+        db.Index('ix_working_time_record_employee_date', 'employee_id', 'work_date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
@@ -141,6 +164,9 @@ class WorkingTimeRecord(db.Model):
 # 給与計算結果
 class PayrollCalculation(db.Model):
     __tablename__ = 'payroll_calculation'
+    __table_args__ = (
+        db.Index('uq_payroll_employee_month', 'company_id', 'employee_id', 'year', 'month', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
@@ -180,6 +206,9 @@ class PayrollCalculation(db.Model):
 # 有給休暇付与
 class LeaveCredit(db.Model):
     __tablename__ = 'leave_credit'
+    __table_args__ = (
+        db.Index('ix_leave_credit_employee_grant', 'employee_id', 'grant_date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
@@ -192,3 +221,147 @@ class LeaveCredit(db.Model):
     fiscal_year = db.Column(db.Integer)  # 年度
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# 有給休暇の消化割当（どの勤怠記録がどの付与から何日消化したか。credit_id が NULL の行は残日数不足分）
+class LeaveConsumption(db.Model):
+    __tablename__ = 'leave_consumption'
+    __table_args__ = (
+        db.Index('ix_leave_consumption_record', 'record_id'),
+        db.Index('ix_leave_consumption_credit', 'credit_id'),
+        db.Index('ix_leave_consumption_employee', 'employee_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
+    record_id = db.Column(db.Integer, db.ForeignKey('working_time_record.id'), nullable=False)
+    credit_id = db.Column(db.Integer, db.ForeignKey('leave_credit.id'))
+    days = db.Column(db.Float, nullable=False)
+
+# 有給休暇残日数（従業員ごとに集計済みの値を保持）
+class LeaveBalance(db.Model):
+    __tablename__ = 'leave_balance'
+
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), primary_key=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False, index=True)
+    days_remaining = db.Column(db.Float, nullable=False, default=0)  # 有効な付与の残日数合計
+    days_unallocated = db.Column(db.Float, nullable=False, default=0)  # 残日数不足で割り当てられなかった取得日数
+    next_expiry_date = db.Column(db.Date)  # 残日数のある付与のうち最も早い有効期限
+    as_of = db.Column(db.Date)  # 集計基準日
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# 月次勤怠集計（従業員・月ごとの勤怠合計。勤怠の変更時に差分で更新する）
+class AttendanceMonthly(db.Model):
+    __tablename__ = 'attendance_monthly'
+    __table_args__ = (
+        db.Index('uq_attendance_monthly', 'company_id', 'year', 'month', 'employee_id', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+
+    record_count = db.Column(db.Integer, nullable=False, default=0)  # 勤怠記録件数
+    working_days = db.Column(db.Integer, nullable=False, default=0)  # 出勤日数
+    absent_days = db.Column(db.Integer, nullable=False, default=0)  # 欠勤日数
+    paid_leave_days = db.Column(db.Float, nullable=False, default=0)  # 有給取得日数
+    regular_hours = db.Column(db.Float, nullable=False, default=0)
+    overtime_in_legal = db.Column(db.Float, nullable=False, default=0)
+    overtime_out_legal = db.Column(db.Float, nullable=False, default=0)
+    legal_holiday_hours = db.Column(db.Float, nullable=False, default=0)
+    non_legal_holiday_hours = db.Column(db.Float, nullable=False, default=0)
+    late_night_hours = db.Column(db.Float, nullable=False, default=0)
+
+# 勤怠アーカイブ（給与計算で締めた月の勤怠を企業・年ごとの列指向ファイルへ移した記録）
+class AttendanceArchive(db.Model):
+    __tablename__ = 'attendance_archive'
+
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Integer, primary_key=True)
+    record_count = db.Column(db.Integer, nullable=False, default=0)  # アーカイブした勤怠の件数
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# バックグラウンドジョブ（給与計算・取込・書き出しをリクエスト外で実行する）
+class Job(db.Model):
+    __tablename__ = 'job'
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+        db.Index('ix_job_company_created', 'company_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    kind = db.Column(db.String(50), nullable=False)  # payroll, employee_export, employee_import, attendance_import
+    params = db.Column(db.Text)  # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed, cancelled
+    progress_current = db.Column(db.Integer, default=0)
+    progress_total = db.Column(db.Integer)
+    message = db.Column(db.String(500))
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    input_path = db.Column(db.String(500))  # アップロードされたファイル
+    output_path = db.Column(db.String(500))  # 生成したファイル
+    worker = db.Column(db.String(100))
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)  # 再試行の待ち合わせ
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+# データのバージョン（ページ断片キャッシュ・ETag 用。スコープごとに書き込みのたびに1つ進める）
+class DataVersion(db.Model):
+    __tablename__ = 'data_version'
+
+    scope = db.Column(db.String(100), primary_key=True)  # plans, companies, employees:<企業ID>
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# 契約期限が近い企業の一覧（contracts.tick で作り直す。SaaS管理者ダッシュボード用）
+class ExpiringContract(db.Model):
+    __tablename__ = 'expiring_contract'
+
+    contract_id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, nullable=False)
+    company_name = db.Column(db.String(200))
+    plan_name = db.Column(db.String(100))
+    end_date = db.Column(db.Date, nullable=False, index=True)
+
+
+# 契約の期限処理の実行状況（1行のみ）
+class ContractTick(db.Model):
+    __tablename__ = 'contract_tick'
+
+    id = db.Column(db.Integer, primary_key=True)
+    as_of = db.Column(db.Date, nullable=False)  # 期限処理・一覧作成の基準日
+    source_version = db.Column(db.Integer, nullable=False, default=0)  # 一覧作成時の data_version（companies）
+    renewed = db.Column(db.Integer, default=0)
+    deactivated = db.Column(db.Integer, default=0)
+    finished_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# 変更前の値を履歴に残す属性（フラッシュ時のイベントで変更前の値を使うモジュールが登録する）
+_tracked_attributes = set()
+
+
+def _load_previous(target, value, oldvalue, initiator):
+    pass
+
+
+def track_previous_values(*attributes):
+    """コミット後（属性が期限切れ）に代入した場合も、変更前の値を読み込んで get_history() の deleted に残す
+
+    同じ属性を複数のモジュールから登録しても、リスナーは1回だけ登録する。
+    """
+    for attribute in attributes:
+        key = (attribute.class_, attribute.key)
+        if key not in _tracked_attributes:
+            _tracked_attributes.add(key)
+            event.listen(attribute, 'set', _load_previous, active_history=True)
@@ -0,0 +1,187 @@
+"""パスワードのハッシュ計算とログイン試行の制限
+
+ハッシュ計算・照合は CPU を数十ミリ秒以上使うため、同時実行数を PASSWORD_HASH_WORKERS に制限した
+スレッドプールで行う。待ちが PASSWORD_HASH_QUEUE 件を超えたら計算せずに PasswordHashBusy を送出し、
+ログインが集中しても gunicorn のスレッドが照合待ちで埋まって他のルートが止まらないようにする。
+
+ハッシュ方式は PASSWORD_HASH_METHOD（werkzeug の method 形式。例: scrypt、scrypt:16384:8:1、pbkdf2:sha256:600000）で指定し、
+保存済みのハッシュと方式・パラメータが異なる場合はログイン成功時に作り直す（needs_rehash）。
+
+ログイン試行はプロセス内のスライディングウィンドウで数え、上限を超えたメールアドレス・IPアドレスは
+User の検索やハッシュ計算を行う前に拒否する（ワーカープロセスごとに数えるため、実際の上限はワーカー数倍になる）。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordHashBusy(Exception):
+    """ハッシュ計算の待ちが上限に達した"""
+
+
+def hash_method():
+    return os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+
+
+def hash_workers():
+    """ハッシュ計算の同時実行数（0 のときはリクエストのスレッドでそのまま計算する）"""
+    return int(os.environ.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 1) // 2)))
+
+
+class HashExecutor:
+    """同時実行数と待ち件数を制限したハッシュ計算用のスレッドプール"""
+
+    def __init__(self, workers, queue_size):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password') if workers else None
+        self._slots = threading.BoundedSemaphore(workers + queue_size) if workers else None
+
+    def run(self, func, *args):
+        if self._executor is None:
+            return func(*args)
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashBusy()
+        try:
+            return self._executor.submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = hash_workers()
+                _executor = HashExecutor(workers, int(os.environ.get('PASSWORD_HASH_QUEUE', workers)))
+    return _executor
+
+
+def hash_password(password):
+    """設定された方式でハッシュを作る（PasswordHashBusy を送出することがある）"""
+    return executor().run(generate_password_hash, password, hash_method())
+
+
+@lru_cache(maxsize=8)
+def _dummy_hash(method):
+    return generate_password_hash(os.urandom(16).hex(), method)
+
+
+def _check_dummy(password, method):
+    check_password_hash(_dummy_hash(method), password)
+    return False
+
+
+def verify_password(password_hash, password):
+    """パスワードを照合する（PasswordHashBusy を送出することがある）
+
+    password_hash が空（該当ユーザーなし）でも同じ方式のダミーのハッシュと照合してから False を返し、
+    応答時間からメールアドレスが登録済みかどうかを判別できないようにする。
+    """
+    if password is None:
+        return False
+    if not password_hash:
+        return executor().run(_check_dummy, password, hash_method())
+    return executor().run(check_password_hash, password_hash, password)
+
+
+@lru_cache(maxsize=8)
+def _method_prefix(method):
+    # 既定値を補ったパラメータ（例: scrypt → scrypt:32768:8:1）はハッシュを1回作って確かめる
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+def needs_rehash(password_hash):
+    """保存済みのハッシュが現在の方式・パラメータと異なるか"""
+    return password_hash.split('$', 1)[0] != _method_prefix(hash_method())
+
+
+# =============================================================================
+# ログイン試行の制限
+# =============================================================================
+
+class SlidingWindowLimiter:
+    """キーごとに直近 window 秒の回数を数え、limit 回に達したら制限する（キー数は maxsize まで）"""
+
+    def __init__(self, limit, window, maxsize=10000):
+        self.limit = limit
+        self.window = window
+        self.maxsize = maxsize
+        self._hits = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        hits = self._hits.get(key)
+        if hits is None:
+            return None
+        while hits and hits[0] <= now - self.window:
+            hits.popleft()
+        if not hits:
+            del self._hits[key]
+            return None
+        return hits
+
+    def retry_after(self, key):
+        """制限中なら解除までの秒数、制限されていなければ 0"""
+        if not self.limit:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            hits = self._recent(key, now)
+            if hits is None or len(hits) < self.limit:
+                return 0
+            return max(1, int(hits[-self.limit] + self.window - now) + 1)
+
+    def hit(self, key):
+        if not self.limit:
+            return
+        now = time.monotonic()
+        with self._lock:
+            hits = self._recent(key, now)
+            if hits is None:
+                hits = self._hits[key] = deque(maxlen=self.limit)
+            hits.append(now)
+            self._hits.move_to_end(key)
+            while len(self._hits) > self.maxsize:
+                self._hits.popitem(last=False)
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._hits.clear()
+
+
+_window = int(os.environ.get('LOGIN_THROTTLE_WINDOW', 300))
+# メールアドレスごとの失敗回数
+email_limiter = SlidingWindowLimiter(int(os.environ.get('LOGIN_THROTTLE_EMAIL', 5)), _window)
+# IPアドレスごとの試行回数（成功を含む）
+ip_limiter = SlidingWindowLimiter(int(os.environ.get('LOGIN_THROTTLE_IP', 30)), _window)
+
+
+def login_retry_after(email, ip):
+    """メールアドレス・IPアドレスのどちらかが制限中なら解除までの秒数を返す（制限されていなければ 0）"""
+    return max(email_limiter.retry_after(email), ip_limiter.retry_after(ip))
+
+
+def record_login_attempt(ip):
+    """IPアドレスごとの試行を数える（混雑で照合できなかった試行も含めるため、照合の前に呼ぶ）"""
+    ip_limiter.hit(ip)
+
+
+def record_login_result(email, succeeded):
+    """照合に失敗したメールアドレスを数え、成功したらその回数を消す"""
+    if succeeded:
+        email_limiter.reset(email)
+    else:
+        email_limiter.hit(email)
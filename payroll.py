@@ -0,0 +1,206 @@
+"""給与計算バッチエンジン
+
+会社単位・月単位で全従業員の給与を一括計算し、PayrollCalculation に一括反映する。
+勤怠は月次勤怠集計（AttendanceMonthly）から1クエリで読み、従業員ごとのORMアクセスは行わない。
+"""
+from datetime import date
+from sqlalchemy import select, insert, update, or_
+from attendance_rollup import monthly_totals
+from models import db, Employee, PayrollCalculation
+
+# 割増率（労働基準法の最低基準）
+OVERTIME_PREMIUM = 1.25  # 法定外残業
+LEGAL_HOLIDAY_PREMIUM = 1.35  # 法定休日労働
+LATE_NIGHT_PREMIUM = 0.25  # 深夜労働（加算分）
+
+# 社会保険料率（従業員負担分・概算）
+HEALTH_INSURANCE_RATE = 0.05
+PENSION_RATE = 0.0915
+EMPLOYMENT_INSURANCE_RATE = 0.006
+
+# 所得税（年額換算の累進税率・概算）
+BASIC_DEDUCTION = 480000
+INCOME_TAX_BRACKETS = [
+    (1950000, 0.05, 0),
+    (3300000, 0.10, 97500),
+    (6950000, 0.20, 427500),
+    (9000000, 0.23, 636000),
+    (18000000, 0.33, 1536000),
+    (40000000, 0.40, 2796000),
+    (None, 0.45, 4796000),
+]
+RECONSTRUCTION_TAX_RATE = 1.021
+
+WEEKS_PER_MONTH = 52 / 12
+
+
+def month_range(year, month):
+    """対象月の初日と翌月初日を返す"""
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def _round(value):
+    """円未満四捨五入"""
+    return int(value + 0.5) if value >= 0 else -int(-value + 0.5)
+
+
+def aggregate_attendance(company_id, year, month):
+    """対象月の勤怠を従業員ごとに集計する（月次勤怠集計から読み出す）"""
+    return monthly_totals(company_id, year, month)
+
+
+def hourly_rate(employee):
+    """割増賃金の算定基礎となる1時間あたりの賃金"""
+    base_wage = employee.base_wage or 0
+    hours = employee.standard_working_hours or 8.0
+    days = employee.standard_working_days or 5
+    if employee.wage_type == 'hourly':
+        return base_wage
+    if employee.wage_type == 'daily':
+        return base_wage / hours
+    return base_wage / (hours * days * WEEKS_PER_MONTH)
+
+
+def income_tax(taxable):
+    """月額の課税対象額から源泉所得税を概算する"""
+    annual = taxable * 12 - BASIC_DEDUCTION
+    if annual <= 0:
+        return 0
+    for limit, rate, deduction in INCOME_TAX_BRACKETS:
+        if limit is None or annual <= limit:
+            return _round((annual * rate - deduction) * RECONSTRUCTION_TAX_RATE / 12)
+
+
+def calculate(employee, att, other_allowances=0, resident_tax=0, other_deductions=0):
+    """1名分の給与を計算し、PayrollCalculation の列に対応する dict を返す"""
+    base_wage = employee.base_wage or 0
+    hours = employee.standard_working_hours or 8.0
+    days = employee.standard_working_days or 5
+    rate = hourly_rate(employee)
+
+    working_days = att['working_days'] or 0
+    absent_days = att['absent_days'] or 0
+    paid_leave_days = att['paid_leave_days'] or 0
+    regular_hours = att['regular_hours'] or 0
+    total_hours = (regular_hours + att['overtime_in_legal'] + att['overtime_out_legal']
+                   + att['legal_holiday_hours'] + att['non_legal_holiday_hours'])
+
+    # 基本給
+    if employee.wage_type == 'hourly':
+        base_salary = _round(base_wage * (regular_hours + paid_leave_days * hours))
+    elif employee.wage_type == 'daily':
+        base_salary = _round(base_wage * (working_days + paid_leave_days))
+    else:
+        # 月給者は欠勤控除のみ
+        daily_wage = base_wage / (days * WEEKS_PER_MONTH)
+        base_salary = max(_round(base_wage - daily_wage * absent_days), 0)
+
+    # 残業手当（法定内残業・法定外休日は割増なし）
+    overtime_pay = _round(rate * (
+        att['overtime_in_legal']
+        + att['overtime_out_legal'] * OVERTIME_PREMIUM
+        + att['non_legal_holiday_hours']
+        + att['legal_holiday_hours'] * LEGAL_HOLIDAY_PREMIUM
+        + att['late_night_hours'] * LATE_NIGHT_PREMIUM
+    ))
+
+    transportation = employee.transportation_allowance or 0
+    gross_salary = base_salary + overtime_pay + transportation + other_allowances
+
+    # 控除
+    health_insurance = _round(gross_salary * HEALTH_INSURANCE_RATE)
+    pension = _round(gross_salary * PENSION_RATE)
+    employment_insurance = _round(gross_salary * EMPLOYMENT_INSURANCE_RATE)
+    taxable = gross_salary - transportation - health_insurance - pension - employment_insurance
+    tax = income_tax(taxable)
+    total_deductions = (health_insurance + pension + employment_insurance + tax
+                        + resident_tax + other_deductions)
+
+    return {
+        'base_salary': base_salary,
+        'overtime_pay': overtime_pay,
+        'transportation': transportation,
+        'other_allowances': other_allowances,
+        'gross_salary': gross_salary,
+        'health_insurance': health_insurance,
+        'pension': pension,
+        'employment_insurance': employment_insurance,
+        'income_tax': tax,
+        'resident_tax': resident_tax,
+        'other_deductions': other_deductions,
+        'total_deductions': total_deductions,
+        'net_salary': gross_salary - total_deductions,
+        'total_working_days': working_days,
+        'total_working_hours': round(total_hours, 2),
+        'paid_leave_days': paid_leave_days,
+        'absent_days': absent_days,
+    }
+
+
+EMPTY_ATTENDANCE = {
+    'working_days': 0, 'absent_days': 0, 'paid_leave_days': 0,
+    'regular_hours': 0, 'overtime_in_legal': 0, 'overtime_out_legal': 0,
+    'legal_holiday_hours': 0, 'non_legal_holiday_hours': 0, 'late_night_hours': 0,
+}
+
+
+def run_company_payroll(company_id, year, month, commit=True):
+    """会社1社・1ヶ月分の給与を一括計算して保存する
+
+    在籍中の従業員と、対象月に勤怠がある従業員が対象。
+    既存の計算結果は手入力項目（その他手当・住民税・その他控除）を引き継いで上書きする。
+    """
+    attendance = aggregate_attendance(company_id, year, month)
+
+    employees = db.session.execute(
+        select(
+            Employee.id, Employee.wage_type, Employee.base_wage,
+            Employee.transportation_allowance, Employee.standard_working_hours,
+            Employee.standard_working_days,
+        ).where(
+            Employee.company_id == company_id,
+            or_(Employee.status == '在籍中', Employee.id.in_(list(attendance)))
+        )
+    ).all()
+
+    existing = {
+        row.employee_id: row
+        for row in db.session.execute(
+            select(
+                PayrollCalculation.id, PayrollCalculation.employee_id,
+                PayrollCalculation.other_allowances, PayrollCalculation.resident_tax,
+                PayrollCalculation.other_deductions,
+            ).where(
+                PayrollCalculation.company_id == company_id,
+                PayrollCalculation.year == year,
+                PayrollCalculation.month == month,
+            )
+        )
+    }
+
+    inserts, updates = [], []
+    for employee in employees:
+        att = attendance.get(employee.id, EMPTY_ATTENDANCE)
+        current = existing.get(employee.id)
+        if current:
+            values = calculate(employee, att,
+                               other_allowances=current.other_allowances or 0,
+                               resident_tax=current.resident_tax or 0,
+                               other_deductions=current.other_deductions or 0)
+            values['id'] = current.id
+            updates.append(values)
+        else:
+            values = calculate(employee, att)
+            values.update(company_id=company_id, employee_id=employee.id, year=year, month=month)
+            inserts.append(values)
+
+    if updates:
+        db.session.execute(update(PayrollCalculation), updates)
+    if inserts:
+        db.session.execute(insert(PayrollCalculation), inserts)
+    if commit:
+        db.session.commit()
+
+    return {'employees': len(employees), 'inserted': len(inserts), 'updated': len(updates)}
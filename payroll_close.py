@@ -0,0 +1,206 @@
+"""月次締め（全企業の給与計算）
+
+対象月に有効な契約がある全企業について、労働時間区分の再計算と給与計算をまとめて行う。
+企業ごとの処理量（在籍従業員数）で企業をワーカー数分のグループに振り分け、
+グループごとに ProcessPoolExecutor の子プロセスで実行する（CPUを使う計算を複数コアで並行させる）。
+
+子プロセスは親のデータベース接続を引き継がず、プロセスごとに接続プールを作り直す。
+1社の失敗は他社の処理を止めず、企業ごとのエラーとして結果に含める。
+"""
+import heapq
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from sqlalchemy import and_, func, select
+from sqlalchemy.exc import OperationalError
+from models import db, Company, Contract, Employee, Plan
+from payroll import month_range
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUS = '在籍中'
+# 従業員数に関係なく1社ごとにかかる処理（クエリ数回分）を従業員数に換算した値
+TENANT_OVERHEAD = 20
+# SQLite のロック待ち超過など一時的なエラーの再試行回数
+MAX_ATTEMPTS = 3
+
+
+def worker_count():
+    """既定の並列数（CPUコア数）"""
+    return os.cpu_count() or 1
+
+
+# =============================================================================
+# 対象企業と振り分け
+# =============================================================================
+
+def close_targets(year, month, company_ids=None):
+    """対象月に有効な契約がある企業を [{'company_id', 'company_code', 'employees', 'weight'}] で返す
+
+    処理量の見積り（weight）は在籍従業員数に企業ごとの固定分を加えたもの。
+    プランの上限人数は在籍者数の見積りの上限としてだけ使い、従業員がまだいない企業は固定分のみとする。
+    """
+    start, end = month_range(year, month)
+    headcounts = select(Employee.company_id, func.count().label('employees')).where(
+        Employee.status == ACTIVE_STATUS
+    ).group_by(Employee.company_id).subquery()
+    contracted = select(Contract.company_id, func.max(Plan.max_employees).label('max_employees')).join(
+        Plan, Plan.id == Contract.plan_id
+    ).where(
+        Contract.is_active == True,  # noqa: E712
+        Contract.start_date < end,
+        Contract.end_date >= start,
+    ).group_by(Contract.company_id).subquery()
+
+    stmt = select(
+        Company.id, Company.company_code, func.coalesce(headcounts.c.employees, 0), contracted.c.max_employees,
+    ).join(contracted, contracted.c.company_id == Company.id).outerjoin(
+        headcounts, headcounts.c.company_id == Company.id
+    ).where(Company.is_active == True).order_by(Company.id)  # noqa: E712
+    if company_ids is not None:
+        stmt = stmt.where(Company.id.in_(list(company_ids)))
+
+    targets = []
+    for company_id, company_code, employees, max_employees in db.session.execute(stmt):
+        expected = min(employees, max_employees) if max_employees else employees
+        targets.append({
+            'company_id': company_id,
+            'company_code': company_code,
+            'employees': employees,
+            'weight': expected + TENANT_OVERHEAD,
+        })
+    return targets
+
+
+def partition(targets, parts):
+    """処理量の大きい企業から順に、合計が最も小さいグループへ割り当てる（LPT法）
+
+    空のグループは返さない。各グループ内も処理量の大きい順に並ぶ。
+    """
+    parts = max(1, min(parts, len(targets)))
+    heap = [(0, index) for index in range(parts)]
+    groups = [[] for _ in range(parts)]
+    for target in sorted(targets, key=lambda item: (-item['weight'], item['company_id'])):
+        load, index = heapq.heappop(heap)
+        groups[index].append(target)
+        heapq.heappush(heap, (load + target['weight'], index))
+    return [group for group in groups if group]
+
+
+# =============================================================================
+# 実行
+# =============================================================================
+
+def close_company(company_id, year, month):
+    """1社分の労働時間区分の再計算と給与計算を行う（それぞれコミットする）"""
+    from worktime import recompute_company_month
+    from payroll import run_company_payroll
+
+    recomputed = recompute_company_month(company_id, year, month)
+    result = run_company_payroll(company_id, year, month)
+    return {**result, 'records_updated': recomputed['updated']}
+
+
+def close_group(targets, year, month):
+    """グループ内の企業を順に締め、企業ごとの結果（失敗時は error）のリストを返す"""
+    results = []
+    for target in targets:
+        started = time.perf_counter()
+        outcome = {'company_id': target['company_id'], 'company_code': target['company_code'],
+                   'error': None, 'attempts': 0}
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            outcome['attempts'] = attempt
+            try:
+                outcome.update(close_company(target['company_id'], year, month))
+                outcome['error'] = None
+                break
+            except OperationalError as e:
+                db.session.rollback()
+                outcome['error'] = str(e.orig)
+                logger.warning('企業 %s の締めに失敗しました（%s/%s 回目）: %s',
+                               target['company_code'], attempt, MAX_ATTEMPTS, e.orig)
+                time.sleep(0.5 * attempt)
+            except Exception as e:
+                db.session.rollback()
+                outcome['error'] = f'{type(e).__name__}: {e}'
+                logger.exception('企業 %s の締めに失敗しました', target['company_code'])
+                break
+        outcome['seconds'] = round(time.perf_counter() - started, 3)
+        results.append(outcome)
+    return results
+
+
+def _init_worker():
+    """子プロセスの初期化（fork で引き継いだ接続プールを使わず、新しい接続を作らせる）"""
+    from app import app
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def _run_group(targets, year, month):
+    """子プロセスで1グループを処理する"""
+    from app import app
+
+    with app.app_context():
+        try:
+            return os.getpid(), close_group(targets, year, month)
+        finally:
+            db.session.remove()
+
+
+def close_month(year, month, workers=None, company_ids=None, on_group_done=None):
+    """全企業（company_ids 指定時はその企業）の月次締めを行い、企業ごとの結果と所要時間を返す
+
+    アプリケーションコンテキスト内で呼ぶこと。workers が 1 の場合は子プロセスを使わずに実行する。
+    on_group_done を指定した場合は、グループが終わるたびにそのグループの結果リストを渡して呼ぶ。
+    """
+    started = time.perf_counter()
+    workers = workers or worker_count()
+    targets = close_targets(year, month, company_ids)
+    groups = partition(targets, workers)
+    db.session.commit()
+
+    results = []
+    if len(groups) <= 1:
+        for group in groups:
+            group_results = close_group(group, year, month)
+            results.extend(group_results)
+            if on_group_done:
+                on_group_done(group_results)
+    else:
+        # 子プロセスが接続を共有しないよう、親の接続はプールへ返しておく
+        db.session.remove()
+        db.engine.dispose()
+        method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=len(groups), mp_context=multiprocessing.get_context(method),
+                                 initializer=_init_worker) as executor:
+            futures = {executor.submit(_run_group, group, year, month): group for group in groups}
+            for future in as_completed(futures):
+                try:
+                    _, group_results = future.result()
+                except BrokenProcessPool as e:
+                    # 子プロセスが異常終了した場合は、そのグループの企業をすべて失敗として扱う
+                    group_results = [{'company_id': target['company_id'], 'company_code': target['company_code'],
+                                      'error': f'ワーカープロセスが異常終了しました: {e}', 'attempts': 1,
+                                      'seconds': 0} for target in futures[future]]
+                results.extend(group_results)
+                if on_group_done:
+                    on_group_done(group_results)
+
+    results.sort(key=lambda item: item['company_id'])
+    failed = [item for item in results if item['error']]
+    return {
+        'year': year,
+        'month': month,
+        'workers': len(groups),
+        'companies': len(results),
+        'employees': sum(item.get('employees', 0) for item in results),
+        'failed': len(failed),
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+        'groups': [sum(target['weight'] for target in group) for group in groups],
+        'results': results,
+    }
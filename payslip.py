@@ -0,0 +1,255 @@
+"""給与明細の発行
+
+PayrollCalculation から会社・月単位で全従業員分の給与明細（Excel）を作成する。
+従業員ごとのブックをまとめた ZIP と、従業員ごとのシートを並べた1つのブックの2形式に対応する。
+
+明細のレイアウト（行構成）と書式は最初に1回だけ組み立てて使い回し、
+計算結果は yield_per で少しずつ読み出す。ZIP はブック1冊ごとに、ブックは一時ファイルから
+一定サイズごとに返すため、従業員数に比例してメモリを消費しない。
+"""
+import io
+import re
+import tempfile
+import zipfile
+from functools import lru_cache
+from sqlalchemy import select
+from models import db, Company, Employee, PayrollCalculation
+
+CHUNK_SIZE = 500
+MAX_SHEET_TITLE = 31
+
+# (見出し, 項目) の一覧。項目が None の行は区分の見出し
+PAYSLIP_LAYOUT = [
+    ('支給', None),
+    ('基本給', 'base_salary'),
+    ('残業手当', 'overtime_pay'),
+    ('通勤手当', 'transportation'),
+    ('その他手当', 'other_allowances'),
+    ('総支給額', 'gross_salary'),
+    ('控除', None),
+    ('健康保険', 'health_insurance'),
+    ('厚生年金', 'pension'),
+    ('雇用保険', 'employment_insurance'),
+    ('所得税', 'income_tax'),
+    ('住民税', 'resident_tax'),
+    ('その他控除', 'other_deductions'),
+    ('控除合計', 'total_deductions'),
+    ('勤怠', None),
+    ('出勤日数', 'total_working_days'),
+    ('総労働時間', 'total_working_hours'),
+    ('有給取得日数', 'paid_leave_days'),
+    ('欠勤日数', 'absent_days'),
+]
+SUBTOTAL_FIELDS = {'gross_salary', 'total_deductions'}
+ATTENDANCE_FIELDS = {'total_working_days', 'total_working_hours', 'paid_leave_days', 'absent_days'}
+PAYSLIP_FIELDS = [field for _, field in PAYSLIP_LAYOUT if field] + ['net_salary']
+
+ZIP_MIMETYPE = 'application/zip'
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class PayslipTemplate:
+    """明細の書式とレイアウト（ブックをまたいで共有し、値だけを差し替えて使う）"""
+
+    COLUMN_WIDTHS = {'A': 16, 'B': 18, 'C': 10, 'D': 22}
+
+    def __init__(self):
+        from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+        thin = Side(style='thin', color='999999')
+        box = Border(left=thin, right=thin, top=thin, bottom=thin)
+        yen = '#,##0"円"'
+        # 名前付き書式の定義（NamedStyle はブックに結び付くため、ブックごとにこの定義から作る）
+        self.styles = {
+            'payslip_title': {'font': Font(size=16, bold=True)},
+            'payslip_caption': {'font': Font(color='555555')},
+            'payslip_section': {'font': Font(bold=True, color='FFFFFF'), 'border': box,
+                                'fill': PatternFill('solid', fgColor='4472C4')},
+            'payslip_label': {'border': box},
+            'payslip_amount': {'border': box, 'number_format': yen},
+            'payslip_subtotal': {'font': Font(bold=True), 'border': box, 'number_format': yen,
+                                 'fill': PatternFill('solid', fgColor='DDEBF7')},
+            'payslip_quantity': {'border': box, 'number_format': '#,##0.##'},
+            'payslip_total': {'font': Font(size=13, bold=True), 'border': box, 'number_format': yen,
+                              'fill': PatternFill('solid', fgColor='FFF2CC'),
+                              'alignment': Alignment(horizontal='right')},
+        }
+        # 明細本体の行: [(見出し, 書式), (項目 or None, 書式)]
+        self.rows = []
+        for label, field in PAYSLIP_LAYOUT:
+            if field is None:
+                self.rows.append(((label, 'payslip_section'), (None, 'payslip_section')))
+            elif field in SUBTOTAL_FIELDS:
+                self.rows.append(((label, 'payslip_subtotal'), (field, 'payslip_subtotal')))
+            elif field in ATTENDANCE_FIELDS:
+                self.rows.append(((label, 'payslip_label'), (field, 'payslip_quantity')))
+            else:
+                self.rows.append(((label, 'payslip_label'), (field, 'payslip_amount')))
+
+    def new_workbook(self):
+        """書式を登録した write-only ブックを返す"""
+        from openpyxl import Workbook
+        from openpyxl.styles import NamedStyle
+
+        workbook = Workbook(write_only=True)
+        for name, attributes in self.styles.items():
+            workbook.add_named_style(NamedStyle(name, **attributes))
+        return workbook
+
+    def write_sheet(self, workbook, title, company_name, year, month, payslip):
+        """1名分の明細シートを追加する"""
+        from openpyxl.cell import WriteOnlyCell
+
+        sheet = workbook.create_sheet(title)
+        for column, width in self.COLUMN_WIDTHS.items():
+            sheet.column_dimensions[column].width = width
+
+        def cell(value, style):
+            item = WriteOnlyCell(sheet, value)
+            item.style = style
+            return item
+
+        sheet.append([cell('給与明細書', 'payslip_title')])
+        sheet.append([cell(f'{year}年{month}月分', 'payslip_caption'), None, None,
+                      cell(company_name, 'payslip_caption')])
+        sheet.append([])
+        sheet.append([cell('社員番号', 'payslip_label'), cell(payslip['code'], 'payslip_label'),
+                      cell('氏名', 'payslip_label'), cell(payslip['name'], 'payslip_label')])
+        sheet.append([cell('部署', 'payslip_label'), cell(payslip['department'], 'payslip_label')])
+        sheet.append([])
+        for (label, label_style), (field, value_style) in self.rows:
+            value = (payslip[field] or 0) if field else None
+            sheet.append([cell(label, label_style), cell(value, value_style)])
+        sheet.append([])
+        sheet.append([cell('差引支給額', 'payslip_total'), cell(payslip['net_salary'] or 0, 'payslip_total')])
+        if payslip['remarks']:
+            sheet.append([cell('備考', 'payslip_caption'), payslip['remarks']])
+        # 書き終えたシートは一時ファイルを閉じておく（シート数だけファイルを開いたままにしない）
+        sheet.close()
+
+
+@lru_cache(maxsize=1)
+def payslip_template():
+    """明細テンプレート（プロセスで1回だけ組み立てる）"""
+    return PayslipTemplate()
+
+
+# =============================================================================
+# 読み出し
+# =============================================================================
+
+def count_payslips(company_id, year, month):
+    return PayrollCalculation.query.filter_by(company_id=company_id, year=year, month=month).count()
+
+
+def iter_payslips(company_id, year, month):
+    """対象月の計算結果を社員番号順に dict で少しずつ返す"""
+    pc = PayrollCalculation
+    stmt = select(
+        Employee.employee_id.label('code'), Employee.name, Employee.department, pc.employee_id, pc.remarks,
+        *[getattr(pc, field) for field in PAYSLIP_FIELDS],
+    ).join(Employee, Employee.id == pc.employee_id).where(
+        pc.company_id == company_id, pc.year == year, pc.month == month,
+    ).order_by(Employee.employee_id, Employee.id).execution_options(yield_per=CHUNK_SIZE)
+    for row in db.session.execute(stmt):
+        yield row._asdict()
+
+
+def _company_name(company_id):
+    return db.session.execute(select(Company.company_name).where(Company.id == company_id)).scalar()
+
+
+def _identifier(payslip):
+    return payslip['code'] or f"ID{payslip['employee_id']}"
+
+
+def sheet_title(payslip, used):
+    """シート名（31文字以内・使用できない文字を除く・ブック内で重複しない）"""
+    base = re.sub(r'[\\/*?:\[\]]', '', f"{_identifier(payslip)} {payslip['name'] or ''}".strip())
+    title = base[:MAX_SHEET_TITLE]
+    number = 2
+    while title in used:
+        suffix = f' ({number})'
+        title = base[:MAX_SHEET_TITLE - len(suffix)] + suffix
+        number += 1
+    used.add(title)
+    return title
+
+
+def member_name(payslip, year, month):
+    """ZIP 内のファイル名（社員番号からパス区切り・使用できない文字を除き、重複しないよう従業員IDを付ける）"""
+    code = re.sub(r'[\\/:*?"<>|\x00-\x1f]', '', payslip['code'] or '').strip().strip('.')
+    return f"payslip_{year}{month:02d}_{code + '_' if code else ''}{payslip['employee_id']}.xlsx"
+
+
+def payslip_filename(year, month, file_format):
+    return f'payslips_{year}{month:02d}.{file_format}'
+
+
+# =============================================================================
+# 出力
+# =============================================================================
+
+class _StreamBuffer(io.RawIOBase):
+    """書き込まれたバイト列を溜め、取り出すたびに空にする（ZIP の出力先）"""
+
+    def __init__(self):
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def payslips_zip(company_id, year, month, progress=None):
+    """従業員ごとのブックを ZIP にまとめ、ブック1冊ごとに少しずつ返す
+
+    progress を指定した場合は CHUNK_SIZE 名ごとに作成済みの人数を渡して呼ぶ。
+    """
+    template = payslip_template()
+    company_name = _company_name(company_id)
+    sink = _StreamBuffer()
+    count = 0
+    # xlsx 自体が圧縮済みのため ZIP 側では圧縮しない
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for count, payslip in enumerate(iter_payslips(company_id, year, month), start=1):
+            workbook = template.new_workbook()
+            template.write_sheet(workbook, '給与明細', company_name, year, month, payslip)
+            book = io.BytesIO()
+            workbook.save(book)
+            archive.writestr(member_name(payslip, year, month), book.getvalue())
+            yield sink.drain()
+            if progress and count % CHUNK_SIZE == 0:
+                progress(count)
+    yield sink.drain()
+
+
+def payslips_workbook(company_id, year, month, chunk_size=64 * 1024, progress=None):
+    """従業員ごとのシートを並べた1つのブックを一時ファイルに書き出し、少しずつ返す（progress は payslips_zip と同じ）"""
+    template = payslip_template()
+    company_name = _company_name(company_id)
+    workbook = template.new_workbook()
+    used = set()
+    for count, payslip in enumerate(iter_payslips(company_id, year, month), start=1):
+        template.write_sheet(workbook, sheet_title(payslip, used), company_name, year, month, payslip)
+        if progress and count % CHUNK_SIZE == 0:
+            progress(count)
+    if not used:
+        workbook.create_sheet('給与明細')
+
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            data = output.read(chunk_size)
+            if not data:
+                break
+            yield data
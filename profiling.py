@@ -0,0 +1,268 @@
+"""リクエスト単位の計測（既定では無効）
+
+環境変数 PROFILING=1 のときだけ有効になり、リクエストごとに次の値を計測する。
+
+- SQL の実行回数・所要時間（before/after_cursor_execute）
+- テンプレートごとの描画時間（before_render_template / template_rendered）
+- 同じ SQL 文の繰り返し（N+1 の疑い）
+
+計測結果は Server-Timing ヘッダーで返し、ルート（エンドポイント）ごとの集計を /saas/metrics で確認できる。
+PROFILE_ENDPOINTS に指定したエンドポイントは PROFILE_SAMPLE_RATE の割合で cProfile を取り、
+PROFILE_DIR に .prof ファイルとして保存する（`python -m pstats` や snakeviz で開ける）。
+"""
+import cProfile
+import logging
+import os
+import random
+import re
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from threading import Lock
+from flask import current_app, g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('PROFILING_N_PLUS_ONE', 5))
+MAX_FINDINGS = 100
+STATEMENT_PREVIEW = 200
+
+
+def enabled():
+    return os.environ.get('PROFILING', '').lower() in ('1', 'true', 'yes', 'on')
+
+
+def profile_endpoints():
+    return {name.strip() for name in os.environ.get('PROFILE_ENDPOINTS', '').split(',') if name.strip()}
+
+
+def profile_dir(app):
+    path = os.environ.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class RequestProfile:
+    """1リクエスト分の計測値"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.statements = Counter()
+        self.template_seconds = defaultdict(float)
+        self.template_stack = []
+
+    def repeated_statements(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """threshold 回以上実行された同一の SQL 文を [(文, 回数)] で返す"""
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+class RouteMetrics:
+    """エンドポイントごとの集計（プロセス内・スレッドセーフ）"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.utcnow()
+            self.routes = {}
+            self.findings = []
+
+    def record(self, endpoint, path, elapsed, profile):
+        repeated = profile.repeated_statements()
+        with self._lock:
+            route = self.routes.get(endpoint)
+            if route is None:
+                route = self.routes[endpoint] = {
+                    'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'db_ms': 0.0, 'queries': 0,
+                    'max_queries': 0, 'template_ms': 0.0, 'templates': Counter(), 'n_plus_one': 0,
+                }
+            route['requests'] += 1
+            route['total_ms'] += elapsed * 1000
+            route['max_ms'] = max(route['max_ms'], elapsed * 1000)
+            route['db_ms'] += profile.query_seconds * 1000
+            route['queries'] += profile.query_count
+            route['max_queries'] = max(route['max_queries'], profile.query_count)
+            route['template_ms'] += sum(profile.template_seconds.values()) * 1000
+            for name, seconds in profile.template_seconds.items():
+                route['templates'][name] += seconds * 1000
+            if repeated:
+                route['n_plus_one'] += 1
+                self.findings.append({
+                    'at': datetime.utcnow().isoformat(timespec='seconds'),
+                    'endpoint': endpoint,
+                    'path': path,
+                    'statements': [{'count': count, 'statement': statement[:STATEMENT_PREVIEW]}
+                                   for statement, count in repeated],
+                })
+                del self.findings[:-MAX_FINDINGS]
+
+    def snapshot(self):
+        """/saas/metrics 用の dict（平均は1リクエストあたり）"""
+        with self._lock:
+            routes = {}
+            for endpoint, route in sorted(self.routes.items(), key=lambda item: -item[1]['total_ms']):
+                n = route['requests']
+                routes[endpoint] = {
+                    'requests': n,
+                    'avg_ms': round(route['total_ms'] / n, 2),
+                    'max_ms': round(route['max_ms'], 2),
+                    'avg_db_ms': round(route['db_ms'] / n, 2),
+                    'avg_queries': round(route['queries'] / n, 2),
+                    'max_queries': route['max_queries'],
+                    'avg_template_ms': round(route['template_ms'] / n, 2),
+                    'templates': {name: round(ms / n, 2) for name, ms in route['templates'].most_common()},
+                    'n_plus_one_requests': route['n_plus_one'],
+                }
+            return {
+                'since': self.started_at.isoformat(timespec='seconds'),
+                'pid': os.getpid(),
+                'routes': routes,
+                'n_plus_one': list(reversed(self.findings)),
+            }
+
+
+metrics = RouteMetrics()
+_profiler_lock = Lock()
+
+
+def _current_profile():
+    if has_request_context():
+        return g.get('profile')
+    return None
+
+
+# =============================================================================
+# SQL・テンプレートの計測
+# =============================================================================
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_profile() is not None:
+        conn.info.setdefault('profiling_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile()
+    if profile is None or not conn.info.get('profiling_started'):
+        return
+    elapsed = time.perf_counter() - conn.info['profiling_started'].pop()
+    profile.query_count += 1
+    profile.query_seconds += elapsed
+    profile.statements[statement] += 1
+
+
+def _handle_error(exception_context):
+    # 失敗した SQL の開始時刻を残すと、同じ接続の次の SQL の所要時間がずれ、スタックも伸び続ける
+    connection = exception_context.connection
+    if connection is None or exception_context.execution_context is None:
+        return
+    started = connection.info.get('profiling_started')
+    if started:
+        started.pop()
+
+
+def _before_render(sender, template, context, **extra):
+    profile = _current_profile()
+    if profile is not None:
+        profile.template_stack.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    profile = _current_profile()
+    if profile is not None and profile.template_stack:
+        profile.template_seconds[template.name] += time.perf_counter() - profile.template_stack.pop()
+
+
+# =============================================================================
+# リクエストの前後処理
+# =============================================================================
+
+def _start_request():
+    g.profile = RequestProfile()
+    if request.endpoint in profile_endpoints() and random.random() < float(os.environ.get('PROFILE_SAMPLE_RATE', 0.1)):
+        # cProfile はプロセス内で同時に1つだけ取る
+        if _profiler_lock.acquire(blocking=False):
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+
+def _server_timing(profile, elapsed):
+    template_ms = sum(profile.template_seconds.values()) * 1000
+    return ', '.join([
+        f'db;dur={profile.query_seconds * 1000:.1f};desc="{profile.query_count} queries"',
+        f'tpl;dur={template_ms:.1f}',
+        f'app;dur={elapsed * 1000:.1f}',
+    ])
+
+
+def _finish_request(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    elapsed = time.perf_counter() - profile.started
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        try:
+            profiler.disable()
+            filename = f"{request.endpoint}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{elapsed * 1000:.0f}ms.prof"
+            profiler.dump_stats(os.path.join(profile_dir(current_app), filename))
+            _prune_dumps(profile_dir(current_app))
+        finally:
+            _profiler_lock.release()
+
+    endpoint = request.endpoint or 'unknown'
+    for statement, count in profile.repeated_statements():
+        logger.warning('N+1 の疑い: %s で同じ SQL が %s 回実行されました: %s',
+                       endpoint, count, re.sub(r'\s+', ' ', statement)[:STATEMENT_PREVIEW])
+    metrics.record(endpoint, request.path, elapsed, profile)
+    response.headers['Server-Timing'] = _server_timing(profile, elapsed)
+    return response
+
+
+def _discard_profiler(exception=None):
+    """例外で after_request が呼ばれなかった場合に cProfile を止める"""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profiler_lock.release()
+
+
+def _prune_dumps(path):
+    """古いダンプを PROFILE_KEEP 件まで削除する"""
+    keep = int(os.environ.get('PROFILE_KEEP', 20))
+    dumps = sorted((entry for entry in os.scandir(path) if entry.name.endswith('.prof')),
+                   key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in dumps[keep:]:
+        os.remove(entry.path)
+
+
+def list_dumps(app):
+    """保存済みの cProfile ダンプ（新しい順）"""
+    path = profile_dir(app)
+    return [
+        {'name': entry.name, 'bytes': entry.stat().st_size,
+         'created_at': datetime.fromtimestamp(entry.stat().st_mtime).isoformat(timespec='seconds')}
+        for entry in sorted(os.scandir(path), key=lambda entry: entry.stat().st_mtime, reverse=True)
+        if entry.name.endswith('.prof')
+    ]
+
+
+def init_app(app):
+    """PROFILING が有効なら計測用のフックを登録する（無効時は何もしない）"""
+    app.extensions['profiling'] = enabled()
+    if not app.extensions['profiling']:
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_discard_profiler)
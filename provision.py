@@ -0,0 +1,231 @@
+"""データベースのプロビジョニング（スキーママイグレーションと初期データ投入）
+
+アプリの起動（gunicorn のワーカー）とは分けて、デプロイ時に1回だけ実行する
+（Procfile の release で python init_db.py、または flask db-provision）。
+
+初期データもマイグレーションと同じくバージョンで管理し、適用済みのバージョンを seed_version テーブルに記録する。
+最新のデータベースに対してはバージョンを確認するだけで終わり、パスワードのハッシュ計算も行わない。
+
+複数のインスタンスが同時に実行しても二重に適用しないよう、アドバイザリロックを取ってから処理する。
+
+- PostgreSQL: pg_advisory_lock（接続が切れれば自動で解放される）
+- SQLite: データベースファイルと同じ場所のロックファイルに fcntl.flock
+"""
+import os
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from sqlalchemy import text
+from models import db
+from migrations import upgrade
+
+# pg_advisory_lock のキー（アプリ内で一意な64bit整数）
+LOCK_KEY = 0x454D4C50524F56
+
+SEEDS = []
+
+
+def seed(version, description):
+    """初期データ登録用デコレータ（migrations.migration と同じ形式）"""
+    def register(func):
+        SEEDS.append((version, description, func))
+        SEEDS.sort(key=lambda item: item[0])
+        return func
+    return register
+
+
+# =============================================================================
+# アドバイザリロック
+# =============================================================================
+
+@contextmanager
+def advisory_lock(engine=None):
+    """プロビジョニング用の排他ロックを取る（他のプロセスが実行中なら終わるまで待つ）"""
+    engine = engine or db.engine
+    if engine.dialect.name == 'postgresql':
+        with engine.connect() as connection:
+            connection.execute(text('SELECT pg_advisory_lock(:key)'), {'key': LOCK_KEY})
+            try:
+                yield
+            finally:
+                connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': LOCK_KEY})
+        return
+
+    path = engine.url.database if engine.dialect.name == 'sqlite' else None
+    try:
+        import fcntl
+    except ImportError:
+        # Windows では同時起動を想定しない
+        fcntl = None
+    if not path or path == ':memory:' or fcntl is None:
+        yield
+        return
+    with open(f'{path}.provision.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# =============================================================================
+# 初期データ
+# =============================================================================
+
+DEFAULT_PLANS = [
+    ('basic', 'ベーシック', 10, 5000, 50000, '小規模企業向けの基本プラン'),
+    ('standard', 'スタンダード', 50, 15000, 150000, '中規模企業向けの標準プラン'),
+    ('premium', 'プレミアム', 200, 40000, 400000, '大規模企業向けの上位プラン'),
+]
+
+SAMPLE_EMPLOYEES = [
+    {
+        'employee_id': 'EMP001',
+        'name': '田中 太郎',
+        'furigana': 'タナカ タロウ',
+        'email': 'tanaka@test.com',
+        'phone': '080-1111-2222',
+        'birth_date': date(1990, 4, 15),
+        'gender': '男性',
+        'address': '東京都新宿区1-1-1',
+        'join_date': date(2020, 4, 1),
+        'department': '営業部',
+        'position': '課長',
+        'base_wage': 350000,
+        'transportation_allowance': 15000,
+    },
+    {
+        'employee_id': 'EMP002',
+        'name': '佐藤 花子',
+        'furigana': 'サトウ ハナコ',
+        'email': 'sato@test.com',
+        'phone': '080-3333-4444',
+        'birth_date': date(1992, 8, 22),
+        'gender': '女性',
+        'address': '東京都渋谷区2-2-2',
+        'join_date': date(2021, 7, 1),
+        'department': '人事部',
+        'position': '主任',
+        'base_wage': 300000,
+        'transportation_allowance': 12000,
+    },
+    {
+        'employee_id': 'EMP003',
+        'name': '鈴木 次郎',
+        'furigana': 'スズキ ジロウ',
+        'email': 'suzuki@test.com',
+        'phone': '080-5555-6666',
+        'birth_date': date(1995, 12, 10),
+        'gender': '男性',
+        'address': '東京都品川区3-3-3',
+        'join_date': date(2022, 10, 1),
+        'department': '営業部',
+        'position': '一般',
+        'base_wage': 250000,
+        'transportation_allowance': 10000,
+    },
+]
+
+
+@seed(1, 'デフォルトプラン')
+def default_plans():
+    from models import Plan
+
+    if Plan.query.count():
+        return
+    for plan_name, display_name, max_employees, monthly_fee, yearly_fee, description in DEFAULT_PLANS:
+        db.session.add(Plan(plan_name=plan_name, display_name=display_name, max_employees=max_employees,
+                            monthly_fee=monthly_fee, yearly_fee=yearly_fee, description=description,
+                            is_active=True))
+
+
+@seed(2, 'SaaS管理者アカウント')
+def saas_admin_account():
+    from passwords import hash_password
+    from models import User
+
+    if User.query.filter_by(role='saas_admin').first():
+        return
+    db.session.add(User(email='saas@example.com', password=hash_password('saasadmin123'),
+                        name='SaaS管理者', role='saas_admin', is_active=True))
+
+
+@seed(3, 'テスト企業とサンプル従業員')
+def sample_company():
+    from passwords import hash_password
+    from models import Company, Contract, Employee, LeaveCredit, Plan, User
+
+    if Company.query.filter_by(company_code='TEST001').first():
+        return
+    company = Company(company_code='TEST001', company_name='テスト株式会社', email='test@example.com',
+                      phone='03-1234-5678', address='東京都渋谷区1-1-1', is_active=True)
+    db.session.add(company)
+    db.session.flush()
+
+    # 契約（スタンダードプラン、30日間）
+    standard_plan = Plan.query.filter_by(plan_name='standard').first()
+    if standard_plan:
+        db.session.add(Contract(company_id=company.id, plan_id=standard_plan.id, start_date=date.today(),
+                                end_date=date.today() + timedelta(days=30),
+                                monthly_fee=standard_plan.monthly_fee, billing_cycle='monthly', is_active=True))
+    db.session.add(User(email='admin@test.com', password=hash_password('admin123'), name='管理者太郎',
+                        role='company_admin', company_id=company.id, is_active=True))
+
+    for data in SAMPLE_EMPLOYEES:
+        employee = Employee(company_id=company.id, employment_type='正社員', status='在籍中',
+                            wage_type='monthly', working_time_system='standard',
+                            standard_working_hours=8.0, standard_working_days=5, **data)
+        db.session.add(employee)
+        db.session.flush()
+        # 有給休暇付与（入社日基準で10日付与）
+        db.session.add(LeaveCredit(company_id=company.id, employee_id=employee.id, days_granted=10,
+                                   grant_date=data['join_date'], days_remaining=10, notes='入社時付与'))
+
+
+# =============================================================================
+# 実行
+# =============================================================================
+
+def _ensure_seed_table(connection):
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS seed_version ('
+        'version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at TIMESTAMP)'
+    ))
+
+
+def current_seed_version(connection):
+    _ensure_seed_table(connection)
+    return connection.execute(text('SELECT MAX(version) FROM seed_version')).scalar() or 0
+
+
+def apply_seeds():
+    """未適用の初期データを投入し、適用したバージョンのリストを返す（アプリケーションコンテキスト内で呼ぶ）"""
+    applied = []
+    version = current_seed_version(db.session.connection())
+    db.session.commit()
+    for seed_version, description, func in SEEDS:
+        if seed_version <= version:
+            continue
+        func()
+        db.session.execute(
+            text('INSERT INTO seed_version (version, description, applied_at) VALUES (:v, :d, :t)'),
+            {'v': seed_version, 'd': description, 't': datetime.utcnow()}
+        )
+        db.session.commit()
+        applied.append((seed_version, description))
+    return applied
+
+
+def provision(seeds=True):
+    """ロックを取ってマイグレーションと初期データ投入を行い、適用したバージョンを返す
+
+    戻り値は {'migrations': [(バージョン, 説明)], 'seeds': [(バージョン, 説明)]}。
+    """
+    with advisory_lock(db.engine):
+        migrations = upgrade()
+        applied_seeds = apply_seeds() if seeds else []
+    return {'migrations': migrations, 'seeds': applied_seeds}
+
+
+def seeds_enabled():
+    """SEED_DATA=0 のときは初期データ（プラン・管理者・テスト企業）を投入しない"""
+    return os.environ.get('SEED_DATA', '1').lower() not in ('0', 'false', 'no', 'off')
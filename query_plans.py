@@ -0,0 +1,89 @@
+"""主要クエリの実行計画チェック
+
+テナント単位の主要クエリについて EXPLAIN を取得し、想定したインデックスが
+使われているかを確認する（`flask check-indexes` から実行）。
+"""
+import json
+from datetime import date, timedelta
+from sqlalchemy import select, func
+from models import db, Contract, Employee, WorkingTimeRecord
+from attendance_rollup import monthly_totals_statement, records_since_statement
+from employee_list import LIST_COLUMNS, _sort_code
+
+
+def employee_page_statement(company_id):
+    return select(*LIST_COLUMNS).where(
+        Employee.company_id == company_id
+    ).order_by(_sort_code, Employee.id).limit(51)
+
+
+# (名称, 文を返す関数, 使用されるべきインデックス)
+HOT_QUERIES = [
+    (
+        'company_dashboard: 今月の勤怠件数',
+        lambda: records_since_statement(1, date.today().year, date.today().month),
+        'uq_attendance_monthly',
+    ),
+    (
+        'payroll: 月次勤怠集計',
+        lambda: monthly_totals_statement(1, date.today().year, date.today().month),
+        'uq_attendance_monthly',
+    ),
+    (
+        'worktime: 勤怠の再計算対象',
+        lambda: select(WorkingTimeRecord.id).where(
+            WorkingTimeRecord.company_id == 1,
+            WorkingTimeRecord.work_date >= date.today().replace(day=1),
+        ),
+        'ix_working_time_record_company_date',
+    ),
+    (
+        'company_dashboard: 在籍従業員数',
+        lambda: select(func.count()).select_from(Employee).where(
+            Employee.company_id == 1, Employee.status == '在籍中',
+        ),
+        'ix_employee_company_status',
+    ),
+    (
+        'employees: 従業員一覧',
+        lambda: employee_page_statement(1),
+        'ix_employee_company_sort',
+    ),
+    (
+        'login / add_employee: 有効契約',
+        lambda: select(Contract).where(Contract.company_id == 1, Contract.is_active == True),  # noqa: E712
+        'ix_contract_company_active_end',
+    ),
+    (
+        'saas_admin_dashboard: 期限間近の契約',
+        lambda: select(Contract).where(
+            Contract.is_active == True,  # noqa: E712
+            Contract.end_date >= date.today(),
+            Contract.end_date <= date.today() + timedelta(days=30),
+        ),
+        'ix_contract_active_end',
+    ),
+]
+
+
+def _explain(connection, stmt):
+    compiled = stmt.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+    if connection.dialect.name == 'postgresql':
+        # 小さいテーブルではシーケンシャルスキャンが選ばれるため無効化して判定する
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        plan = connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compiled}').scalar()
+        return json.dumps(plan)
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}').all()
+    return '\n'.join(str(row[-1]) for row in rows)
+
+
+def check_query_plans(engine=None):
+    """(名称, 想定インデックス, 使用有無, 実行計画) のリストを返す"""
+    engine = engine or db.engine
+    results = []
+    with engine.connect() as connection:
+        for name, build, index_name in HOT_QUERIES:
+            with connection.begin():
+                plan = _explain(connection, build())
+            results.append((name, index_name, index_name in plan, plan))
+    return results
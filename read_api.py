@@ -0,0 +1,173 @@
+"""読み出し専用 API の非同期データベースアクセス
+
+ダッシュボードの集計・従業員一覧・契約状況の JSON API（/api/read/...）は、SQLAlchemy の非同期エンジン
+（SQLite は aiosqlite、PostgreSQL は asyncpg）で読み出し、1リクエスト内の互いに独立したクエリを
+asyncio.gather で並行に実行する。SQL 文は同期版（employee_list・entitlements・attendance_rollup）と共通。
+
+Flask は WSGI のままとし、イベントループと非同期エンジン（接続プール）はプロセスごとに1つ専用スレッドで持つ。
+ビューは run() でコルーチンを渡して結果を待つ。fork 後の子プロセスでは最初の呼び出しで作り直す（jobs.JobRunner と同じ）。
+
+- ASYNC_DB_POOL_SIZE: 非同期エンジンの接続数（既定 10。PostgreSQL では超過分として同数まで追加で開く）
+- ASYNC_DB_TIMEOUT: 1リクエストの待ち時間の上限（秒、既定 30）
+"""
+import asyncio
+import os
+import threading
+from datetime import date
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+from attendance_rollup import records_since_statement
+from employee_list import filter_options, filter_options_statement, page_statement, serialize, split_page
+from entitlements import ACTIVE_STATUS, build_entitlement, contract_statement, headcount_statement
+from models import Employee
+
+# 同期ドライバ名 → 非同期ドライバ名
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def async_url(url):
+    """同期エンジンの URL を非同期ドライバの URL に置き換える"""
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f'非同期ドライバに対応していないデータベースです: {backend}')
+    if backend == 'sqlite' and url.database in (None, '', ':memory:'):
+        raise RuntimeError('インメモリの SQLite は非同期エンジンと共有できません')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def async_engine_options(url):
+    pool_size = int(os.environ.get('ASYNC_DB_POOL_SIZE', 10))
+    if url.get_backend_name() == 'sqlite':
+        # 同期エンジンの PRAGMA busy_timeout と同じ待ち時間（WAL は同期エンジン側で設定済み）
+        busy_timeout = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)) / 1000
+        return {'pool_size': pool_size, 'connect_args': {'timeout': busy_timeout}}
+    return {
+        'pool_size': pool_size,
+        'max_overflow': pool_size,
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_pre_ping': True,
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+
+
+class AsyncReader:
+    """非同期エンジンとそれを動かすイベントループ（プロセスごとに1つ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self.engine = None
+
+    def start(self, url):
+        """このプロセスでイベントループを開始し、非同期エンジンを作る（開始済みなら何もしない）"""
+        if self._pid == os.getpid():
+            return False
+        with self._lock:
+            if self._pid == os.getpid():
+                return False
+            url = async_url(url)
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._loop.run_forever, name='async-db', daemon=True).start()
+            self.engine = create_async_engine(url, **async_engine_options(url))
+            self._pid = os.getpid()
+        return True
+
+    def run(self, url, coroutine_function, *args):
+        """coroutine_function(self, *args) をイベントループで実行して結果を返す"""
+        self.start(url)
+        future = asyncio.run_coroutine_threadsafe(coroutine_function(self, *args), self._loop)
+        return future.result(timeout=int(os.environ.get('ASYNC_DB_TIMEOUT', 30)))
+
+    async def all(self, statement):
+        async with self.engine.connect() as connection:
+            return (await connection.execute(statement)).all()
+
+    async def first(self, statement):
+        async with self.engine.connect() as connection:
+            return (await connection.execute(statement)).first()
+
+    async def scalar(self, statement):
+        async with self.engine.connect() as connection:
+            return await connection.scalar(statement)
+
+
+reader = AsyncReader()
+
+
+# =============================================================================
+# 読み出し（いずれも reader.run から呼ぶ）
+# =============================================================================
+
+def _department_counts_statement(company_id):
+    return select(Employee.department, func.count()).where(
+        Employee.company_id == company_id, Employee.status == ACTIVE_STATUS
+    ).group_by(Employee.department).order_by(Employee.department)
+
+
+def _contract_json(entitlement):
+    if not entitlement.contract_id:
+        return None
+    return {
+        'plan': entitlement.plan_display_name,
+        'max_employees': entitlement.max_employees,
+        'start_date': entitlement.start_date.isoformat() if entitlement.start_date else None,
+        'end_date': entitlement.end_date.isoformat() if entitlement.end_date else None,
+        'billing_cycle': entitlement.billing_cycle,
+    }
+
+
+async def dashboard(source, company_id, month_start=None):
+    """在籍人数・今月の勤怠記録件数・部署別人数・契約"""
+    month_start = month_start or date.today().replace(day=1)
+    headcount, records_count, departments, contract = await asyncio.gather(
+        source.scalar(headcount_statement(company_id)),
+        source.scalar(records_since_statement(company_id, month_start.year, month_start.month)),
+        source.all(_department_counts_statement(company_id)),
+        source.first(contract_statement(company_id)),
+    )
+    entitlement = build_entitlement(company_id, contract, headcount)
+    return {
+        'total_employees': headcount,
+        'records_count': records_count,
+        'departments': [{'department': name, 'count': count} for name, count in departments],
+        'contract': _contract_json(entitlement),
+    }
+
+
+async def employees(source, company_id, filters, cursor, limit):
+    """従業員一覧の1ページと絞り込みの選択肢"""
+    rows, options = await asyncio.gather(
+        source.all(page_statement(company_id, filters, cursor, limit)),
+        source.all(filter_options_statement(company_id)),
+    )
+    rows, next_cursor = split_page(rows, limit)
+    return {
+        'employees': [serialize(row) for row in rows],
+        'next': next_cursor,
+        'options': filter_options(company_id, options),
+    }
+
+
+async def contract(source, company_id, today=None):
+    """契約状況（プラン・期間・残り日数・在籍人数と上限）"""
+    today = today or date.today()
+    row, headcount = await asyncio.gather(
+        source.first(contract_statement(company_id)),
+        source.scalar(headcount_statement(company_id)),
+    )
+    entitlement = build_entitlement(company_id, row, headcount)
+    body = {
+        'contract': _contract_json(entitlement),
+        'headcount': headcount,
+        'remaining_seats': None,
+        'days_remaining': None,
+    }
+    if entitlement.contract_id:
+        if entitlement.max_employees is not None:
+            body['remaining_seats'] = max(entitlement.max_employees - headcount, 0)
+        if entitlement.end_date:
+            body['days_remaining'] = (entitlement.end_date - today).days
+    return body
@@ -0,0 +1,60 @@
+"""企業（テナント）単位の行スコープ
+
+企業管理者のリクエストでは、company_admin_required が g.company_id にログイン中の企業IDを設定する。
+以降そのリクエストで ORM（db.session）が実行する SELECT / UPDATE / DELETE には、
+TENANT_MODELS の各モデルに company_id = g.company_id の条件が自動で付く（with_loader_criteria）。
+関連の遅延読み込み・Session.get も対象になるため、URL の ID を書き換えても他社の行は読めない（404 になる）。
+
+- リクエスト外（CLI・バックグラウンドジョブ）、SaaS管理者、ログイン処理では g.company_id がないため条件は付かない
+- User は Flask-Login のユーザー読み込み・ログインで企業をまたいで引くため対象外
+- 非同期エンジン（read_api）と、Table を直接使う Core の文には付かない。これらは従来どおり company_id で絞り込む
+- 企業をまたいで読む必要がある場合は execution_options(all_tenants=True) を付ける
+
+契約スナップショット（契約・プラン上限・在籍人数）は current_entitlement() で1リクエストにつき1回だけ取得する。
+"""
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, with_loader_criteria
+from entitlements import get_entitlement
+from models import (AttendanceArchive, AttendanceMonthly, Contract, Employee, Job, LeaveBalance, LeaveConsumption,
+                    LeaveCredit, PayrollCalculation, WorkingTimeRecord)
+
+TENANT_MODELS = (
+    Contract, Employee, WorkingTimeRecord, PayrollCalculation, LeaveCredit, LeaveConsumption, LeaveBalance,
+    AttendanceMonthly, AttendanceArchive, Job,
+)
+
+
+def set_tenant(company_id):
+    """このリクエストの企業を設定する（以降の ORM の実行に企業の条件が付く）"""
+    g.company_id = company_id
+
+
+def current_tenant():
+    """このリクエストの企業ID（設定されていなければ None）"""
+    return g.get('company_id') if has_app_context() else None
+
+
+def current_entitlement():
+    """このリクエストの企業の契約スナップショット（リクエスト内では2回目以降 g から返す）"""
+    if 'entitlement' not in g:
+        g.entitlement = get_entitlement(g.company_id)
+    return g.entitlement
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _scope_to_tenant(execute_state):
+    if not (execute_state.is_select or execute_state.is_update or execute_state.is_delete):
+        return
+    if execute_state.execution_options.get('all_tenants'):
+        return
+    company_id = current_tenant()
+    if company_id is None:
+        return
+    # 読み込み済みの行の期限切れ属性・refresh は主キーで引き直すだけなので付けない
+    if execute_state.is_column_load:
+        return
+    execute_state.statement = execute_state.statement.options(*[
+        with_loader_criteria(model, lambda cls: cls.company_id == company_id, include_aliases=True)
+        for model in TENANT_MODELS
+    ])
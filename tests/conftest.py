@@ -0,0 +1,96 @@
+"""テスト用の一時 SQLite データベースとアプリケーション
+
+app.py は読み込み時に DATABASE_URL を読むため、読み込む前に一時ファイルのデータベースを指定する。
+データベースはテストの実行ごとに1つ作り、マイグレーションだけ適用する（初期データは投入しない）。
+各テストは自分で企業・従業員を作り、他のテストのデータに依存しない。
+"""
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_workdir = tempfile.mkdtemp(prefix='eml-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_workdir, 'test.db')
+os.environ['JOB_WORKERS'] = '0'
+os.environ['TEMPLATE_CACHE_DIR'] = ''
+os.environ['ATTENDANCE_ARCHIVE_DIR'] = os.path.join(_workdir, 'attendance_archive')
+
+_codes = itertools.count(1)
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app
+    from provision import provision
+
+    with flask_app.app_context():
+        provision(seeds=False)
+    return flask_app
+
+
+@pytest.fixture
+def db(app):
+    """アプリケーションコンテキスト内の db（テスト終了時に未コミットの変更を破棄する）"""
+    from models import db
+
+    with app.app_context():
+        yield db
+        db.session.rollback()
+
+
+@pytest.fixture
+def make_company(db):
+    """有効な契約を持つ企業を作り、Company を返す"""
+    from datetime import date, timedelta
+    from models import Company, Contract, Plan
+
+    def make(max_employees=100):
+        code = f'T{next(_codes):05d}'
+        plan = Plan(plan_name=f'plan-{code}', display_name=f'プラン {code}', max_employees=max_employees,
+                    monthly_fee=0, yearly_fee=0)
+        company = Company(company_code=code, company_name=f'{code} 株式会社')
+        db.session.add_all([plan, company])
+        db.session.flush()
+        db.session.add(Contract(company_id=company.id, plan_id=plan.id, start_date=date.today(),
+                                end_date=date.today() + timedelta(days=365), monthly_fee=0))
+        db.session.commit()
+        return company
+    return make
+
+
+@pytest.fixture
+def make_employee(db):
+    """在籍中の従業員を作り、Employee を返す"""
+    from datetime import date
+    from models import Employee
+
+    def make(company, **values):
+        values = {'employee_id': f'E{next(_codes):05d}', 'name': 'テスト 社員', 'status': '在籍中',
+                  'join_date': date(2020, 4, 1), 'wage_type': 'monthly', 'base_wage': 300000,
+                  'standard_working_hours': 8.0, 'standard_working_days': 5, **values}
+        employee = Employee(company_id=company.id, **values)
+        db.session.add(employee)
+        db.session.commit()
+        return employee
+    return make
+
+
+@pytest.fixture
+def admin_client(app, db):
+    """企業管理者を作ってログインを試みたテストクライアントと、ログインの応答を返す"""
+    from models import User
+    from passwords import hash_password
+
+    def login(company):
+        email = f'admin-{company.company_code}@example.com'
+        db.session.add(User(email=email, password=hash_password('password'), role='company_admin',
+                            company_id=company.id))
+        db.session.commit()
+        client = app.test_client()
+        return client, client.post('/login', data={'email': email, 'password': 'password'})
+    return login
@@ -0,0 +1,74 @@
+"""勤怠アーカイブ: ファイルへの書き出しと読み出しが一致し、月次勤怠集計の作り直しでも合計が変わらないか"""
+import io
+from datetime import date, time
+
+import pytest
+from sqlalchemy import select
+
+from attendance_archive import AttendanceArchiveError, ArchiveFile, archive_month, archive_path
+from attendance_io import ingest_attendance
+from attendance_rollup import monthly_totals, rebuild, verify
+from models import WorkingTimeRecord
+from payroll import run_company_payroll
+
+FIELDS = ('id', 'employee_id', 'work_date', 'start_time', 'end_time', 'break_minutes', 'regular_hours',
+          'is_absent', 'is_paid_leave', 'leave_days', 'remarks')
+TODAY = date(2026, 10, 1)
+
+
+def rows(db, company_id):
+    return [tuple(getattr(record, field) for field in FIELDS) for record in db.session.execute(
+        select(WorkingTimeRecord).where(WorkingTimeRecord.company_id == company_id)
+        .order_by(WorkingTimeRecord.work_date, WorkingTimeRecord.employee_id, WorkingTimeRecord.id)
+    ).scalars()]
+
+
+@pytest.fixture
+def august(db, make_company, make_employee):
+    company = make_company()
+    first, second = make_employee(company), make_employee(company)
+    db.session.add_all([
+        WorkingTimeRecord(company_id=company.id, employee_id=employee.id, work_date=date(2026, 8, day),
+                          start_time=time(9), end_time=time(18), break_minutes=60, regular_hours=8.0)
+        for employee in (first, second) for day in range(3, 8)
+    ] + [
+        WorkingTimeRecord(company_id=company.id, employee_id=first.id, work_date=date(2026, 8, 3),
+                          start_time=time(20), end_time=time(22), regular_hours=2.0, remarks='夜間対応'),
+        WorkingTimeRecord(company_id=company.id, employee_id=second.id, work_date=date(2026, 8, 10),
+                          is_paid_leave=True, leave_days=1.0),
+    ])
+    db.session.commit()
+    return company, first
+
+
+def test_archive_round_trip_and_rebuild(db, august):
+    company, _ = august
+    with pytest.raises(AttendanceArchiveError):
+        archive_month(company.id, 2026, 8, today=TODAY)  # 給与計算前
+    run_company_payroll(company.id, 2026, 8)
+    expected_rows, expected_totals = rows(db, company.id), monthly_totals(company.id, 2026, 8)
+
+    result = archive_month(company.id, 2026, 8, today=TODAY)
+    assert (result['records'], result['deleted']) == (12, 11)
+    assert archive_month(company.id, 2026, 8, today=TODAY) is None
+
+    with ArchiveFile(archive_path(company.id, 2026)) as archive:
+        assert [tuple(getattr(record, field) for field in FIELDS) for record in archive.records(8)] == expected_rows
+    assert [row[FIELDS.index('is_paid_leave')] for row in rows(db, company.id)] == [True]
+
+    assert monthly_totals(company.id, 2026, 8) == expected_totals
+    assert verify(db.session.connection(), company.id) == []
+    rebuild(db.session.connection(), company.id)
+    db.session.commit()
+    assert monthly_totals(company.id, 2026, 8) == expected_totals
+
+
+def test_archived_month_rejects_import(db, august):
+    company, employee = august
+    run_company_payroll(company.id, 2026, 8)
+    archive_month(company.id, 2026, 8, today=TODAY)
+
+    result = ingest_attendance(company.id, io.BytesIO(
+        f'社員番号,日付,出勤時刻,退勤時刻\n{employee.employee_id},2026-08-20,09:00,18:00\n'.encode()
+    ), 'csv')
+    assert (result['inserted'], result['skipped']) == (0, 1)
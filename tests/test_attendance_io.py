@@ -0,0 +1,68 @@
+"""勤怠の一括取込: 同日の行の上書き・既存勤怠の更新・月次勤怠集計への反映"""
+import io
+from datetime import date, time
+
+from sqlalchemy import select
+
+from attendance_io import ingest_attendance
+from attendance_rollup import monthly_totals, verify
+from models import WorkingTimeRecord
+
+
+def csv_file(*lines):
+    return io.BytesIO(('社員番号,日付,出勤時刻,退勤時刻,休憩時間（分）\n' + '\n'.join(lines) + '\n').encode())
+
+
+def records(db, employee_id):
+    return db.session.execute(
+        select(WorkingTimeRecord.work_date, WorkingTimeRecord.start_time, WorkingTimeRecord.end_time)
+        .where(WorkingTimeRecord.employee_id == employee_id).order_by(WorkingTimeRecord.work_date)
+    ).all()
+
+
+def test_later_row_wins_and_unknown_code_is_reported(db, make_company, make_employee):
+    company = make_company()
+    employee = make_employee(company)
+    code = employee.employee_id
+    result = ingest_attendance(company.id, csv_file(
+        f'{code},2026-09-01,09:00,18:00,60',
+        f'{code},2026-09-01,10:00,19:00,60',
+        f'{code},2026/09/02,09:00,17:00,60',
+        'NOPE,2026-09-01,09:00,18:00,60',
+        f'{code},not-a-date,09:00,18:00,60',
+    ), 'csv')
+
+    assert (result['rows'], result['inserted'], result['updated'], result['duplicates']) == (4, 2, 0, 1)
+    assert [error['line'] for error in result['errors']] == [5, 6]
+    assert records(db, employee.id) == [(date(2026, 9, 1), time(10), time(19)), (date(2026, 9, 2), time(9), time(17))]
+
+
+def test_reimport_updates_existing_record(db, make_company, make_employee):
+    company = make_company()
+    employee = make_employee(company)
+    code = employee.employee_id
+    ingest_attendance(company.id, csv_file(f'{code},2026-09-01,09:00,18:00,60'), 'csv')
+    result = ingest_attendance(company.id, io.BytesIO(
+        f'{{"社員番号": "{code}", "日付": "2026-09-01", "出勤時刻": "08:00", "退勤時刻": "20:00"}}\n{{broken\n'.encode()
+    ), 'jsonl')
+
+    assert (result['inserted'], result['updated'], result['skipped']) == (0, 1, 1)
+    assert records(db, employee.id) == [(date(2026, 9, 1), time(8), time(20))]
+    totals = monthly_totals(company.id, 2026, 9)[employee.id]
+    assert (totals['record_count'], totals['working_days']) == (1, 1)
+    assert verify(db.session.connection(), company.id) == []
+
+
+def test_import_into_split_shift_day_keeps_one_working_day(db, make_company, make_employee):
+    company = make_company()
+    employee = make_employee(company)
+    db.session.add_all([
+        WorkingTimeRecord(company_id=company.id, employee_id=employee.id, work_date=date(2026, 9, 1),
+                          start_time=start, end_time=end, break_minutes=0)
+        for start, end in ((time(9), time(12)), (time(17), time(20)))
+    ])
+    db.session.commit()
+
+    ingest_attendance(company.id, csv_file(f'{employee.employee_id},2026-09-01,08:00,12:00,0'), 'csv')
+    assert monthly_totals(company.id, 2026, 9)[employee.id]['working_days'] == 1
+    assert verify(db.session.connection(), company.id) == []
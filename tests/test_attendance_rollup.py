@@ -0,0 +1,67 @@
+"""月次勤怠集計: 勤怠の変更ごとの差分更新が作り直し（rebuild）と一致するか"""
+from datetime import date, time
+
+from attendance_rollup import apply_deltas, monthly_totals, rebuild, verify
+from models import WorkingTimeRecord
+
+
+def test_incremental_rollup_matches_rebuild(db, make_company, make_employee):
+    company = make_company()
+    first, second = make_employee(company), make_employee(company)
+    records = [
+        WorkingTimeRecord(company_id=company.id, employee_id=employee.id, work_date=date(2026, 9, day),
+                          start_time=time(9), end_time=time(18), break_minutes=60, regular_hours=8.0)
+        for employee in (first, second) for day in range(1, 11)
+    ]
+    db.session.add_all(records)
+    db.session.commit()
+
+    records[0].overtime_out_legal = 2.5
+    records[1].is_absent = True
+    records[1].start_time = None
+    records[2].is_paid_leave = True
+    records[2].leave_days = 0.5
+    records[3].work_date = date(2026, 10, 1)
+    records[4].employee_id = second.id
+    db.session.delete(records[5])
+    db.session.commit()
+
+    connection = db.session.connection()
+    assert verify(connection, company.id) == []
+    before = {month: monthly_totals(company.id, 2026, month) for month in (9, 10)}
+    rebuild(connection, company.id)
+    db.session.commit()
+    assert {month: monthly_totals(company.id, 2026, month) for month in (9, 10)} == before
+
+
+def test_split_shift_counts_one_working_day(db, make_company, make_employee):
+    company = make_company()
+    employee = make_employee(company)
+    shifts = [
+        WorkingTimeRecord(company_id=company.id, employee_id=employee.id, work_date=date(2026, 9, 1),
+                          start_time=start, end_time=end, break_minutes=0, regular_hours=3.0)
+        for start, end in ((time(9), time(12)), (time(17), time(20)))
+    ]
+    db.session.add_all(shifts)
+    db.session.commit()
+    assert monthly_totals(company.id, 2026, 9)[employee.id]['working_days'] == 1
+
+    # 片方を欠勤にしても、もう片方で出勤しているので1日のまま
+    shifts[0].is_absent = True
+    db.session.commit()
+    assert monthly_totals(company.id, 2026, 9)[employee.id]['working_days'] == 1
+    db.session.delete(shifts[1])
+    db.session.commit()
+    assert monthly_totals(company.id, 2026, 9)[employee.id]['working_days'] == 0
+    assert verify(db.session.connection(), company.id) == []
+
+
+def test_apply_deltas_creates_then_adds(db, make_company, make_employee):
+    company = make_company()
+    employee = make_employee(company)
+    key = (company.id, employee.id, 2026, 11)
+    connection = db.session.connection()
+    apply_deltas(connection, {key: {'record_count': 1, 'regular_hours': 8.0}})
+    apply_deltas(connection, {key: {'record_count': 2, 'regular_hours': 1.5}})
+    totals = monthly_totals(company.id, 2026, 11)[employee.id]
+    assert (totals['record_count'], totals['regular_hours']) == (3, 9.5)
@@ -0,0 +1,84 @@
+"""契約の期限処理（自動更新・失効）と期限間近の一覧"""
+from datetime import date, timedelta
+
+from sqlalchemy import select
+
+from contracts import expiring_soon, roll_company, tick
+from models import Contract
+
+TODAY = date.today()
+
+
+def contracts(db, company):
+    db.session.expire_all()
+    return db.session.execute(
+        select(Contract.start_date, Contract.end_date, Contract.is_active)
+        .where(Contract.company_id == company.id).order_by(Contract.id)
+    ).all()
+
+
+def set_contract(db, company, **values):
+    contract = db.session.execute(select(Contract).where(Contract.company_id == company.id)).scalar_one()
+    for field, value in values.items():
+        setattr(contract, field, value)
+    db.session.commit()
+    return contract
+
+
+def test_auto_renew_creates_period_containing_today(db, make_company):
+    company = make_company()
+    end_date = TODAY - timedelta(days=45)
+    set_contract(db, company, start_date=end_date - timedelta(days=30), end_date=end_date, auto_renew=True)
+
+    entitlement = roll_company(company.id, TODAY)
+    (_, _, old_active), (start_date, new_end, new_active) = contracts(db, company)
+    assert (old_active, new_active) == (False, True)
+    assert start_date <= TODAY <= new_end
+    assert entitlement.contract_id is not None
+
+
+def test_expired_contract_without_auto_renew_is_deactivated(db, make_company):
+    company = make_company()
+    set_contract(db, company, end_date=TODAY - timedelta(days=1))
+
+    assert roll_company(company.id, TODAY).contract_id is None
+    assert [active for _, _, active in contracts(db, company)] == [False]
+
+
+def test_auto_renew_stops_for_inactive_company(db, make_company):
+    company = make_company()
+    set_contract(db, company, end_date=TODAY - timedelta(days=1), auto_renew=True)
+    company.is_active = False
+    db.session.commit()
+
+    assert tick(TODAY)['deactivated'] >= 1
+    assert [active for _, _, active in contracts(db, company)] == [False]
+
+
+def test_expiring_soon_follows_contract_changes(db, make_company):
+    company = make_company()
+    contract = set_contract(db, company, end_date=TODAY + timedelta(days=10))
+    assert contract.id in [row.contract_id for row in expiring_soon(TODAY)]
+
+    set_contract(db, company, end_date=TODAY + timedelta(days=365))
+    assert contract.id not in [row.contract_id for row in expiring_soon(TODAY)]
+
+
+
+def test_login_renews_expired_auto_renew_contract(db, make_company, admin_client):
+    company = make_company()
+    set_contract(db, company, end_date=TODAY - timedelta(days=1), auto_renew=True)
+
+    client, response = admin_client(company)
+    assert response.headers['Location'] == '/'
+    assert client.get('/company/dashboard').status_code == 200
+    assert [active for _, _, active in contracts(db, company)] == [False, True]
+
+
+def test_login_rejects_expired_contract(db, make_company, admin_client):
+    company = make_company()
+    set_contract(db, company, end_date=TODAY - timedelta(days=1))
+
+    _, response = admin_client(company)
+    assert response.headers['Location'] == '/login'
+    assert [active for _, _, active in contracts(db, company)] == [False]
@@ -0,0 +1,53 @@
+"""ダッシュボード集計値のキャッシュ: コミット後の無効化とロールバック時の扱い"""
+from datetime import date, time
+
+from counters import company_records_count, counter_cache, global_counts
+from models import Employee, WorkingTimeRecord
+
+MONTH_START = date(2026, 9, 1)
+
+
+def record(employee, day):
+    return WorkingTimeRecord(company_id=employee.company_id, employee_id=employee.id, work_date=date(2026, 9, day),
+                             start_time=time(9), end_time=time(18))
+
+
+def test_record_count_is_invalidated_on_commit(db, make_company, make_employee):
+    employee = make_employee(make_company())
+    assert company_records_count(employee.company_id, MONTH_START) == 0
+
+    db.session.add(record(employee, 1))
+    db.session.flush()
+    # コミット前は他のリクエストに未確定の件数を見せない
+    assert company_records_count(employee.company_id, MONTH_START) == 0
+    db.session.commit()
+    assert company_records_count(employee.company_id, MONTH_START) == 1
+
+
+def test_rollback_discards_and_savepoint_rollback_keeps_invalidation(db, make_company, make_employee):
+    employee = make_employee(make_company())
+    db.session.add(record(employee, 1))
+    db.session.commit()
+    assert company_records_count(employee.company_id, MONTH_START) == 1
+
+    db.session.add(record(employee, 2))
+    db.session.flush()
+    db.session.rollback()
+    assert ('company', employee.company_id, 'records', MONTH_START.isoformat()) in dict(counter_cache.items())
+
+    db.session.add(record(employee, 2))
+    db.session.flush()
+    savepoint = db.session.begin_nested()
+    db.session.add(record(employee, 3))
+    db.session.flush()
+    savepoint.rollback()
+    db.session.commit()
+    assert company_records_count(employee.company_id, MONTH_START) == 2
+
+
+def test_global_employee_count_follows_status_change(db, make_company, make_employee):
+    employee = make_employee(make_company())
+    before = global_counts()['total_employees']
+    db.session.get(Employee, employee.id).status = '退職'
+    db.session.commit()
+    assert global_counts()['total_employees'] == before - 1
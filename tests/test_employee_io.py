@@ -0,0 +1,53 @@
+"""従業員の一括取込・書き出し: 書き出したファイルの再取込と、エラー・上限超過時の中止"""
+import io
+
+import pytest
+from sqlalchemy import func, select
+
+from employee_io import EMPLOYEE_COLUMNS, EmployeeImportError, export_csv, export_xlsx, import_employees
+from models import Employee
+
+FIELDS = [field for field, _, _ in EMPLOYEE_COLUMNS]
+
+
+def employees(db, company_id):
+    return db.session.execute(
+        select(*[getattr(Employee, field) for field in FIELDS])
+        .where(Employee.company_id == company_id).order_by(Employee.employee_id)
+    ).all()
+
+
+def count(db, company_id):
+    return db.session.execute(select(func.count()).where(Employee.company_id == company_id)).scalar()
+
+
+@pytest.mark.parametrize('export, filename', [(export_csv, 'employees.csv'), (export_xlsx, 'employees.xlsx')])
+def test_exported_file_imports_into_another_company(db, make_company, make_employee, export, filename):
+    source, target = make_company(), make_company()
+    make_employee(source, department='営業', email='a@example.com')
+    make_employee(source, status='退職', base_wage=250000)
+
+    assert import_employees(target.id, io.BytesIO(b''.join(export(source.id))), filename) == 2
+    assert employees(db, target.id) == employees(db, source.id)
+
+
+def test_any_invalid_row_aborts_the_whole_file(db, make_company, make_employee):
+    company = make_company()
+    existing = make_employee(company)
+    csv = f'社員番号,氏名,入社日\nN001,新規 一郎,2026-04-01\n{existing.employee_id},重複 次郎,2026-04-01\nN002,,2026-04-01\nN003,日付 三郎,4月1日\n'
+
+    with pytest.raises(EmployeeImportError) as raised:
+        import_employees(company.id, io.BytesIO(csv.encode()), 'employees.csv')
+    assert [line for line, _ in raised.value.errors] == [3, 4, 5]
+    assert count(db, company.id) == 1
+
+
+def test_capacity_counts_only_active_rows(db, make_company, make_employee):
+    company = make_company(max_employees=2)
+    make_employee(company)
+    csv = '氏名,ステータス\n在籍 一郎,在籍中\n退職 次郎,退職\n'
+    assert import_employees(company.id, io.BytesIO(csv.encode()), 'employees.csv') == 2
+
+    with pytest.raises(EmployeeImportError):
+        import_employees(company.id, io.BytesIO('氏名\n超過 三郎\n'.encode()), 'employees.csv')
+    assert count(db, company.id) == 3
@@ -0,0 +1,31 @@
+"""従業員一覧: キーセットのページングと絞り込み"""
+from employee_list import decode_cursor, employee_page
+
+
+def test_pages_cover_every_employee_once_in_code_order(db, make_company, make_employee):
+    company = make_company()
+    codes = ['B002', 'A001', None, 'B002-2', 'C003']
+    for code in codes:
+        make_employee(company, employee_id=code)
+    make_employee(make_company())  # 他社の従業員は含まない
+
+    seen, cursor = [], None
+    while True:
+        rows, cursor = employee_page(company.id, cursor=cursor, limit=2)
+        seen.extend(row.employee_id for row in rows)
+        if cursor is None:
+            break
+    assert seen == [None, 'A001', 'B002', 'B002-2', 'C003']
+
+
+def test_filters_and_invalid_cursor(db, make_company, make_employee):
+    company = make_company()
+    make_employee(company, department='営業')
+    sales = make_employee(company, department='営業', status='退職')
+    make_employee(company, department='開発')
+
+    rows, cursor = employee_page(company.id, filters={'department': '営業', 'status': '退職', 'name': 'x'},
+                                 cursor='not-a-cursor')
+    assert [row.id for row in rows] == [sales.id]
+    assert cursor is None
+    assert decode_cursor('not-a-cursor') is None
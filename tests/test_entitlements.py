@@ -0,0 +1,40 @@
+"""契約内容のスナップショットと従業員数の上限チェック"""
+import pytest
+from sqlalchemy import select
+
+from entitlements import CapacityExceeded, check_capacity, entitlement_cache, get_entitlement
+from models import Contract, Plan
+
+
+def test_capacity_uses_plan_limit_read_under_lock(db, make_company, make_employee):
+    company = make_company(max_employees=2)
+    make_employee(company)
+    make_employee(company)
+    assert get_entitlement(company.id).max_employees == 2
+    with pytest.raises(CapacityExceeded):
+        check_capacity(company.id)
+    db.session.rollback()
+
+    # 他のプロセスでプランの上限が上がり、このプロセスのスナップショットがまだ古い場合
+    plan = db.session.execute(select(Plan).join(Contract, Contract.plan_id == Plan.id)
+                              .where(Contract.company_id == company.id)).scalar_one()
+    plan.max_employees = 3
+    db.session.commit()
+    entitlement_cache.set(company.id, get_entitlement(company.id)._replace(max_employees=2))
+
+    assert check_capacity(company.id).max_employees == 3
+    db.session.rollback()
+
+
+def test_already_inserted_rows_are_counted_once(db, make_company, make_employee):
+    company = make_company(max_employees=2)
+    for _ in range(2):
+        make_employee(company)
+    # 同じトランザクションで登録済みの2名を含めて2名なので、上限内
+    assert check_capacity(company.id, adding=2, already_inserted=True).headcount == 2
+    db.session.rollback()
+
+    make_employee(company)
+    with pytest.raises(CapacityExceeded):
+        check_capacity(company.id, adding=1, already_inserted=True)
+    db.session.rollback()
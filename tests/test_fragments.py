@@ -0,0 +1,31 @@
+"""描画済みページ断片のキャッシュ: データのバージョンと条件付きGET"""
+from fragments import employee_scope, versions
+from models import Employee
+
+
+def test_version_advances_on_commit_and_not_on_rollback(db, make_company, make_employee):
+    company = make_company()
+    scope = employee_scope(company.id)
+    before = versions([scope])[scope][0]
+
+    employee = make_employee(company)
+    assert versions([scope])[scope][0] == before + 1
+
+    db.session.get(Employee, employee.id).name = '変更 花子'
+    db.session.flush()
+    db.session.rollback()
+    assert versions([scope])[scope][0] == before + 1
+
+
+def test_conditional_get_until_employees_change(db, make_company, make_employee, admin_client):
+    company = make_company()
+    client, _ = admin_client(company)
+
+    first = client.get('/employees')
+    assert first.status_code == 200 and first.headers['ETag']
+    assert client.get('/employees', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    make_employee(company)
+    changed = client.get('/employees', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != first.headers['ETag']
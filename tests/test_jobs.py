@@ -0,0 +1,88 @@
+"""バックグラウンドジョブ: 取得（1件を1か所で実行）・中止・再登録・一時的な失敗の再試行"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import jobs
+from models import Job
+
+
+@jobs.handler('test_progress', 'テスト（進捗）')
+def progress_job(context):
+    context.progress(1, 2)
+    return {'done': True}
+
+
+@jobs.handler('test_locked', 'テスト（ロック）')
+def locked_job(context):
+    raise OperationalError('UPDATE job', {}, Exception('database is locked'))
+
+
+@pytest.fixture(autouse=True)
+def finish_pending_jobs(db):
+    """他のテストの待機中ジョブを取得しないよう、前のテストのジョブは終わらせておく"""
+    db.session.query(Job).filter(Job.status.in_([jobs.QUEUED, jobs.RUNNING])).update(
+        {'status': jobs.CANCELLED}, synchronize_session=False)
+    db.session.commit()
+
+
+def reload(db, job):
+    db.session.expire_all()
+    return db.session.get(Job, job.id)
+
+
+def test_each_job_is_claimed_once(app, db, make_company):
+    company = make_company()
+    first, second = jobs.enqueue('test_progress', company.id), jobs.enqueue('test_progress', company.id)
+
+    assert jobs.claim_next('a') == first.id
+    assert jobs.claim_next('b') == second.id
+    assert jobs.claim_next('c') is None
+    first = reload(db, first)
+    assert (first.status, first.worker, first.attempts) == (jobs.RUNNING, 'a', 1)
+
+
+def test_cancel_queued_then_retry(app, db, make_company):
+    job = jobs.enqueue('test_progress', make_company().id)
+
+    assert jobs.cancel(job)
+    assert job.status == jobs.CANCELLED
+    assert jobs.claim_next('a') is None
+    assert not jobs.cancel(job)
+
+    assert jobs.retry(job)
+    assert job.status == jobs.QUEUED
+    assert jobs.claim_next('a') == job.id
+    jobs.run_job(app, job.id)
+    job = reload(db, job)
+    assert (job.status, job.progress_current, jobs.to_dict(job)['result']) == (jobs.SUCCEEDED, 1, {'done': True})
+    assert not jobs.retry(job)
+
+
+def test_cancel_running_stops_at_next_progress(app, db, make_company):
+    job = jobs.enqueue('test_progress', make_company().id)
+    assert jobs.claim_next('a') == job.id
+
+    assert jobs.cancel(job)
+    assert job.cancel_requested
+    jobs.run_job(app, job.id)
+    assert reload(db, job).status == jobs.CANCELLED
+
+
+def test_database_error_is_retried_until_max_attempts(app, db, make_company):
+    job = jobs.enqueue('test_locked', make_company().id, max_attempts=2)
+
+    assert jobs.claim_next('a') == job.id
+    jobs.run_job(app, job.id)
+    job = reload(db, job)
+    assert (job.status, job.error) == (jobs.QUEUED, 'database is locked')
+    assert job.run_after > datetime.utcnow()
+    assert jobs.claim_next('a') is None  # 再試行は RETRY_DELAY_SECONDS 後
+
+    job.run_after = datetime.utcnow()
+    db.session.commit()
+    assert jobs.claim_next('a') == job.id
+    jobs.run_job(app, job.id)
+    job = reload(db, job)
+    assert (job.status, job.attempts) == (jobs.FAILED, 2)
@@ -0,0 +1,128 @@
+"""有給休暇台帳: 古い付与からの割当と、勤怠の変更ごとの割当が作り直し（rebuild_allocations）と一致するか"""
+from datetime import date
+
+from sqlalchemy import select
+
+from leave import rebuild_allocations
+from models import LeaveBalance, LeaveConsumption, LeaveCredit, WorkingTimeRecord
+
+
+def ledger(db, employee_id):
+    consumption = sorted(db.session.execute(
+        select(LeaveConsumption.record_id, LeaveConsumption.credit_id, LeaveConsumption.days)
+        .where(LeaveConsumption.employee_id == employee_id)
+    ).all(), key=repr)
+    credits = db.session.execute(
+        select(LeaveCredit.id, LeaveCredit.days_used, LeaveCredit.days_remaining)
+        .where(LeaveCredit.employee_id == employee_id).order_by(LeaveCredit.id)
+    ).all()
+    balance = db.session.execute(
+        select(LeaveBalance.days_remaining, LeaveBalance.days_unallocated)
+        .where(LeaveBalance.employee_id == employee_id)
+    ).one()
+    return consumption, credits, balance
+
+
+def assert_matches_rebuild(db, employee_id):
+    incremental = ledger(db, employee_id)
+    rebuild_allocations(db.session.connection(), [employee_id])
+    assert ledger(db, employee_id) == incremental
+    return incremental
+
+
+def paid_leave(employee, work_date, leave_days=1.0):
+    return WorkingTimeRecord(company_id=employee.company_id, employee_id=employee.id, work_date=work_date,
+                             is_paid_leave=True, leave_days=leave_days)
+
+
+def grant(employee, grant_date, days, expiry_date=None):
+    return LeaveCredit(company_id=employee.company_id, employee_id=employee.id, grant_date=grant_date,
+                       days_granted=days, expiry_date=expiry_date)
+
+
+def test_leave_uses_oldest_valid_grant_first(db, make_company, make_employee):
+    employee = make_employee(make_company())
+    old, new = grant(employee, date(2025, 4, 1), 2, expiry_date=date(2026, 4, 1)), grant(employee, date(2026, 1, 1), 2)
+    db.session.add_all([new, old])
+    db.session.commit()
+
+    records = [paid_leave(employee, work_date) for work_date in
+               (date(2026, 1, 5), date(2026, 4, 1), date(2026, 5, 1), date(2026, 6, 1))]
+    db.session.add_all(records)
+    db.session.commit()
+
+    consumption, _, (days_remaining, days_unallocated) = assert_matches_rebuild(db, employee.id)
+    # 期限前は古い付与から、期限当日以降は新しい付与から使い、足りない分は未割当になる
+    assert sorted((record_id, credit_id) for record_id, credit_id, _ in consumption) == [
+        (records[0].id, old.id), (records[1].id, new.id), (records[2].id, new.id), (records[3].id, None),
+    ]
+    assert (days_remaining, days_unallocated) == (0, 1)
+
+
+def test_back_dated_leave_is_allocated_in_date_order(db, make_company, make_employee):
+    employee = make_employee(make_company())
+    db.session.add_all([grant(employee, date(2026, 1, 1), 1), grant(employee, date(2026, 5, 1), 1)])
+    db.session.commit()
+
+    # 後の日付の取得を先に登録すると、古い付与を先に使ってしまい前の日付の取得が不足になっていた
+    db.session.add(paid_leave(employee, date(2026, 6, 1)))
+    db.session.commit()
+    db.session.add(paid_leave(employee, date(2026, 2, 1)))
+    db.session.commit()
+
+    _, _, (days_remaining, days_unallocated) = assert_matches_rebuild(db, employee.id)
+    assert (days_remaining, days_unallocated) == (0, 0)
+
+
+def test_moving_and_deleting_leave_matches_rebuild(db, make_company, make_employee):
+    employee = make_employee(make_company())
+    db.session.add_all([
+        grant(employee, date(2026, 1, 1), 2, expiry_date=date(2026, 4, 1)),
+        grant(employee, date(2026, 3, 1), 2),
+    ])
+    db.session.commit()
+    records = [paid_leave(employee, date(2026, month, 10)) for month in (2, 3, 5)]
+    db.session.add_all(records)
+    db.session.commit()
+
+    records[2].work_date = date(2026, 1, 20)
+    db.session.commit()
+    assert_matches_rebuild(db, employee.id)
+
+    records[1].leave_days = 0.5
+    db.session.commit()
+    assert_matches_rebuild(db, employee.id)
+
+    db.session.delete(records[2])
+    db.session.commit()
+    assert_matches_rebuild(db, employee.id)
+
+
+def test_moving_leave_between_employees_matches_rebuild(db, make_company, make_employee):
+    company = make_company()
+    first, second = make_employee(company), make_employee(company)
+    db.session.add_all([grant(first, date(2026, 1, 1), 1), grant(second, date(2026, 1, 1), 1)])
+    db.session.commit()
+    early, late = paid_leave(first, date(2026, 2, 1)), paid_leave(second, date(2026, 3, 1))
+    db.session.add_all([late, early])
+    db.session.commit()
+
+    early.employee_id = second.id
+    db.session.commit()
+    assert_matches_rebuild(db, first.id)
+    assert_matches_rebuild(db, second.id)
+
+
+def test_leave_without_day_count_is_one_day_in_rollup_and_ledger(db, make_company, make_employee):
+    from attendance_rollup import monthly_totals, verify
+
+    employee = make_employee(make_company())
+    db.session.add(grant(employee, date(2026, 1, 1), 10))
+    db.session.add_all([paid_leave(employee, date(2026, 2, 2), None), paid_leave(employee, date(2026, 2, 3), 0)])
+    db.session.commit()
+
+    consumption, _, (days_remaining, _) = ledger(db, employee.id)
+    assert sum(days for _, _, days in consumption) == 2
+    assert days_remaining == 8
+    assert monthly_totals(employee.company_id, 2026, 2)[employee.id]['paid_leave_days'] == 2
+    assert verify(db.session.connection(), employee.company_id) == []
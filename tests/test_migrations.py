@@ -0,0 +1,46 @@
+"""スキーママイグレーション: マイグレーション導入前のDBからの更新"""
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, func, inspect, insert, select, text
+
+from migrations import MIGRATIONS, initial_schema, upgrade
+from models import db
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "legacy.db"}')
+    yield engine
+    engine.dispose()
+
+
+def test_fresh_database_gets_every_table(app, engine):
+    with app.app_context():
+        assert upgrade(engine) == [(version, description) for version, description, _ in MIGRATIONS]
+    assert set(db.metadata.tables) <= set(inspect(engine).get_table_names())
+
+
+def test_duplicate_payroll_rows_are_removed_before_unique_index(app, engine):
+    tables = db.metadata.tables
+    payroll = tables['payroll_calculation']
+    with engine.begin() as connection:
+        # マイグレーション導入前のDB（一意インデックスがなく、同じ年月の計算結果が重複している）
+        initial_schema(connection)
+        connection.execute(text('DROP INDEX uq_payroll_employee_month'))
+        connection.execute(insert(tables['company']).values(id=1, company_code='OLD', company_name='旧 株式会社'))
+        connection.execute(insert(tables['employee']).values(id=1, company_id=1, name='旧 社員',
+                                                             join_date=date(2020, 4, 1)))
+        connection.execute(insert(payroll), [
+            {'id': row_id, 'company_id': 1, 'employee_id': 1, 'year': 2026, 'month': month, 'net_salary': net}
+            for row_id, month, net in ((1, 8, 100), (2, 8, 200), (3, 9, 300))
+        ])
+
+    with app.app_context():
+        upgrade(engine)
+    with engine.connect() as connection:
+        assert connection.execute(select(payroll.c.id, payroll.c.net_salary).order_by(payroll.c.id)).all() == [
+            (2, 200), (3, 300),
+        ]
+        assert 'uq_payroll_employee_month' in {index['name'] for index in inspect(connection).get_indexes(payroll.name)}
+        assert connection.execute(select(func.count()).select_from(text('schema_version'))).scalar() == len(MIGRATIONS)
@@ -0,0 +1,69 @@
+"""パスワードのハッシュ計算とログイン試行の制限"""
+import threading
+
+import pytest
+
+import passwords
+from passwords import HashExecutor, PasswordHashBusy, SlidingWindowLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(passwords.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_limiter_blocks_until_oldest_hit_leaves_window(clock):
+    limiter = SlidingWindowLimiter(limit=2, window=60)
+    limiter.hit('a')
+    clock[0] += 10
+    limiter.hit('a')
+    assert limiter.retry_after('a') == 51
+    assert limiter.retry_after('b') == 0
+
+    clock[0] += 50
+    assert limiter.retry_after('a') == 0
+    limiter.hit('a')
+    limiter.reset('a')
+    assert limiter.retry_after('a') == 0
+
+
+def test_limiter_evicts_least_recent_keys(clock):
+    limiter = SlidingWindowLimiter(limit=1, window=60, maxsize=2)
+    for key in ('a', 'b', 'c'):
+        limiter.hit(key)
+    assert [limiter.retry_after(key) > 0 for key in ('a', 'b', 'c')] == [False, True, True]
+
+
+def test_executor_rejects_when_queue_is_full():
+    executor = HashExecutor(workers=1, queue_size=0)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'done'
+
+    thread = threading.Thread(target=executor.run, args=(slow,))
+    thread.start()
+    started.wait(5)
+    try:
+        with pytest.raises(PasswordHashBusy):
+            executor.run(lambda: None)
+    finally:
+        release.set()
+        thread.join()
+    assert executor.run(lambda: 'ok') == 'ok'
+
+
+def test_verify_and_rehash_follow_configured_method(monkeypatch):
+    monkeypatch.setenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    password_hash = passwords.hash_password('secret')
+    assert passwords.verify_password(password_hash, 'secret')
+    assert not passwords.verify_password(password_hash, 'wrong')
+    assert not passwords.verify_password(None, 'secret')  # 該当ユーザーなしでもダミーと照合する
+    assert not passwords.needs_rehash(password_hash)
+
+    monkeypatch.setenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:2000')
+    assert passwords.needs_rehash(password_hash)
@@ -0,0 +1,48 @@
+"""給与計算: 源泉所得税（累進税率）と日給の出勤日数"""
+from datetime import date, time
+
+import pytest
+from sqlalchemy import select
+
+from models import PayrollCalculation, WorkingTimeRecord
+from payroll import BASIC_DEDUCTION, INCOME_TAX_BRACKETS, RECONSTRUCTION_TAX_RATE, income_tax, run_company_payroll
+
+
+def test_no_tax_below_basic_deduction():
+    assert income_tax(0) == 0
+    assert income_tax(BASIC_DEDUCTION / 12) == 0
+
+
+@pytest.mark.parametrize('lower, upper', list(zip(INCOME_TAX_BRACKETS, INCOME_TAX_BRACKETS[1:])))
+def test_brackets_are_continuous_at_limits(lower, upper):
+    limit, rate, deduction = lower
+    _, next_rate, next_deduction = upper
+    assert limit * rate - deduction == pytest.approx(limit * next_rate - next_deduction)
+
+
+def test_tax_uses_bracket_of_annualized_income():
+    # 年換算 3,000,000円（課税所得 2,520,000円）は 10% の区分
+    expected = round((2520000 * 0.10 - 97500) * RECONSTRUCTION_TAX_RATE / 12)
+    assert income_tax(250000) == expected
+
+
+def test_tax_increases_with_income():
+    amounts = [income_tax(monthly) for monthly in range(100000, 5000001, 50000)]
+    assert amounts == sorted(amounts)
+
+
+def test_daily_wage_paid_once_for_split_shift(db, make_company, make_employee):
+    company = make_company()
+    employee = make_employee(company, wage_type='daily', base_wage=10000)
+    db.session.add_all([
+        WorkingTimeRecord(company_id=company.id, employee_id=employee.id, work_date=date(2026, 9, 1),
+                          start_time=start, end_time=end, break_minutes=0, regular_hours=3.0)
+        for start, end in ((time(9), time(12)), (time(17), time(20)))
+    ])
+    db.session.commit()
+
+    run_company_payroll(company.id, 2026, 9)
+    payroll = db.session.execute(select(PayrollCalculation).where(
+        PayrollCalculation.employee_id == employee.id)).scalar_one()
+    assert payroll.total_working_days == 1
+    assert payroll.base_salary == 10000
@@ -0,0 +1,66 @@
+"""月次締め: 企業の振り分けと、1社の失敗が他社の締めを止めないこと"""
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+import payroll_close
+from models import Contract, PayrollCalculation
+from payroll_close import TENANT_OVERHEAD, close_month, close_targets, partition
+
+
+def target(company_id, weight):
+    return {'company_id': company_id, 'company_code': f'C{company_id}', 'employees': 0, 'weight': weight}
+
+
+def test_partition_balances_groups_by_weight():
+    groups = partition([target(5, 4), target(1, 10), target(3, 6), target(2, 7), target(4, 5)], 2)
+    # 重い企業から順に、合計が小さいほうのグループへ入れる
+    assert [[item['weight'] for item in group] for group in groups] == [[10, 5], [7, 6, 4]]
+    assert partition([target(1, 10)], 4) == [[target(1, 10)]]
+    assert partition([], 4) == []
+
+
+def test_targets_weight_by_active_headcount_and_need_a_contract(db, make_company, make_employee):
+    company, small_plan, uncontracted = make_company(), make_company(max_employees=1), make_company()
+    for owner in (company, company, small_plan, small_plan):
+        make_employee(owner)
+    make_employee(company, status='退職')
+    contract = db.session.execute(select(Contract).where(Contract.company_id == uncontracted.id)).scalar_one()
+    contract.start_date = date.today() + timedelta(days=40)
+    db.session.commit()
+
+    today = date.today()
+    targets = close_targets(today.year, today.month, [company.id, small_plan.id, uncontracted.id])
+    assert [(item['company_id'], item['employees'], item['weight']) for item in targets] == [
+        (company.id, 2, 2 + TENANT_OVERHEAD), (small_plan.id, 2, 1 + TENANT_OVERHEAD),
+    ]
+
+
+def test_failed_company_does_not_stop_others(db, make_company, make_employee, monkeypatch):
+    companies = [make_company() for _ in range(3)]
+    for company in companies:
+        make_employee(company)
+    locked, broken = companies[0].id, companies[1].id
+    close_company = payroll_close.close_company
+
+    def flaky(company_id, year, month):
+        if company_id == locked:
+            raise OperationalError('UPDATE', {}, Exception('database is locked'))
+        if company_id == broken:
+            raise ValueError('壊れたデータ')
+        return close_company(company_id, year, month)
+
+    monkeypatch.setattr(payroll_close, 'close_company', flaky)
+    monkeypatch.setattr(payroll_close.time, 'sleep', lambda seconds: None)
+    today = date.today()
+    result = close_month(today.year, today.month, workers=1, company_ids=[company.id for company in companies])
+
+    outcomes = {item['company_id']: (item['attempts'], item['error']) for item in result['results']}
+    assert outcomes[locked] == (payroll_close.MAX_ATTEMPTS, 'database is locked')
+    assert outcomes[broken] == (1, 'ValueError: 壊れたデータ')
+    assert outcomes[companies[2].id] == (1, None)
+    assert result['failed'] == 2
+    assert db.session.execute(select(func.count()).where(
+        PayrollCalculation.company_id == companies[2].id)).scalar() == 1
@@ -0,0 +1,28 @@
+"""給与明細の一括出力: ZIP 内のファイル名とシート名"""
+import io
+import zipfile
+
+from openpyxl import load_workbook
+
+from payroll import run_company_payroll
+from payslip import payslips_workbook, payslips_zip
+
+
+def test_zip_member_names_are_safe_and_unique(db, make_company, make_employee):
+    company = make_company()
+    employees = [make_employee(company, employee_id=code, name='山田 太郎') for code in ('../A/B', 'A:B', 'A*B')]
+    run_company_payroll(company.id, 2026, 9)
+
+    names = zipfile.ZipFile(io.BytesIO(b''.join(payslips_zip(company.id, 2026, 9)))).namelist()
+    # パス区切り・使用できない文字を除くと同じ社員番号になるため、従業員IDで区別する
+    assert sorted(names) == sorted(f'payslip_202609_AB_{employee.id}.xlsx' for employee in employees)
+
+
+def test_workbook_sheet_titles_are_unique(db, make_company, make_employee):
+    company = make_company()
+    for code in ('A/B', 'AB'):
+        make_employee(company, employee_id=code, name='山田 太郎')
+    run_company_payroll(company.id, 2026, 9)
+
+    workbook = load_workbook(io.BytesIO(b''.join(payslips_workbook(company.id, 2026, 9))))
+    assert sorted(workbook.sheetnames) == ['AB 山田 太郎', 'AB 山田 太郎 (2)']
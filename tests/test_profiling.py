@@ -0,0 +1,34 @@
+"""SQL の計測: 失敗した SQL の開始時刻を残さないこと"""
+import pytest
+from flask import g
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+import profiling
+
+
+@pytest.fixture
+def sql_listeners():
+    listeners = [('before_cursor_execute', profiling._before_cursor_execute),
+                 ('after_cursor_execute', profiling._after_cursor_execute),
+                 ('handle_error', profiling._handle_error)]
+    for name, listener in listeners:
+        event.listen(Engine, name, listener)
+    yield
+    for name, listener in listeners:
+        event.remove(Engine, name, listener)
+
+
+def test_failed_statement_does_not_leave_start_time(app, db, sql_listeners):
+    with app.test_request_context():
+        g.profile = profiling.RequestProfile()
+        connection = db.session.connection()
+        with pytest.raises(OperationalError):
+            connection.execute(text('SELECT * FROM no_such_table'))
+        db.session.rollback()
+
+        connection = db.session.connection()
+        connection.execute(text('SELECT 1'))
+        assert connection.info.get('profiling_started') == []
+        assert g.profile.query_count == 1
@@ -0,0 +1,18 @@
+"""主要クエリが想定したインデックスを使っているか（flask check-indexes と同じ判定）"""
+import pytest
+
+from query_plans import HOT_QUERIES
+
+
+@pytest.fixture(scope='module')
+def plans(app):
+    from query_plans import check_query_plans
+
+    with app.app_context():
+        return {name: (index_name, used, plan) for name, index_name, used, plan in check_query_plans()}
+
+
+@pytest.mark.parametrize('name', [name for name, _, _ in HOT_QUERIES])
+def test_hot_query_uses_index(plans, name):
+    index_name, used, plan = plans[name]
+    assert used, f'{name} が {index_name} を使っていません:\n{plan}'
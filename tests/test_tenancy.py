@@ -0,0 +1,38 @@
+"""企業管理者のリクエストでの企業単位の行スコープ（tenancy.py）"""
+from sqlalchemy import func, select, update
+
+from models import Employee
+
+
+def test_queries_are_scoped_to_tenant(app, db, make_company, make_employee):
+    from tenancy import set_tenant
+
+    own, other = make_company(), make_company()
+    own_id, mine_id = own.id, make_employee(own).id
+    theirs_id = make_employee(other).id
+    db.session.expunge_all()
+
+    with app.test_request_context():
+        set_tenant(own_id)
+        assert {employee.id for employee in Employee.query} == {mine_id}
+        assert db.session.get(Employee, theirs_id) is None
+        assert db.session.execute(select(func.count(Employee.id))).scalar() == 1
+        assert db.session.execute(update(Employee).values(name='更新')).rowcount == 1
+        assert Employee.query.execution_options(all_tenants=True).filter_by(id=theirs_id).one()
+        db.session.rollback()
+
+
+def test_other_tenant_ids_return_404(app, db, make_company, make_employee):
+    from models import User
+    from passwords import hash_password
+
+    own, other = make_company(), make_company()
+    theirs = make_employee(other)
+    db.session.add(User(email=f'admin-{own.company_code}@example.com', password=hash_password('password'),
+                        role='company_admin', company_id=own.id))
+    db.session.commit()
+
+    client = app.test_client()
+    client.post('/login', data={'email': f'admin-{own.company_code}@example.com', 'password': 'password'})
+    assert client.get('/company/dashboard').status_code == 200
+    assert client.get(f'/employee/{theirs.id}/edit').status_code == 404
@@ -0,0 +1,74 @@
+"""労働時間区分（worktime.classify）"""
+from datetime import date, time, timedelta
+from types import SimpleNamespace
+
+from worktime import BUCKETS, classify
+
+MONDAY = date(2026, 10, 5)
+
+
+def record(work_date, start, end, break_minutes=60, is_absent=False):
+    return SimpleNamespace(work_date=work_date, start_time=start, end_time=end,
+                           break_minutes=break_minutes, is_absent=is_absent)
+
+
+def buckets(records, **kwargs):
+    return [result for _, result in classify(records, **kwargs)]
+
+
+def expected(**values):
+    return {key: values.get(key, 0.0) for key in BUCKETS}
+
+
+def test_regular_day():
+    assert buckets([record(MONDAY, time(9), time(18))]) == [expected(regular_hours=8.0)]
+
+
+def test_daily_overtime_beyond_eight_hours():
+    assert buckets([record(MONDAY, time(9), time(20))]) == [expected(regular_hours=8.0, overtime_out_legal=2.0)]
+
+
+def test_overtime_within_legal_hours_for_short_schedule():
+    result = buckets([record(MONDAY, time(9), time(18))], standard_working_hours=7.0)
+    assert result == [expected(regular_hours=7.0, overtime_in_legal=1.0)]
+
+
+def test_late_night_hours():
+    result = buckets([record(MONDAY, time(13), time(23, 30), break_minutes=30)])
+    assert result == [expected(regular_hours=8.0, overtime_out_legal=2.0, late_night_hours=1.5)]
+
+
+def test_shift_crossing_midnight_counts_on_start_date():
+    result = buckets([record(MONDAY, time(20), time(5), break_minutes=0)])
+    assert result == [expected(regular_hours=8.0, overtime_out_legal=1.0, late_night_hours=7.0)]
+
+
+def test_legal_holiday_on_sunday():
+    sunday = MONDAY - timedelta(days=1)
+    assert buckets([record(sunday, time(9), time(18))]) == [expected(legal_holiday_hours=8.0)]
+
+
+def test_weekly_forty_hours_moves_saturday_to_overtime():
+    week = [record(MONDAY + timedelta(days=offset), time(9), time(18)) for offset in range(6)]
+    result = buckets(week)
+    assert result[:5] == [expected(regular_hours=8.0)] * 5
+    assert result[5] == expected(overtime_out_legal=8.0)
+
+
+def test_weekly_limit_resets_on_sunday():
+    week = [record(MONDAY + timedelta(days=offset), time(9), time(18)) for offset in range(5)]
+    next_monday = record(MONDAY + timedelta(days=7), time(9), time(18))
+    assert buckets(week + [next_monday])[5] == expected(regular_hours=8.0)
+
+
+def test_second_shift_on_same_day_continues_the_day():
+    result = buckets([
+        record(MONDAY, time(9), time(14), break_minutes=0),
+        record(MONDAY, time(15), time(20), break_minutes=0),
+    ])
+    assert result == [expected(regular_hours=5.0), expected(regular_hours=3.0, overtime_out_legal=2.0)]
+
+
+def test_absent_and_incomplete_records_are_zero():
+    result = buckets([record(MONDAY, time(9), time(18), is_absent=True), record(MONDAY, None, None)])
+    assert result == [expected(), expected()]
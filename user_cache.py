@@ -0,0 +1,63 @@
+"""ログインユーザー情報のキャッシュ
+
+Flask-Login の user_loader がリクエストごとに User を取得しないよう、
+認可に必要な項目（ID・ロール・所属企業・有効フラグ）のスナップショットを短時間キャッシュする。
+User の更新・削除時はコミット後に該当ユーザーを無効化する。
+"""
+import os
+from flask_login import UserMixin
+from sqlalchemy import event, select
+from cache import TTLCache, invalidate_after_commit
+from models import db, Company, User
+
+user_cache = TTLCache(
+    maxsize=int(os.environ.get('USER_CACHE_SIZE', 10000)),
+    ttl=int(os.environ.get('USER_CACHE_TTL', 60)),
+)
+
+
+class SessionUser(UserMixin):
+    """DBセッションに紐付かないログインユーザー"""
+
+    def __init__(self, id, email, name, role, company_id, is_active):
+        self.id = id
+        self.email = email
+        self.name = name
+        self.role = role
+        self.company_id = company_id
+        self._is_active = is_active
+
+    @property
+    def is_active(self):
+        return bool(self._is_active)
+
+    @property
+    def company(self):
+        """所属企業（必要になった時点で取得する）"""
+        return db.session.get(Company, self.company_id) if self.company_id else None
+
+
+def _fetch(user_id):
+    row = db.session.execute(
+        select(User.id, User.email, User.name, User.role, User.company_id, User.is_active).where(User.id == user_id)
+    ).first()
+    return SessionUser(*row) if row else None
+
+
+def load_session_user(user_id):
+    """キャッシュ経由でログインユーザーを返す（存在しなければ None）"""
+    user = user_cache.get(user_id)
+    if user is None:
+        user = _fetch(user_id)
+        if user is not None:
+            user_cache.set(user_id, user)
+    return user
+
+
+def _on_user_change(mapper, connection, target):
+    user_id = target.id
+    invalidate_after_commit(target, user_cache, lambda key: key == user_id)
+
+
+event.listen(User, 'after_update', _on_user_change)
+event.listen(User, 'after_delete', _on_user_change)
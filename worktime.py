@@ -0,0 +1,181 @@
+"""労働時間区分エンジン
+
+WorkingTimeRecord の出退勤時刻・休憩時間から、法定内労働・法定内残業・法定外残業・
+法定休日・法定外休日・深夜労働の各時間を算出する。
+週40時間の判定は日曜始まりの週単位、日をまたぐ勤務は始業日の労働として扱う。
+"""
+from datetime import time as dtime, timedelta
+from itertools import groupby
+from sqlalchemy import select, update
+from attendance_rollup import apply_deltas
+from models import db, Employee, WorkingTimeRecord
+from payroll import month_range
+
+LEGAL_DAILY_HOURS = 8.0  # 1日の法定労働時間
+LEGAL_WEEKLY_HOURS = 40.0  # 1週の法定労働時間
+LEGAL_HOLIDAY_WEEKDAY = 6  # 法定休日（日曜）
+
+# 深夜労働の時間帯（22:00〜翌5:00）を分単位で表す。日またぎ勤務に備えて3日分
+LATE_NIGHT_WINDOWS = [(day * 1440 - 120, day * 1440 + 300) for day in range(3)]
+
+BUCKETS = (
+    'regular_hours', 'overtime_in_legal', 'overtime_out_legal',
+    'legal_holiday_hours', 'non_legal_holiday_hours', 'late_night_hours',
+)
+
+
+def _overlap(start, end, lower, upper):
+    return max(0.0, min(end, upper) - max(start, lower))
+
+
+def shift_minutes(start_time, end_time):
+    """始業・終業時刻を始業日0時からの分に変換する（終業が始業以前なら翌日とみなす）"""
+    start = start_time.hour * 60 + start_time.minute
+    end = end_time.hour * 60 + end_time.minute
+    if end <= start:
+        end += 1440
+    return start, end
+
+
+def day_type(work_date, standard_working_days):
+    """'legal'（法定休日）/ 'non_legal'（所定休日）/ 'work'（所定労働日）"""
+    weekday = work_date.weekday()
+    if weekday == LEGAL_HOLIDAY_WEEKDAY:
+        return 'legal'
+    if weekday >= (standard_working_days or 5):
+        return 'non_legal'
+    return 'work'
+
+
+def week_start(day):
+    """日曜始まりの週の初日"""
+    return day - timedelta(days=(day.weekday() + 1) % 7)
+
+
+def classify(records, standard_working_hours=8.0, standard_working_days=5):
+    """1名分の勤怠（work_date 昇順）を区分し、(record, buckets) を順に返す
+
+    週の途中から始まる月でも正しく週40時間を判定できるよう、
+    呼び出し側は週の初日からの記録を渡すこと。
+    """
+    scheduled = min(standard_working_hours or 8.0, LEGAL_DAILY_HOURS)
+    current_week = current_day = None
+    weekly_hours = day_hours = 0.0
+
+    for record in records:
+        if week_start(record.work_date) != current_week:
+            current_week = week_start(record.work_date)
+            weekly_hours = 0.0
+        if record.work_date != current_day:
+            current_day = record.work_date
+            day_hours = 0.0
+
+        buckets = dict.fromkeys(BUCKETS, 0.0)
+        if record.is_absent or record.start_time is None or record.end_time is None:
+            yield record, buckets
+            continue
+
+        start, end = shift_minutes(record.start_time, record.end_time)
+        worked = max(0.0, (end - start - (record.break_minutes or 0)) / 60)
+        late_night = sum(_overlap(start, end, lower, upper) for lower, upper in LATE_NIGHT_WINDOWS) / 60
+        buckets['late_night_hours'] = min(late_night, worked)
+
+        # 同日の複数勤務は前の勤務の続きとして1日の時間を積み上げる
+        begin, finish = day_hours, day_hours + worked
+        day_hours = finish
+        kind = day_type(record.work_date, standard_working_days)
+
+        if kind == 'legal':
+            buckets['legal_holiday_hours'] = worked
+        else:
+            if kind == 'non_legal':
+                in_legal = {'non_legal_holiday_hours': _overlap(begin, finish, 0, LEGAL_DAILY_HOURS)}
+            else:
+                in_legal = {
+                    'regular_hours': _overlap(begin, finish, 0, scheduled),
+                    'overtime_in_legal': _overlap(begin, finish, scheduled, LEGAL_DAILY_HOURS),
+                }
+            buckets['overtime_out_legal'] = _overlap(begin, finish, LEGAL_DAILY_HOURS, float('inf'))
+
+            # 週40時間を超えた分は法定外残業へ振り替える（残業→所定の順に振替）
+            allowed = max(0.0, LEGAL_WEEKLY_HOURS - weekly_hours)
+            excess = max(0.0, sum(in_legal.values()) - allowed)
+            for key in ('overtime_in_legal', 'non_legal_holiday_hours', 'regular_hours'):
+                if excess <= 0:
+                    break
+                moved = min(in_legal.get(key, 0.0), excess)
+                if moved:
+                    in_legal[key] -= moved
+                    buckets['overtime_out_legal'] += moved
+                    excess -= moved
+            weekly_hours += sum(in_legal.values())
+            buckets.update(in_legal)
+
+        yield record, {key: round(value, 2) for key, value in buckets.items()}
+
+
+def recompute_company_month(company_id, year, month, employee_ids=None, commit=True):
+    """会社・月単位で労働時間区分を再計算し、結果が変わった行だけを更新する
+
+    employee_ids を指定した場合はその従業員のみを対象とする。
+    アーカイブ済みの月は確定済みとして再計算しない。月初を含む週の前月分がアーカイブ済みなら、
+    週40時間の判定にはアーカイブファイルの勤怠を使う。
+    """
+    from attendance_archive import archived_months, archived_records
+
+    start, end = month_range(year, month)
+    wtr = WorkingTimeRecord
+    archived = archived_months(company_id)
+    if (year, month) in archived:
+        return {'records': 0, 'updated': 0}
+    first_week = week_start(start)
+    previous = first_week if first_week < start and (first_week.year, first_week.month) in archived else None
+
+    employee_query = select(
+        Employee.id, Employee.standard_working_hours, Employee.standard_working_days
+    ).where(Employee.company_id == company_id)
+    record_query = select(
+        wtr.id, wtr.employee_id, wtr.work_date, wtr.start_time, wtr.end_time,
+        wtr.break_minutes, wtr.is_absent, *[getattr(wtr, key) for key in BUCKETS]
+    ).where(
+        wtr.company_id == company_id,
+        wtr.work_date >= (start if previous else first_week),
+        wtr.work_date < end,
+    ).order_by(wtr.employee_id, wtr.work_date, wtr.start_time, wtr.id)
+    if employee_ids is not None:
+        employee_query = employee_query.where(Employee.id.in_(employee_ids))
+        record_query = record_query.where(wtr.employee_id.in_(employee_ids))
+
+    standards = {row.id: row for row in db.session.execute(employee_query)}
+
+    rows = db.session.execute(record_query)
+    if previous:
+        earlier = [record for record in archived_records(company_id, previous, start)
+                   if employee_ids is None or record.employee_id in employee_ids]
+        rows = sorted([*earlier, *rows], key=lambda row: (
+            row.employee_id, row.work_date, row.start_time is not None, row.start_time or dtime.min, row.id))
+
+    total, changed = 0, []
+    deltas = {}
+    for employee_id, records in groupby(rows, key=lambda row: row.employee_id):
+        standard = standards.get(employee_id)
+        if standard is None:
+            continue
+        for record, buckets in classify(records, standard.standard_working_hours, standard.standard_working_days):
+            if record.work_date < start:
+                continue
+            total += 1
+            if any((getattr(record, key) or 0) != value for key, value in buckets.items()):
+                changed.append({'id': record.id, **buckets})
+                delta = deltas.setdefault((company_id, employee_id, year, month), {})
+                for key, value in buckets.items():
+                    delta[key] = delta.get(key, 0) + value - (getattr(record, key) or 0)
+
+    if changed:
+        # 一括UPDATEは ORM のイベントを経由しないため、月次勤怠集計へは差分をまとめて反映する
+        db.session.execute(update(WorkingTimeRecord), changed)
+        apply_deltas(db.session.connection(), deltas)
+    if commit:
+        db.session.commit()
+
+    return {'records': total, 'updated': len(changed)}